@@ -0,0 +1,70 @@
+"""
+quality and cost of top-k sentence graphs against the graph that connects every pair of sentences.
+For every top_k, the sentences ranked in the top N of the all pairs graph that are also in the top N of the top-k graph are reported,
+with the edges, peak memory and time of building and ranking each graph.
+A small top_k ranks differently from the full graph, e.g. on 1500 sentences top_k 10 kept 0% of the top 10 and top_k 50 kept 70%,
+so check the overlap at the top_k you mean to use before setting SENTENCE_TOP_K.
+
+Sentence vectors are drawn around a few topics, like the vectors of the sentences of a long transcript, or read from a .npy file
+with one vector per row, e.g. the stacked vectors of a parsed document.
+
+    python -m benchmarks.sentence_graph --sentences 5000 --top-k 5 10 20 50
+    python -m benchmarks.sentence_graph --vectors transcript.npy --search faiss
+"""
+
+import argparse
+import logging
+import time
+import tracemalloc
+
+import numpy as np
+
+from cloud_worker.textrank_module.pagerank import PageRank
+from cloud_worker.textrank_module.similarity import NEIGHBOUR_SEARCHES, similarity_graph_from_vectors
+
+logging.basicConfig(format='%(name)s-%(levelname)s|%(lineno)d:  %(message)s', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+def topic_vectors(sentences, dimensions=300, topics=20, seed=0):
+    """sentences around topic centres, with a shared component so that most similarities are positive like averaged word vectors"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(topics, dimensions)) + 1.5
+    return (centres[rng.integers(topics, size=sentences)] + rng.normal(scale=2.0, size=(sentences, dimensions))).astype(np.float32)
+
+
+def rank(vectors, top_k, search):
+    """the sentence ids ranked highest first, with the number of edges, peak memory in MB and seconds taken"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    graph = similarity_graph_from_vectors([str(i) for i in range(len(vectors))], vectors, top_k=top_k, search=search)
+    scores = PageRank.calculate__compact_graph(graph, converge_val=0.0001)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return np.argsort(-scores, kind='stable'), graph.num_edges, peak / 2**20, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='sentence graph quality benchmark')
+    parser.add_argument('--vectors', help='.npy file of sentence vectors, defaults to vectors drawn around topics')
+    parser.add_argument('--sentences', type=int, default=3000, help='number of sentences to draw when no vectors are given')
+    parser.add_argument('--top-k', type=int, nargs='+', default=[5, 10, 20, 50, 100], help='top_k of the graphs to compare')
+    parser.add_argument('--top-n', type=int, nargs='+', default=[10, 50], help='sizes of the summaries whose overlap is reported')
+    parser.add_argument('--search', default='blocked', choices=list(NEIGHBOUR_SEARCHES), help='how the top_k most similar sentences are found')
+    args = parser.parse_args()
+
+    vectors = np.load(args.vectors).astype(np.float32) if args.vectors else topic_vectors(args.sentences)
+    exact, edges, memory, seconds = rank(vectors, None, args.search)
+
+    print(f'{len(vectors)} sentences')
+    print(f'    {"graph":<12}{"edges":>12}{"peak MB":>10}{"seconds":>10}' + ''.join(f'{f"top {i} overlap":>16}' for i in args.top_n))
+    print(f'    {"all pairs":<12}{edges:>12}{memory:>10.1f}{seconds:>10.2f}' + ''.join(f'{1:>16.2f}' for _ in args.top_n))
+    for top_k in args.top_k:
+        ranked, edges, memory, seconds = rank(vectors, top_k, args.search)
+        overlaps = [len(set(exact[:n]) & set(ranked[:n])) / n for n in args.top_n]
+        print(f'    {f"top_k {top_k}":<12}{edges:>12}{memory:>10.1f}{seconds:>10.2f}' + ''.join(f'{i:>16.2f}' for i in overlaps))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Worker startup time - how long a fresh process takes to import the task processor and load the models of each capability.
+Every measurement runs in a new interpreter, so nothing is cached between runs apart from the operating system's file cache.
+
+    python -m benchmarks.startup --repeat 3
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+logging.basicConfig(format='%(name)s-%(levelname)s|%(lineno)d:  %(message)s', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+WORKER_ROOT = Path(__file__).parent.parent
+
+STAGES = {
+    'import task processor': 'import cloud_worker.services.task_processer',
+    'load text models':      'from cloud_worker.services.jobs import preload_text_models; preload_text_models()',
+    'load image models':     'from cloud_worker.services.jobs import preload_image_models; preload_image_models()',
+}
+
+# the stages a worker runs through before it is ready, by the task types it serves
+SCENARIOS = {
+    'text only':   ['import task processor', 'load text models'],
+    'images only': ['import task processor', 'load image models'],
+    'all tasks':   ['import task processor', 'load text models', 'load image models'],
+}
+
+
+def time_stages(stages):
+    """run the stages one after the other in a new interpreter, returns the seconds each one took"""
+    script = 'import json, time\ntimings = {}\n'
+    for stage in stages:
+        script += f'start = time.perf_counter()\n{STAGES[stage]}\ntimings[{stage!r}] = time.perf_counter() - start\n'
+    script += 'print(json.dumps(timings))\n'
+
+    completed = subprocess.run([sys.executable, '-c', script], cwd=WORKER_ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f'{stages} failed:\n{completed.stderr}')
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='Worker startup benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='number of fresh processes to time for every scenario')
+    parser.add_argument('--scenario', choices=list(SCENARIOS), action='append', help='scenarios to run, defaults to all of them')
+    args = parser.parse_args()
+
+    for scenario in args.scenario or SCENARIOS:
+        try:
+            runs = [time_stages(SCENARIOS[scenario]) for _ in range(args.repeat)]
+        except RuntimeError:
+            log.exception(f'unable to run the {scenario} scenario')
+            continue
+
+        print(f'{scenario} (median of {args.repeat})')
+        for stage in SCENARIOS[scenario]:
+            print(f'    {stage:<24}{statistics.median(i[stage] for i in runs):8.2f}s')
+        print(f'    {"total":<24}{statistics.median(sum(i.values()) for i in runs):8.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+spacy parsing throughput, in tokens per second, of the full pipeline against the pipelines TextRank runs for each task.
+The full pipeline parses one text at a time with every component, as every task did before the pipelines were trimmed.
+
+Also measures what the Ranking_State of an incrementally ranked document costs to send to and back from a process pool child,
+with and without its co-occurrence counts, against counting the co-occurrences again.
+
+    python -m benchmarks.throughput --documents 500 --batch-size 64
+    python -m benchmarks.throughput --corpus abstracts.txt --n-process 4
+"""
+
+import argparse
+import itertools
+import logging
+import pickle
+import time
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+import spacy
+
+from cloud_worker.textrank_module.incremental import Ranking_State, cooccurrence_pair_counts, update_pair_counts
+from cloud_worker.textrank_module.textrank import TASK_COMPONENTS, TextRank
+
+logging.basicConfig(format='%(name)s-%(levelname)s|%(lineno)d:  %(message)s', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+SAMPLE_TEXTS = [
+    "Compatibility of systems of linear constraints over the set of natural numbers. Criteria of compatibility of a system of linear "
+    "Diophantine equations, strict inequations, and nonstrict inequations are considered. Upper bounds for components of a minimal set "
+    "of solutions and algorithms of construction of minimal generating sets of solutions for all types of systems are given.",
+    "Stable feature selection via dense feature groups. Many feature selection algorithms have been proposed in the past focusing on "
+    "improving classification accuracy. In this work, we point out the importance of stable feature selection for knowledge discovery "
+    "from high-dimensional data, and identify two causes of instability of feature selection algorithms.",
+]
+
+
+def load_corpus(path, documents):
+    texts = [i for i in Path(path).read_text().splitlines() if i.strip()] if path else SAMPLE_TEXTS
+    return list(itertools.islice(itertools.cycle(texts), documents))
+
+
+def tokens_per_second(parse, texts):
+    start = time.perf_counter()
+    tokens = sum(len(i) for i in parse(texts))
+    return tokens / (time.perf_counter() - start)
+
+
+def seconds(f, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat): f()
+    return (time.perf_counter() - start) / repeat
+
+
+def state_transfer_costs(texts, tokens_in_document):
+    """pickling a keyword Ranking_State there and back, as the process executor does on every incremental job"""
+    words = [i.strip('.,').lower() for text in texts for i in text.split()]
+    tokens = list(itertools.islice(itertools.cycle(words), tokens_in_document))
+    names = list(dict.fromkeys(tokens))
+    pair_counts = cooccurrence_pair_counts(tokens, 2)
+    state = Ranking_State(names=names, scores=np.full(len(names), 1 / len(names)), cold_iterations=10, pair_counts=pair_counts)
+    edited = tokens[:len(tokens) // 2] + ['edited'] + tokens[len(tokens) // 2 + 1:]
+    
+    print(f'keyword ranking state of a {len(tokens)} token document')
+    for name, kept in [('full state', state), ('scores only', replace(state, pair_counts=None))]:
+        size = len(pickle.dumps(kept))
+        print(f'    {f"pickle {name} there and back":<40}{seconds(lambda: pickle.loads(pickle.dumps(pickle.loads(pickle.dumps(kept))))) * 1000:8.2f} ms {size / 1024:10.0f} KB')
+    print(f'    {"update the counts after an edit":<40}{seconds(lambda: update_pair_counts(pair_counts, edited)) * 1000:8.2f} ms')
+    print(f'    {"count the co-occurrences again":<40}{seconds(lambda: cooccurrence_pair_counts(edited, 2)) * 1000:8.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='spacy throughput benchmark')
+    parser.add_argument('--corpus', help='text file with one document per line, defaults to a few sample abstracts')
+    parser.add_argument('--documents', type=int, default=200, help='number of documents to parse, the corpus is repeated to reach it')
+    parser.add_argument('--batch-size', type=int, default=32, help='nlp.pipe batch size')
+    parser.add_argument('--n-process', type=int, default=1, help='nlp.pipe processes')
+    parser.add_argument('--sentence-segmenter', default=TextRank.sentence_segmenter, help='how sentence tasks find sentence boundaries')
+    parser.add_argument('--state-tokens', type=int, default=50_000, help='tokens in the document whose incremental ranking state is measured')
+    args = parser.parse_args()
+    
+    texts = load_corpus(args.corpus, args.documents)
+    state_transfer_costs(texts, args.state_tokens)
+    full_nlp = spacy.load(TextRank.spacy_model)
+    TextRank.sentence_segmenter = args.sentence_segmenter
+    text_rank = TextRank()
+    # warm up both pipelines, so that the first measurement does not pay for lazy initialisation
+    full_nlp(texts[0]); text_rank.nlp(texts[0])
+    
+    print(f'{len(texts)} documents, full pipeline: {" ".join(full_nlp.pipe_names)}')
+    for task in (*TASK_COMPONENTS, 'sentences'):
+        print(f'{task} (without {" ".join(text_rank.disabled_components(task)) or "nothing"})')
+        runs = {
+            'full pipeline, one at a time': lambda texts: [full_nlp(i) for i in texts],
+            'task pipeline, one at a time': lambda texts: [text_rank.parse(i, task) for i in texts],
+            'task pipeline, nlp.pipe':      lambda texts: text_rank.parse_many(texts, task, batch_size=args.batch_size, n_process=args.n_process),
+        }
+        baseline = None
+        for name, parse in runs.items():
+            throughput = tokens_per_second(parse, texts)
+            baseline = baseline or throughput
+            print(f'    {name:<32}{throughput:10.0f} tokens/s {throughput/baseline:6.2f}x')
+
+
+if __name__ == '__main__':
+    main()
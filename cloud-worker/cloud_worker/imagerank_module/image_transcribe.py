@@ -1,8 +1,10 @@
 import logging
+import threading
 from io import BytesIO
 from pathlib import Path
-from typing import TextIO, Union
+from typing import List, TextIO, Union
 
+import torch
 from clip_interrogator import Config, Interrogator
 from PIL import Image
 
@@ -10,26 +12,88 @@ logging.basicConfig(format='%(asctime)s %(name)s-%(levelname)s|%(lineno)d:  %(me
 log = logging.getLogger(__name__)
 
 class ImageInterrogator:
-    log.info("Loading CLIP Model...")
-    interrogator = Interrogator(Config(clip_model_name="ViT-L-14/openai"))
-    log.info("Loading CLIP Model completed...")
+    interrogator: Union[Interrogator, None] = None # loaded by load_model on first use
+    model_lock = threading.Lock()
+    
+    # every label of the artist, flavor, medium, movement and trending tables, and their CLIP text embeddings stacked into one matrix
+    labels: List[str] = []
+    label_embeddings: Union[torch.Tensor, None] = None
 
     
     @classmethod
     def load_model(cls):
-        if not cls.interrogator:
-            cls.interrogator = Interrogator(Config(clip_model_name="ViT-L-14/openai"))
+        if cls.interrogator: return
+        with cls.model_lock:
+            if not cls.interrogator:
+                log.info("Loading CLIP Model...")
+                cls.interrogator = Interrogator(Config(clip_model_name="ViT-L-14/openai"))
+                log.info("Loading CLIP Model completed...")
     
     @classmethod
     def convert_image_to_text(cls, fileobj: Union[str, Path, bytes, BytesIO]):
-        #cls.load_model()
+        return cls.convert_images_to_text([fileobj])[0]
+        
+    @classmethod
+    def convert_images_to_text(cls, fileobjs: List[Union[str, Path, bytes, BytesIO]]) -> List[Union[str, None]]:
+        """transcribe a batch of images with one captioning pass and one CLIP image encoder pass
+        gives the same text as the first two parts of interrogate_fast - the caption and the best matching label. images that fail give None"""
+        cls.load_model()
+        images = [cls._open_image(i) for i in fileobjs]
+        batch  = [i for i in images if i is not None]
+        if not batch: return [None] * len(images)
         
         try:
-            image = Image.open(fileobj).convert('RGB')
-            log.info(image)
-            image_text = cls.interrogator.interrogate_fast(image)
-            return ','.join(image_text.split(',')[:2])
-            
-        except:
-            log.exception('Exception while trying to run CLIP on an image')
+            with torch.no_grad():
+                captions = cls.generate_captions(batch)
+                best_labels = cls.best_labels(cls.image_features(batch))
+        except Exception:
+            log.exception(f'Exception while trying to run CLIP on a batch of {len(batch)} images')
+            return [None] * len(images)
+        
+        texts = iter(','.join(f'{caption}, {label}'.split(',')[:2]) for caption, label in zip(captions, best_labels))
+        return [next(texts) if image is not None else None for image in images]
+    
+    @classmethod
+    def _open_image(cls, fileobj) -> Union[Image.Image, None]:
+        try:
+            return Image.open(fileobj).convert('RGB')
+        except Exception:
+            log.exception('Exception while trying to open an image')
+            return None
+    
+    @classmethod
+    def generate_captions(cls, images: List[Image.Image]) -> List[str]:
+        """batched version of Interrogator.generate_caption"""
+        ci = cls.interrogator
+        ci._prepare_caption()
+        inputs = ci.caption_processor(images=images, return_tensors='pt').to(ci.device)
+        if not ci.config.caption_model_name.startswith('git-'):
+            inputs = inputs.to(ci.dtype)
+        tokens = ci.caption_model.generate(**inputs, max_new_tokens=ci.config.caption_max_length)
+        return [i.strip() for i in ci.caption_processor.batch_decode(tokens, skip_special_tokens=True)]
+    
+    @classmethod
+    def image_features(cls, images: List[Image.Image]) -> torch.Tensor:
+        """batched version of Interrogator.image_to_features, one normalised CLIP embedding per row"""
+        ci = cls.interrogator
+        ci._prepare_clip()
+        pixels = torch.stack([ci.clip_preprocess(i) for i in images]).to(ci.device)
+        with torch.cuda.amp.autocast():
+            features = ci.clip_model.encode_image(pixels)
+            features /= features.norm(dim=-1, keepdim=True)
+        return features
+    
+    @classmethod
+    def best_labels(cls, image_features: torch.Tensor) -> List[str]:
+        """the label with the highest similarity to each image, scored with a single matrix multiply"""
+        if cls.label_embeddings is None:
+            ci = cls.interrogator
+            tables = [ci.artists, ci.flavors, ci.mediums, ci.movements, ci.trendings]
+            cls.labels = [label for table in tables for label in table.labels]
+            cls.label_embeddings = torch.stack([torch.from_numpy(embed) for table in tables for embed in table.embeds]).to(ci.device)
+        
+        with torch.cuda.amp.autocast():
+            similarity = image_features @ cls.label_embeddings.T
+        best = similarity.float().argmax(dim=-1).cpu().tolist()
+        return [cls.labels[i] for i in best]
         
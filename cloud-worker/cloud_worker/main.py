@@ -1,7 +1,11 @@
 import asyncio
+import time
+from pathlib import Path
 
-from cloud_worker.constants import RABBITMQ_JOB_QUEUE_NAME
+from cloud_worker.constants import WORKER_READY_FILE
 from cloud_worker.services.connection_handlers import RabbitMQHandler
+from cloud_worker.services.executors import TaskExecutor
+from cloud_worker.services.jobs import preload_text_models
 from cloud_worker.services.task_processer import TaskProcesor
 
 tasks = set()
@@ -22,10 +26,22 @@ def run_task(coro):
 
 
 async def main():
-    log.info('starting worker..')
-    t = asyncio.create_task(TaskProcesor.listen_for_incoming_tasks())
+    log.info(f'starting worker for {sorted(TaskProcesor.task_types)}..')
+    start_time = time.perf_counter()
+    TaskExecutor.start(initializer=preload_text_models if TaskProcesor.serves_text() else None)
+    await TaskProcesor.load_models()
+    
+    ready = asyncio.Event()
+    t = asyncio.create_task(TaskProcesor.listen_for_incoming_tasks(ready))
     tasks.add(t)
-    await asyncio.Future()
+    await ready.wait() # only ready once every job queue is being consumed
+    Path(WORKER_READY_FILE).touch()
+    log.info(f'worker ready after {time.perf_counter() - start_time:.1f}s')
+    try:
+        await asyncio.Future()
+    finally:
+        Path(WORKER_READY_FILE).unlink(missing_ok=True)
+        await RabbitMQHandler.close()
         
 if __name__ == "__main__":
     try:
@@ -34,4 +50,6 @@ if __name__ == "__main__":
         log.info('stopping worker..')
     except Exception:
         log.exception('')
+    finally:
+        TaskExecutor.shutdown()
     
\ No newline at end of file
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Tuple, Union
+
+log = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """collects items submitted by concurrently running tasks and passes them to run_batch together
+
+    a batch is started once max_batch_size items are waiting, or max_wait seconds after the first item of the batch arrived.
+    run_batch takes a list of items and returns a list with one result per item, in the same order"""
+    def __init__(self, run_batch: Callable[[List[Any]], Awaitable[List[Any]]], max_batch_size: int, max_wait: float) -> None:
+        self.run_batch      = run_batch
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait       = max_wait
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._deadline: Union[asyncio.TimerHandle, None] = None
+        self._running: set = set()
+
+    async def submit(self, item: Any) -> Any:
+        """wait for the result of item, computed in a batch with the other items submitted around the same time"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._deadline is None:
+            self._deadline = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._deadline is not None:
+            self._deadline.cancel()
+            self._deadline = None
+
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if self._pending:
+            self._deadline = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        if not batch: return
+
+        task = asyncio.ensure_future(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        log.debug(f'running batch of {len(batch)}')
+        try:
+            results = await self.run_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f'run_batch returned {len(results)} results for a batch of {len(batch)}')
+        except Exception as e:
+            for _, future in batch:
+                if not future.done(): future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done(): future.set_result(result)
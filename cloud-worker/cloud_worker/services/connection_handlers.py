@@ -5,15 +5,56 @@ import tempfile
 from typing import BinaryIO, Callable, Coroutine, Union
 
 import aio_pika
-from aio_pika.abc import AbstractIncomingMessage
-from cloud_worker.constants import RABBITMQ_CONNECTION_URL, RABBITMQ_JOB_QUEUE_NAME
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage, AbstractRobustConnection
+from aio_pika.pool import Pool
+from cloud_worker.constants import (
+    RABBITMQ_CHANNEL_POOL_SIZE,
+    RABBITMQ_CONNECTION_URL,
+    RABBITMQ_JOB_QUEUE_NAME,
+    RABBITMQ_PUBLISHER_CONFIRMS,
+)
 
 log = logging.getLogger(__name__)
 
 class RabbitMQHandler:
+    # publishing reuses one long-lived connection and a pool of channels instead of a new connection per message
+    connection:      Union[AbstractRobustConnection, None] = None
+    channel_pool:    Union[Pool, None] = None
+    connection_lock: Union[asyncio.Lock, None] = None
+    
+    @classmethod
+    async def get_connection(cls) -> AbstractRobustConnection:
+        """the shared publishing connection. it is a robust connection, so it reconnects by itself if the broker goes away"""
+        cls.connection_lock = cls.connection_lock or asyncio.Lock()
+        async with cls.connection_lock:
+            if cls.connection is None or cls.connection.is_closed:
+                cls.connection = await aio_pika.connect_robust(RABBITMQ_CONNECTION_URL, timeout=5)
+        return cls.connection
+    
     @classmethod
-    async def listen(cls, queue_name:str , on_message_handler: Union[Callable, Coroutine, None]=None) -> None:
-        connection = await aio_pika.connect(RABBITMQ_CONNECTION_URL, timeout=5)
+    async def _get_channel(cls) -> AbstractChannel:
+        connection = await cls.get_connection()
+        return await connection.channel(publisher_confirms=RABBITMQ_PUBLISHER_CONFIRMS)
+    
+    @classmethod
+    def get_channel_pool(cls) -> Pool:
+        if cls.channel_pool is None:
+            cls.channel_pool = Pool(cls._get_channel, max_size=RABBITMQ_CHANNEL_POOL_SIZE)
+        return cls.channel_pool
+    
+    @classmethod
+    async def close(cls) -> None:
+        if cls.channel_pool is not None:
+            await cls.channel_pool.close()
+        if cls.connection is not None:
+            await cls.connection.close()
+        cls.channel_pool = cls.connection = None
+    
+    @classmethod
+    async def listen(cls, queue_name:str , on_message_handler: Union[Callable, Coroutine, None]=None, prefetch_count:int=1,
+                     consuming: Union[asyncio.Event, None]=None) -> None:
+        """consume the queue until cancelled, setting consuming once the queue is declared and messages are being consumed"""
+        connection = await aio_pika.connect_robust(RABBITMQ_CONNECTION_URL, timeout=5)
 
         if on_message_handler:
             on_message_handler = cls.wrap_message_handler(on_message_handler)
@@ -24,7 +65,7 @@ class RabbitMQHandler:
 
         async with connection:
             channel = await connection.channel()
-            await channel.set_qos(prefetch_count=1) # workers can handle at most n messages at a time
+            await channel.set_qos(prefetch_count=prefetch_count) # workers can handle at most n messages at a time
 
             queue = await channel.declare_queue(
                 queue_name, durable=True, # a durable queue is stored on disk, so data is kept even through restarts
@@ -34,39 +75,46 @@ class RabbitMQHandler:
             await queue.consume(on_message_handler)
 
             log.info(f" [*] Waiting for messages in queue {queue_name}")
+            if consuming is not None: consuming.set()
             await asyncio.Future() # keep the listener running indefinitely 
 
     @classmethod
-    async def publish(cls, queue_name:str, message: Union[str, BinaryIO, bytes], headers=None) -> None:
+    async def publish(cls, queue_name:str, message: Union[str, BinaryIO, bytes], headers=None, exchange_name:Union[str, None]=None,
+                      content_type:Union[str, None]=None) -> None:
+        """publish a message to queue_name, or to the exchange exchange_name with queue_name as the routing key
+        the exchange has to be declared beforehand with declare_exchange"""
         headers = headers or {}
-        connection = await aio_pika.connect(RABBITMQ_CONNECTION_URL, timeout=5)
-
-        async with connection:
-            channel = await connection.channel()
-            
-            if isinstance(message, str):
-                message_body = message.encode()
-            elif isinstance(message, (BinaryIO, tempfile.SpooledTemporaryFile)):
-                message_body = message.read()
-            elif isinstance(message, bytes):
-                message_body = message
-            else:
-                log.exception(f"Tried to publish message of type{type(message)}")
-                raise ValueError
+        if isinstance(message, str):
+            message_body = message.encode()
+        elif isinstance(message, (BinaryIO, tempfile.SpooledTemporaryFile)):
+            message_body = message.read()
+        elif isinstance(message, bytes):
+            message_body = message
+        else:
+            log.exception(f"Tried to publish message of type{type(message)}")
+            raise ValueError
 
-            message_obj = aio_pika.Message(
-                message_body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-                headers=headers
-            )
+        message_obj = aio_pika.Message(
+            message_body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            headers=headers, content_type=content_type,
+        )
 
-            # Sending the message
-            await channel.default_exchange.publish(
+        # Sending the message on a pooled channel
+        async with cls.get_channel_pool().acquire() as channel:
+            exchange = await channel.get_exchange(exchange_name, ensure=False) if exchange_name else channel.default_exchange
+            await exchange.publish(
                 message_obj, routing_key=queue_name,
             )
-            
+        
         log.debug(f'sent on channel {queue_name} | {message_obj}')
         
 
+    @classmethod
+    async def declare_exchange(cls, exchange_name:str) -> None:
+        """declare a durable fanout exchange, every queue bound to it receives a copy of each message"""
+        async with cls.get_channel_pool().acquire() as channel:
+            await channel.declare_exchange(exchange_name, aio_pika.ExchangeType.FANOUT, durable=True)
+
     @classmethod
     def wrap_message_handler(cls, f: Union[Callable, Coroutine]):
         if inspect.iscoroutinefunction(f):
@@ -86,6 +134,8 @@ class RabbitMQHandler:
     @staticmethod
     def _wrap_asynchronous_message_handler(coro):
         async def wrapper(message):
-            async with message.process(): # context manager - if exception, the message will be returned to the queue. also runs an ack after processing the message
+            # context manager - if exception, the message will be returned to the queue. also runs an ack after processing the message,
+            # unless the handler already settled the message itself
+            async with message.process(ignore_processed=True):
                 await coro(message)
         return wrapper
@@ -0,0 +1,56 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Union
+
+from cloud_worker.constants import WORKER_CONCURRENCY, WORKER_EXECUTOR
+from cloud_worker.services.jobs import preload_text_models
+
+log = logging.getLogger(__name__)
+
+
+class TaskExecutor:
+    """runs blocking job functions off the event loop, so the worker can keep heartbeating and prefetching while a job runs
+    
+    CPU-bound text jobs go to cpu_executor - a process pool by default, as spacy and pagerank hold the GIL.
+    stages that release the GIL (torch inference for CLIP) go to a thread pool instead"""
+    cpu_executor:    Union[Executor, None] = None
+    thread_executor: Union[ThreadPoolExecutor, None] = None
+    
+    @classmethod
+    def start(cls, executor_type: str = WORKER_EXECUTOR, concurrency: int = WORKER_CONCURRENCY,
+              initializer: Union[Callable, None] = preload_text_models):
+        """initializer: run once in every child process of a process pool, to load the models its jobs need"""
+        log.info(f'starting {executor_type} executor with {concurrency} workers')
+        cls.thread_executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='task')
+        
+        if executor_type == 'process':
+            # spawn rather than fork, torch and spacy are not fork-safe once loaded
+            cls.cpu_executor = ProcessPoolExecutor(max_workers=concurrency,
+                                                   mp_context=multiprocessing.get_context('spawn'),
+                                                   initializer=initializer)
+        elif executor_type == 'thread':
+            cls.cpu_executor = cls.thread_executor
+        elif executor_type == 'inline':
+            cls.cpu_executor = None
+        else:
+            raise ValueError(f"unknown executor type {executor_type}, expected one of 'process', 'thread' or 'inline'")
+        
+    @classmethod
+    def shutdown(cls):
+        for executor in {cls.cpu_executor, cls.thread_executor}:
+            if executor: executor.shutdown(wait=False, cancel_futures=True)
+        cls.cpu_executor = cls.thread_executor = None
+    
+    @classmethod
+    async def run(cls, f: Callable, *args, releases_gil: bool = False, **kwargs):
+        """run f(*args, **kwargs) on the thread pool if it releases the GIL, otherwise on the cpu executor
+        f has to be a module level function if the cpu executor is a process pool"""
+        executor = cls.thread_executor if releases_gil else cls.cpu_executor
+        if executor is None:
+            return f(*args, **kwargs)
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(f, *args, **kwargs))
@@ -0,0 +1,84 @@
+"""
+CPU-bound job functions run by TaskExecutor. They live at module level so that they can be sent to a process pool
+"""
+
+import logging
+from typing import List, Tuple, Union
+
+from cloud_worker.constants import (
+    SENTENCE_NEIGHBOUR_SEARCH,
+    SENTENCE_TOP_K,
+    SPACY_BATCH_SIZE,
+    SPACY_N_PROCESS,
+    SPACY_SENTENCE_SEGMENTER,
+)
+from cloud_worker.textrank_module.incremental import Ranking_State
+from cloud_worker.textrank_module.textrank import Keyword_Extraction_Result, TextRank
+
+log = logging.getLogger(__name__)
+
+TextRank.sentence_segmenter = SPACY_SENTENCE_SEGMENTER
+TextRank.sentence_top_k     = SENTENCE_TOP_K or None
+TextRank.neighbour_search   = SENTENCE_NEIGHBOUR_SEARCH
+
+
+def preload_text_models():
+    """process pool initializer - load the spacy model once in every child process instead of on its first job"""
+    TextRank().nlp
+
+
+def preload_image_models():
+    # imported here rather than at the top, so that workers which only serve text never import torch and CLIP
+    from cloud_worker.imagerank_module.image_transcribe import ImageInterrogator
+    ImageInterrogator.load_model()
+
+
+def image_transcription_job(images: list) -> List[Union[str, None]]:
+    from cloud_worker.imagerank_module.image_transcribe import ImageInterrogator
+    return ImageInterrogator.convert_images_to_text(images)
+
+
+def keyword_extraction_job(text: str, seed_keywords: Union[List[str], None] = None, direction: Union[str, None] = None) -> dict:
+    """direction: one of EDGE_DIRECTIONS for the co-occurrence edges, undirected if not given"""
+    return _keyword_extraction_job_result(TextRank().keyword_extraction_with_keyphrases(text, seed_keywords=seed_keywords,
+                                                                                        direction=direction or 'undirected'))
+
+
+def incremental_keyword_extraction_job(text: str, previous_state: Union[Ranking_State, None] = None,
+                                       seed_keywords: Union[List[str], None] = None) -> Tuple[dict, Ranking_State]:
+    """keyword_extraction_job for a new version of a document, returning the state to rank its next version from as well"""
+    result, state = TextRank().keyword_extraction__incremental(text, previous_state, seed_keywords=seed_keywords)
+    return {**_keyword_extraction_job_result(result), 'incremental': state.report}, state
+
+
+def keyword_extraction_batch_job(texts: List[str]) -> List[dict]:
+    """keyword_extraction_job for every text, parsing them together with spacy's nlp.pipe"""
+    return [_keyword_extraction_job_result(i) for i in TextRank().keyword_extraction_with_keyphrases__batch(texts, batch_size=SPACY_BATCH_SIZE, n_process=SPACY_N_PROCESS)]
+
+
+def _keyword_extraction_job_result(keyword_extraction_result: Keyword_Extraction_Result) -> dict:
+    keyphrase_result = sorted(keyword_extraction_result.keyphrases.items(), key=lambda x: x[1], reverse=True)
+    
+    return {
+        'keyword_nodes': keyword_extraction_result.nodes,
+        'keyphrase_and_scores': keyphrase_result,
+    }
+
+
+def sentence_extraction_job(text: str, queries: Union[List[str], None] = None, direction: Union[str, None] = None) -> Union[List[dict], List[List[dict]]]:
+    """the ranked sentences, or with queries, the sentences ranked for each query"""
+    if queries: return TextRank().sentence_extraction__queries(text, queries, direction=direction or 'undirected')
+    return TextRank().sentence_extraction__undirected(text, direction=direction or 'undirected')
+
+
+def incremental_sentence_extraction_job(text: str, previous_state: Union[Ranking_State, None] = None) -> Tuple[dict, Ranking_State]:
+    nodes, state = TextRank().sentence_extraction__incremental(text, previous_state)
+    return {'sentences': nodes, 'incremental': state.report}, state
+
+
+def sentence_extraction_list_job(sentences: List[str]) -> dict:
+    sentence_extraction_result = TextRank().sentence_extraction_with_clusters(sentences)
+    return {
+        'keyword_extraction_result': sentence_extraction_result.nodes,
+        'clusters': sentence_extraction_result.clusters,
+    }
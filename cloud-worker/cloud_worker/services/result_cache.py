@@ -0,0 +1,84 @@
+import hashlib
+import json
+import logging
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Tuple, Union
+
+from cloud_worker.constants import WORKER_RESULT_CACHE_MAX_ENTRIES, WORKER_RESULT_CACHE_TTL
+
+log = logging.getLogger(__name__)
+
+
+def normalize_payload(payload: Union[str, bytes]) -> bytes:
+    """texts that only differ in unicode composition, line endings or surrounding whitespace are treated as the same request"""
+    if isinstance(payload, (bytes, bytearray)): return bytes(payload)
+    text = unicodedata.normalize('NFC', payload).replace('\r\n', '\n').strip()
+    return text.encode()
+
+
+def request_cache_key(task_type: str, payload: Union[str, bytes], parameters: Union[dict, None] = None) -> str:
+    """sha256 of the task type, the normalized payload and the job parameters, the same key the api server sends in the cache_key header,
+    checked by fastapi-server/tests/test_wire_format.py"""
+    digest = hashlib.sha256()
+    digest.update(task_type.encode())
+    digest.update(b'\0')
+    digest.update(json.dumps(parameters or {}, sort_keys=True, default=str).encode())
+    digest.update(b'\0')
+    digest.update(normalize_payload(payload))
+    return digest.hexdigest()
+
+
+@dataclass
+class ResultCacheMetrics:
+    hits:      int = 0
+    misses:    int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def asdict(self) -> dict:
+        return {**asdict(self), 'hit_rate': self.hit_rate}
+
+
+class ResultCache:
+    """encoded results by cache key, with least-recently-used eviction and a ttl per entry"""
+    def __init__(self, max_entries: int = WORKER_RESULT_CACHE_MAX_ENTRIES, ttl: float = WORKER_RESULT_CACHE_TTL) -> None:
+        self.max_entries = max_entries
+        self.ttl         = ttl
+        self.metrics     = ResultCacheMetrics()
+        self._entries: 'OrderedDict[str, Tuple[Any, Union[float, None]]]' = OrderedDict() # key: (result, expires_at), least recently used first
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._entries[key]
+            entry = None
+
+        if entry is None:
+            self.metrics.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.metrics.hits += 1
+        return entry[0]
+
+    def put(self, key: str, result: Any) -> None:
+        if self.max_entries <= 0: return
+        self._entries[key] = (result, time.monotonic() + self.ttl if self.ttl else None)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.metrics.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.metrics = ResultCacheMetrics()
@@ -1,18 +1,46 @@
+import asyncio
 import io
+import json
 import logging
 import pickle
 from enum import Enum
+from typing import Any, Callable, Dict, List, Set, Union
 
 from aio_pika.abc import AbstractIncomingMessage
 
-from cloud_worker.constants import RABBITMQ_JOB_QUEUE_NAME, RABBITMQ_RESULT_QUEUE_NAME
-from cloud_worker.imagerank_module.image_transcribe import ImageInterrogator
+from cloud_worker.constants import (
+    IMAGE_BATCH_MAX_WAIT,
+    IMAGE_BATCH_SIZE,
+    JOB_ROUTING,
+    RABBITMQ_JOB_QUEUE_NAME,
+    RABBITMQ_RESULT_EXCHANGE_NAME,
+    RABBITMQ_RESULT_QUEUE_NAME,
+    RESULT_CONTENT_TYPE,
+    RESULT_ROUTING,
+    WORKER_CONCURRENCY,
+    WORKER_DOCUMENT_STATE_MAX_ENTRIES,
+    WORKER_DOCUMENT_STATE_TTL,
+    WORKER_QUEUE_PREFETCH,
+    WORKER_TASK_TYPES,
+)
+from cloud_worker.services.batching import MicroBatcher
+from cloud_worker.services.codecs import RESULT_SCHEMA_VERSION, ResultCodec, get_codec
 from cloud_worker.services.connection_handlers import RabbitMQHandler
-from cloud_worker.textrank_module.clustering import cluster_sentences
-from cloud_worker.textrank_module.textrank import TextRank
+from cloud_worker.services.executors import TaskExecutor
+from cloud_worker.services.jobs import (
+    image_transcription_job,
+    incremental_keyword_extraction_job,
+    incremental_sentence_extraction_job,
+    keyword_extraction_batch_job,
+    keyword_extraction_job,
+    preload_image_models,
+    preload_text_models,
+    sentence_extraction_job,
+    sentence_extraction_list_job,
+)
+from cloud_worker.services.result_cache import ResultCache, request_cache_key
 
 log = logging.getLogger(__name__)
-from PIL import Image
 
 
 class TaskType(Enum):
@@ -20,11 +48,56 @@ class TaskType(Enum):
     IMAGE_TRANSCRIPTION = 'IMAGE_TRANSCRIPTION'
     SENTENCE_EXTRACTION = 'SENTENCE_EXTRACTION'
     SENTENCE_EXTRACTION_LIST = 'SENTENCE_EXTRACTION_LIST'
+    KEYWORD_EXTRACTION_BATCH = 'KEYWORD_EXTRACTION_BATCH' # many KEYWORD_EXTRACTION tasks in one message, each gets its own result
     
 
+TEXT_TASK_TYPES = {TaskType.KEYWORD_EXTRACTION.value, TaskType.SENTENCE_EXTRACTION.value, TaskType.SENTENCE_EXTRACTION_LIST.value,
+                   TaskType.KEYWORD_EXTRACTION_BATCH.value}
+
+
+def job_queue_name(task_type: str, routing: str = JOB_ROUTING) -> str:
+    """queue the api servers publish jobs of task_type to"""
+    if routing == 'per_task_type': return f'{RABBITMQ_JOB_QUEUE_NAME}.{task_type}'
+    if routing == 'single':        return RABBITMQ_JOB_QUEUE_NAME
+    raise ValueError(f"unknown job routing {routing}, expected 'per_task_type' or 'single'")
+
+
 class TaskProcesor:
     work_queue_provider = RabbitMQHandler
-    job_handler         = TextRank()
+    executor            = TaskExecutor
+    result_cache        = ResultCache()
+    document_states     = ResultCache(WORKER_DOCUMENT_STATE_MAX_ENTRIES, WORKER_DOCUMENT_STATE_TTL) # task type and document id: Ranking_State
+    image_batcher: Union[MicroBatcher, None] = None
+    result_codec: ResultCodec = get_codec(RESULT_CONTENT_TYPE)
+    task_types: Set[str] = set(WORKER_TASK_TYPES)
+    
+    @classmethod
+    def serves_text(cls) -> bool:
+        return bool(cls.task_types & TEXT_TASK_TYPES)
+    
+    @classmethod
+    def serves_images(cls) -> bool:
+        return TaskType.IMAGE_TRANSCRIPTION.value in cls.task_types
+    
+    @classmethod
+    async def load_models(cls):
+        """load the models needed by the task types this worker serves, the text and image models are loaded at the same time"""
+        unknown_task_types = cls.task_types - {i.value for i in TaskType}
+        if unknown_task_types:
+            raise ValueError(f'unknown task types {unknown_task_types}, expected some of {[i.value for i in TaskType]}')
+        cls.check_routing()
+        
+        loaders = []
+        if cls.serves_text():   loaders.append(cls.executor.run(preload_text_models))
+        if cls.serves_images(): loaders.append(cls.executor.run(preload_image_models, releases_gil=True))
+        await asyncio.gather(*loaders)
+    
+    @classmethod
+    def check_routing(cls, routing: str = JOB_ROUTING):
+        """a worker that serves only some task types has to consume the queues of those task types. on the single queue it would
+        keep handing back the tasks it does not serve, and the workers that do not serve them either would keep taking them"""
+        if routing == 'single' and cls.task_types != {i.value for i in TaskType}:
+            raise ValueError(f"WORKER_TASK_TYPES {sorted(cls.task_types)} needs JOB_ROUTING 'per_task_type', with 'single' routing every worker serves every task type")
     
     @classmethod
     async def process_task(cls, message: AbstractIncomingMessage):
@@ -32,93 +105,214 @@ class TaskProcesor:
         
         task_type = headers['task_type']
         task_id = headers['task_id']
-        pickled = headers.get('pickled',None)
-        other_info:dict = headers['other_info'] # type: ignore
         
+        if task_type not in cls.task_types:
+            # only reachable if the task was published to the wrong queue, handing it back would only bring it back here
+            await cls.publish_unserved(message)
+            await message.nack(requeue=False)
+            return
+        
+        if task_type == TaskType.KEYWORD_EXTRACTION_BATCH.value:
+            await cls.process_batch_task(message)
+            return
+        
+        cache_key = cls.cache_key(message)
         log.info(f'processing new {task_type} task')
         
+        encoded_result = cls.result_cache.get(cache_key)
+        if encoded_result is None:
+            try:
+                result = await cls.run_task(message)
+            except Exception as exc:
+                # the message is still rejected by message.process(), the failure releases the requests waiting on this task
+                await cls.publish_failure(task_type, task_id, cache_key, repr(exc))
+                raise
+            if result is None:
+                # the api server is told, so that it stops coalescing identical requests onto this task
+                await cls.publish_failure(task_type, task_id, cache_key, f'{task_type} task produced no result')
+                return
+            encoded_result = cls.result_codec.encode(result)
+            cls.result_cache.put(cache_key, encoded_result)
+        else:
+            log.info(f'reusing the cached result of an identical {task_type} task, cache hit rate {cls.result_cache.metrics.hit_rate:.0%}')
+        
+        await cls.publish_result(encoded_result, {'task_type': task_type,
+                                                  'task_id': task_id,
+                                                  'cache_key': cache_key,
+                                                  'schema_version': RESULT_SCHEMA_VERSION})
+        log.info(f'completed {task_type} task')
+        
+    @classmethod
+    async def publish_failure(cls, task_type: str, task_id: str, cache_key: str, error: str):
+        """publish an error as the result of a task that produced none. it is not cached, so the next identical task runs again"""
+        log.warning(f'task {task_id} failed: {error}')
+        await cls.publish_result(cls.result_codec.encode({'error': error}), {'task_type': task_type,
+                                                                          'task_id': task_id,
+                                                                          'cache_key': cache_key,
+                                                                          'schema_version': RESULT_SCHEMA_VERSION,
+                                                                          'failed': True})
+        
+    @classmethod
+    async def publish_unserved(cls, message: AbstractIncomingMessage):
+        """publish a failure for each task of a message this worker does not serve, so the client gets an error instead of waiting it out"""
+        headers = message.headers
+        task_type = str(headers['task_type'])
+        error = f'this worker only serves {sorted(cls.task_types)}, not {task_type}'
+        if task_type != TaskType.KEYWORD_EXTRACTION_BATCH.value:
+            await cls.publish_failure(task_type, str(headers['task_id']), cls.cache_key(message), error)
+            return
+        
+        other_info: dict = headers['other_info'] # type: ignore
+        await asyncio.gather(*[cls.publish_failure(TaskType.KEYWORD_EXTRACTION.value, task_id, request_cache_key(TaskType.KEYWORD_EXTRACTION.value, text), error)
+                               for task_id, text in zip(other_info['task_ids'], json.loads(message.body))])
+        
+    @classmethod
+    async def process_batch_task(cls, message: AbstractIncomingMessage):
+        """run keyword extraction on a json list of texts with one spacy nlp.pipe call, publishing a KEYWORD_EXTRACTION result for each text
+        texts that were already extracted are answered from the result cache, which they share with single KEYWORD_EXTRACTION tasks"""
+        other_info: dict = message.headers['other_info'] # type: ignore
+        task_ids: List[str] = list(other_info['task_ids'])
+        texts: List[str] = json.loads(message.body)
+        if len(texts) != len(task_ids):
+            raise ValueError(f'batch of {len(texts)} texts has {len(task_ids)} task ids')
+        
+        log.info(f'processing batch of {len(texts)} {TaskType.KEYWORD_EXTRACTION.value} tasks')
+        cache_keys = [request_cache_key(TaskType.KEYWORD_EXTRACTION.value, i) for i in texts]
+        encoded_results = [cls.result_cache.get(i) for i in cache_keys]
+        
+        not_cached = [index for index, encoded_result in enumerate(encoded_results) if encoded_result is None]
+        if not_cached:
+            results = await cls.executor.run(keyword_extraction_batch_job, [texts[i] for i in not_cached])
+            for index, result in zip(not_cached, results):
+                encoded_results[index] = cls.result_codec.encode(result)
+                cls.result_cache.put(cache_keys[index], encoded_results[index])
+        
+        await asyncio.gather(*[cls.publish_result(encoded_result, {'task_type': TaskType.KEYWORD_EXTRACTION.value,
+                                                                   'task_id': task_id,
+                                                                   'cache_key': cache_key,
+                                                                   'schema_version': RESULT_SCHEMA_VERSION})
+                               for task_id, cache_key, encoded_result in zip(task_ids, cache_keys, encoded_results)])
+        log.info(f'completed batch of {len(texts)} tasks, {len(texts) - len(not_cached)} from the result cache')
+        
+    @classmethod
+    def cache_key(cls, message: AbstractIncomingMessage) -> str:
+        """the key the api server sent with the task, or the same key computed here for tasks published without one"""
+        headers = message.headers
+        if headers.get('cache_key'): return str(headers['cache_key'])
+        
+        task_type = str(headers['task_type'])
+        is_text = task_type != TaskType.IMAGE_TRANSCRIPTION.value and not headers.get('pickled', None)
+        return request_cache_key(task_type, message.body.decode() if is_text else message.body, headers.get('other_info')) # type: ignore
+        
+    @classmethod
+    async def run_task(cls, message: AbstractIncomingMessage) -> Any:
+        """run the job for the task, returning its result or None if there is nothing to publish"""
+        headers = message.headers
+        
+        task_type = headers['task_type']
+        pickled = headers.get('pickled',None)
+        other_info:dict = headers['other_info'] # type: ignore
+        
         if task_type == TaskType.KEYWORD_EXTRACTION.value:
             data = message.body.decode() if not pickled else pickle.loads(message.body)
             
-            keyword_extraction_result =  cls.job_handler.keyword_extraction__undirected(data)
-            
-            only_text_and_score:Dict[str, int] = {i['name']: i['score'] for i in keyword_extraction_result} # type: ignore
-            keyphrase_result = cls.job_handler.regenerate_keyphrases(only_text_and_score, data)
-            
-            keyphrase_result = sorted(keyphrase_result.items(), key=lambda x: x[1], reverse=True)
-            
-            result = {
-                'keyword_nodes': keyword_extraction_result,
-                'keyphrase_and_scores': keyphrase_result,
-            }
-            
-            encoded_data = pickle.dumps(result)
-            
-            await RabbitMQHandler.publish(RABBITMQ_RESULT_QUEUE_NAME, encoded_data, 
-                                          {'task_type': TaskType.KEYWORD_EXTRACTION.value,
-                                           'task_id':task_id,
-                                           'pickled': True})
+            if other_info.get('document_id'):
+                cls.warn_unsupported_incremental_options(other_info, ['direction'])
+                return await cls.run_incremental(incremental_keyword_extraction_job, f"{task_type}:{other_info['document_id']}", data,
+                                                 seed_keywords=other_info.get('seed_keywords'))
+            return await cls.executor.run(keyword_extraction_job, data, seed_keywords=other_info.get('seed_keywords'),
+                                          direction=other_info.get('direction'))
             
         elif task_type == TaskType.IMAGE_TRANSCRIPTION.value:
             image_data = message.body
             codec = other_info['codec']
             image_obj = io.BytesIO(image_data)
             
-            keyword_extraction_result = ImageInterrogator.convert_image_to_text(image_obj)
+            keyword_extraction_result = await cls.get_image_batcher().submit(image_obj)
             if not keyword_extraction_result:
                 log.warning('No result from image transcription')
-                return
+                return None
             
-            await RabbitMQHandler.publish(RABBITMQ_RESULT_QUEUE_NAME, keyword_extraction_result, {'task_type': TaskType.IMAGE_TRANSCRIPTION.value, 'task_id':task_id})
+            return keyword_extraction_result
             
         elif task_type == TaskType.SENTENCE_EXTRACTION.value:
             data = message.body.decode()
-            keyword_extraction_result = cls.job_handler.sentence_extraction__undirected(data)
-            encoded_data = pickle.dumps(keyword_extraction_result)
-            
-            await RabbitMQHandler.publish(RABBITMQ_RESULT_QUEUE_NAME, encoded_data, 
-                                          {'task_type': TaskType.SENTENCE_EXTRACTION.value,
-                                           'task_id':task_id,
-                                           'pickled': True})
+            if other_info.get('document_id'):
+                cls.warn_unsupported_incremental_options(other_info, ['queries', 'direction'])
+                return await cls.run_incremental(incremental_sentence_extraction_job, f"{task_type}:{other_info['document_id']}", data)
+            return await cls.executor.run(sentence_extraction_job, data, queries=other_info.get('queries'), direction=other_info.get('direction'))
             
         elif task_type == TaskType.SENTENCE_EXTRACTION_LIST.value:
             data = message.body.decode()
             data = data.split('|')
             
-            keyword_extraction_result = cls.job_handler.sentence_extraction__undirected(data)
-            
-            nodes = cls.job_handler._generate_nodes_from_similarity([cls.job_handler.nlp(i) for i in data])
-            for node in nodes:
-                node.id = node.id - len(keyword_extraction_result)
-            
-            clusters = cluster_sentences(nodes)
-            result = {}
-            result['keyword_extraction_result'] = keyword_extraction_result
-            result['clusters'] = clusters
-            
-            
-            encoded_data = pickle.dumps(result)
-            
-            await RabbitMQHandler.publish(RABBITMQ_RESULT_QUEUE_NAME, encoded_data, 
-                                        {'task_type': TaskType.SENTENCE_EXTRACTION_LIST.value,
-                                           'task_id':task_id,
-                                           'pickled': True})
+            return await cls.executor.run(sentence_extraction_list_job, data)
             
         else:
             log.warning(f'Could not interpret task: {headers}')
+            return None
             
+    @classmethod
+    def warn_unsupported_incremental_options(cls, other_info: dict, options: List[str]):
+        """the api server rejects these options together with a document_id, tasks published some other way are ranked without them"""
+        ignored = [i for i in options if other_info.get(i) and other_info.get(i) != 'undirected']
+        if ignored: log.warning(f"ignoring {ignored} of the incremental ranking of document {other_info['document_id']}")
+    
+    @classmethod
+    async def run_incremental(cls, job: Callable, state_key: str, *args, **kwargs) -> Any:
+        """run an incremental job from the state the previous version of the document left, keeping the state it returns for the next version"""
+        result, state = await cls.executor.run(job, *args, previous_state=cls.document_states.get(state_key), **kwargs)
+        cls.document_states.put(state_key, state)
+        return result
         
+    @classmethod
+    def get_image_batcher(cls) -> MicroBatcher:
+        if cls.image_batcher is None:
+            cls.image_batcher = MicroBatcher(cls.transcribe_images, IMAGE_BATCH_SIZE, IMAGE_BATCH_MAX_WAIT)
+        return cls.image_batcher
+    
+    @classmethod
+    async def transcribe_images(cls, images: List[io.BytesIO]) -> List[Union[str, None]]:
+        return await cls.executor.run(image_transcription_job, images, releases_gil=True)
             
-        log.info(f'completed {task_type} task')
-        
+    @classmethod
+    async def publish_result(cls, message: bytes, headers: dict):
+        content_type = cls.result_codec.content_type
+        if RESULT_ROUTING == 'fanout':
+            await cls.work_queue_provider.publish('', message, headers, exchange_name=RABBITMQ_RESULT_EXCHANGE_NAME, content_type=content_type)
+        else:
+            await cls.work_queue_provider.publish(RABBITMQ_RESULT_QUEUE_NAME, message, headers, content_type=content_type)
+            
+    @classmethod
+    def queue_prefetch(cls, routing: str = JOB_ROUTING) -> Dict[str, int]:
+        """the job queues this worker consumes, and how many messages it takes from each at a time"""
+        if routing == 'single':
+            # enough messages in flight to fill a batch of images, the executor still limits how many text jobs run at once
+            prefetch_count = max(WORKER_CONCURRENCY, IMAGE_BATCH_SIZE) if cls.serves_images() else WORKER_CONCURRENCY
+            return {job_queue_name(TaskType.KEYWORD_EXTRACTION.value, routing): prefetch_count}
         
+        default_prefetch = lambda task_type: IMAGE_BATCH_SIZE if task_type == TaskType.IMAGE_TRANSCRIPTION.value else WORKER_CONCURRENCY
+        return {job_queue_name(task_type, routing): WORKER_QUEUE_PREFETCH.get(task_type, default_prefetch(task_type))
+                for task_type in sorted(cls.task_types)}
             
     @classmethod
-    async def listen_for_incoming_tasks(cls):
+    async def listen_for_incoming_tasks(cls, ready: Union[asyncio.Event, None] = None):
+        """consume the job queues of this worker, ready is set once every queue has been declared and is being consumed"""
         try:
-            await cls.work_queue_provider.listen(RABBITMQ_JOB_QUEUE_NAME, on_message_handler=TaskProcesor.process_task)
+            if RESULT_ROUTING == 'fanout':
+                await cls.work_queue_provider.declare_exchange(RABBITMQ_RESULT_EXCHANGE_NAME)
+            queues = cls.queue_prefetch()
+            consuming = [asyncio.Event() for _ in queues]
+            # each queue gets its own prefetch, so a queue of images never holds up the text jobs behind it
+            await asyncio.gather(cls._set_when_all_set(ready or asyncio.Event(), consuming),
+                                 *[cls.work_queue_provider.listen(queue_name, on_message_handler=TaskProcesor.process_task,
+                                                                  prefetch_count=prefetch_count, consuming=queue_consuming)
+                                   for (queue_name, prefetch_count), queue_consuming in zip(queues.items(), consuming)])
         except Exception:
             log.exception('unable to connect to work queue')
             exit(-1)
             
-    
+    @classmethod
+    async def _set_when_all_set(cls, event: asyncio.Event, events: List[asyncio.Event]):
+        await asyncio.gather(*[i.wait() for i in events])
+        event.set()
@@ -1,19 +1,37 @@
 import logging
-from typing import Dict, List, Set
+from typing import List, Set, Union
 
-import networkx as nx
 import numpy as np
-from spacy.tokens import Doc, Span
+from scipy import sparse
+from scipy.sparse import csgraph
 
+from cloud_worker.textrank_module.graph import Compact_Graph
 from cloud_worker.textrank_module.pagerank import Undirected_Node
 
 log = logging.getLogger(__name__)
 
-def cluster_sentences(nodes: List[Undirected_Node]) -> List[Set[str]]:
-        edge_75_percentile = np.percentile(
-            [[edge.weight] for node in nodes for edge in node.connected],
-            75)
-        n = {node.id: [i.get_other(node).id for i in node.connected if i.weight > edge_75_percentile] for node in nodes}
+def cluster_sentences(nodes: Union[List[Undirected_Node], Compact_Graph]) -> List[Set[int]]:
+        """group node ids into clusters of nodes that are connected by edges heavier than the 75th percentile edge weight"""
+        if isinstance(nodes, Compact_Graph):
+            graph = nodes
+            node_ids = list(range(graph.num_nodes))
+        else:
+            graph = Compact_Graph.from_undirected_nodes(nodes)
+            node_ids = [node.id for node in nodes]
         
-        g = nx.Graph(n)
-        return [i for i in nx.connected_components(g)]
\ No newline at end of file
+        first, second, weight = graph.unique_edges()
+        if not len(weight): return [{i} for i in node_ids]
+        
+        # every edge is counted once for each of its nodes, as it is when stored in Undirected_Node.connected
+        not_self_loop = first != second
+        edge_75_percentile = np.percentile(np.concatenate([weight, weight[not_self_loop]]), 75)
+        
+        strong_edges = weight > edge_75_percentile
+        A = sparse.csr_matrix((np.ones(strong_edges.sum()), (first[strong_edges], second[strong_edges])),
+                              shape=(graph.num_nodes, graph.num_nodes))
+        num_of_clusters, labels = csgraph.connected_components(A, directed=False)
+        
+        clusters: List[Set[int]] = [set() for _ in range(num_of_clusters)]
+        for index, label in enumerate(labels):
+            clusters[label].add(node_ids[index])
+        return clusters
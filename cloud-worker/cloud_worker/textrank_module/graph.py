@@ -0,0 +1,154 @@
+"""
+Compact_Graph - a weighted graph stored as a name <-> id vocabulary and parallel (src, dst, weight) edge arrays.
+Graphs are undirected unless directed is set, then every edge only goes from src to dst
+"""
+
+from __future__ import annotations
+
+import logging
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Tuple, Union
+
+import numpy as np
+from scipy import sparse
+
+from cloud_worker.textrank_module.pagerank import Directed_Node, Undirected_Node
+
+DUPLICATE_EDGE_REDUCERS = {'max': np.maximum, 'sum': np.add} # how the weights of edges added more than once between the same pair are combined
+# which way the edges between two co-occurring tokens, or two similar sentences, go: both ways, from the earlier one to the later one, or back
+EDGE_DIRECTIONS = ('undirected', 'forward', 'backward')
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class Compact_Graph:
+    names:  List[str]      = field(default_factory=list)
+    ids:    Dict[str, int] = field(default_factory=dict)
+    src:    array          = field(default_factory=lambda: array('q'), repr=False)
+    dst:    array          = field(default_factory=lambda: array('q'), repr=False)
+    weight: array          = field(default_factory=lambda: array('d'), repr=False)
+    duplicate_edges: str   = 'max' # 'max' keeps the largest weight of repeated edges, 'sum' adds them up, e.g. to count co-occurrences
+    directed:        bool  = False
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.names)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.src)
+
+    def node_id(self, name: str) -> int:
+        """return the id of the node with this name, adding a new node if it does not exist yet"""
+        if name in self.ids: return self.ids[name]
+        self.ids[name] = len(self.names)
+        self.names.append(name)
+        return self.ids[name]
+
+    def add_edge(self, first: int, second: int, weight: Union[int, float]=1):
+        self.src.append(first)
+        self.dst.append(second)
+        self.weight.append(weight)
+
+    def add_edges(self, first: Iterable[int], second: Iterable[int], weight: Iterable[float]):
+        self.src.extend(np.asarray(first, dtype=np.int64).tolist())
+        self.dst.extend(np.asarray(second, dtype=np.int64).tolist())
+        self.weight.extend(np.asarray(weight, dtype=np.float64).tolist())
+
+    def edge_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """numpy copies of the (src, dst, weight) edge arrays"""
+        return (np.array(self.src, dtype=np.int64),
+                np.array(self.dst, dtype=np.int64),
+                np.array(self.weight, dtype=np.float64))
+
+    def unique_edges(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """one (first, second, weight) entry per connected pair of nodes with first <= second, or per (src, dst) pair if the graph is directed
+        the weights of an edge that was added more than once between the same pair are combined as set by duplicate_edges"""
+        src, dst, weight = self.edge_arrays()
+        first, second = (src, dst) if self.directed else (np.minimum(src, dst), np.maximum(src, dst))
+
+        keys = first * max(self.num_nodes, 1) + second
+        order = np.argsort(keys, kind='stable')
+        keys, first, second, weight = keys[order], first[order], second[order], weight[order]
+
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+        if not len(starts):
+            return first, second, weight
+        return first[starts], second[starts], DUPLICATE_EDGE_REDUCERS[self.duplicate_edges].reduceat(weight, starts)
+
+    def adjacency_matrix(self) -> sparse.csr_matrix:
+        """weighted adjacency matrix, where row i holds the edges from node i. self-loops are kept as a single entry on the diagonal
+        the matrix of an undirected graph is symmetric"""
+        first, second, weight = self.unique_edges()
+        if self.directed:
+            return sparse.csr_matrix((weight, (first, second)), shape=(self.num_nodes, self.num_nodes), dtype=np.float64)
+        not_self_loop = first != second
+        rows    = np.concatenate([first, second[not_self_loop]])
+        cols    = np.concatenate([second, first[not_self_loop]])
+        weights = np.concatenate([weight, weight[not_self_loop]])
+        return sparse.csr_matrix((weights, (rows, cols)), shape=(self.num_nodes, self.num_nodes), dtype=np.float64)
+
+    def neighbours(self) -> List[List[int]]:
+        """ids of the nodes connected to each node, for a directed graph the nodes its edges go to"""
+        A = self.adjacency_matrix()
+        return [A.indices[A.indptr[i]:A.indptr[i+1]].tolist() for i in range(self.num_nodes)]
+
+    def nodes_asdict(self) -> List[dict]:
+        """serialise every node in the same shape as Undirected_Node.asdict, indexed by node id"""
+        return [{'id': node_id, 'name': name, 'connected': connected}
+                for node_id, (name, connected) in enumerate(zip(self.names, self.neighbours()))]
+
+    def to_undirected_nodes(self) -> List[Undirected_Node]:
+        """compatibility view of the graph as Undirected_Node objects, with node ids equal to the graph ids"""
+        nodes = [Undirected_Node(id=index, name=name) for index, name in enumerate(self.names)]
+        for first, second, weight in zip(*self.unique_edges()):
+            nodes[first].to(nodes[second], float(weight))
+        return nodes
+
+    def to_directed_nodes(self) -> List[Directed_Node]:
+        """view of the graph as Directed_Node objects, indexed by graph id. edges of an undirected graph go both ways"""
+        nodes = [Directed_Node(name=name) for name in self.names]
+        for first, second, weight in zip(*self.unique_edges()):
+            nodes[first].to_node(nodes[second], float(weight))
+            if not self.directed and first != second: nodes[second].to_node(nodes[first], float(weight))
+        return nodes
+
+    @classmethod
+    def from_cooccurrence(cls, tokens: List[str], window: int = 2, direction: str = 'undirected') -> Compact_Graph:
+        """connect every token to the tokens up to window positions after it, weighted by the number of times each pair co-occurs
+        nodes are numbered in the order the tokens first appear, and a token repeated within the window gets a self-loop
+        direction: one of EDGE_DIRECTIONS, 'forward' edges go from each token to the ones after it and 'backward' edges the other way"""
+        if direction not in EDGE_DIRECTIONS:
+            raise ValueError(f'unknown edge direction {direction}, expected one of {EDGE_DIRECTIONS}')
+        graph = cls(duplicate_edges='sum', directed=direction != 'undirected')
+        for token in tokens:
+            graph.ids.setdefault(token, len(graph.ids))
+        graph.names = list(graph.ids)
+        
+        token_ids = np.fromiter((graph.ids[i] for i in tokens), dtype=np.int64, count=len(tokens))
+        # the pairs at distance d are the token ids next to the same ids shifted by d
+        shifts = range(1, min(max(window, 0), len(tokens) - 1) + 1)
+        first  = np.concatenate([token_ids[:-i] for i in shifts]) if shifts else token_ids[:0]
+        second = np.concatenate([token_ids[i:] for i in shifts])  if shifts else token_ids[:0]
+        if direction == 'backward': first, second = second, first
+        graph.add_edges(first, second, np.ones(len(first)))
+        return graph
+
+    @classmethod
+    def from_undirected_nodes(cls, nodes: List[Undirected_Node]) -> Compact_Graph:
+        """build a graph from Undirected_Node objects, node i of the graph is nodes[i]
+        nodes are keyed by their position rather than their name, so nodes with duplicate names are kept apart"""
+        graph = cls()
+        node_index = {node: index for index, node in enumerate(nodes)}
+        for node in nodes:
+            graph.ids.setdefault(node.name, len(graph.names))
+            graph.names.append(node.name)
+
+        for index, node in enumerate(nodes):
+            for edge in node.connected:
+                other = node_index.get(edge.get_other(node))
+                if other is None or other < index: continue # each edge is stored on both of its nodes, only add it once
+                graph.add_edge(index, other, edge.weight)
+        return graph
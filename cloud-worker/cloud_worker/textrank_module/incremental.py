@@ -0,0 +1,152 @@
+"""
+Incremental re-ranking of documents that are submitted again after small edits.
+
+Ranking_State keeps what is needed from the last ranking of a document: the scores of its nodes, and for keyword graphs
+the token stream and co-occurrence counts the graph was built from, as arrays so that sending the state to and from a process pool
+costs about a copy of them. The next version of the document then
+    - updates the co-occurrence counts with the pairs the token diff removed and added, instead of counting every pair again
+    - starts power iteration from the previous scores instead of 1/nodes, which converges in fewer iterations after a small edit
+"""
+
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Set, Tuple, Union
+
+import numpy as np
+
+from cloud_worker.textrank_module.graph import Compact_Graph
+
+log = logging.getLogger(__name__)
+
+Pair = Tuple[str, str] # two co-occurring tokens, in sorted order
+PAIR_KEY_SHIFT = 32 # a pair of token ids is kept as one int64 key, the smaller id in the high bits
+
+
+@dataclass
+class Pair_Counts:
+    """the co-occurrence counts of a token stream. vocabulary holds the token of every id, ids of tokens that no longer occur are
+    kept so that the ids of the others do not change between versions"""
+    vocabulary: List[str]
+    token_ids:  np.ndarray # the token stream as ids
+    keys:       np.ndarray # pair keys of every pair that co-occurs, sorted
+    counts:     np.ndarray # the number of times each pair in keys co-occurs
+    window:     int
+
+    def as_counter(self) -> Counter:
+        """the counts keyed by the pairs of tokens"""
+        return Counter({_pair(self.vocabulary[key >> PAIR_KEY_SHIFT], self.vocabulary[key & (2**PAIR_KEY_SHIFT - 1)]): count
+                        for key, count in zip(self.keys.tolist(), self.counts.tolist())})
+
+
+@dataclass
+class Ranking_State:
+    names:           List[str]
+    scores:          np.ndarray # by node id, in the order of names
+    cold_iterations: int        # power iterations the last ranking without a previous state took
+    pair_counts:     Union[Pair_Counts, None] = field(default=None, repr=False)
+    report:          dict       = field(default_factory=dict) # incremental_report of the ranking that left this state
+
+    def scores_by_name(self) -> Dict[str, float]:
+        return dict(zip(self.names, self.scores.tolist()))
+
+
+def incremental_report(previous: Union[Ranking_State, None], iterations: int) -> dict:
+    """how much warm starting from the previous state saved, compared to the last ranking of the document that started cold"""
+    if previous is None:
+        return {'warm_started': False, 'iterations': iterations, 'iterations_saved': 0}
+    return {'warm_started': True, 'iterations': iterations, 'iterations_saved': max(previous.cold_iterations - iterations, 0)}
+
+
+def _pair(first: str, second: str) -> Pair:
+    return (first, second) if first <= second else (second, first)
+
+
+def _pair_positions(length: int, start: int, stop: int, window: int) -> Set[Tuple[int, int]]:
+    """positions (i, j) of the pairs at most window apart that touch or span the tokens from start to stop"""
+    return {(i, j) for i in range(max(start - window, 0), min(stop, length))
+                   for j in range(max(i + 1, start), min(i + window, length - 1) + 1)}
+
+
+def _pair_keys(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    return (np.minimum(first, second) << PAIR_KEY_SHIFT) | np.maximum(first, second)
+
+
+def _token_ids(tokens: List[str], vocabulary: List[str]) -> np.ndarray:
+    """ids of tokens in vocabulary, tokens that are not in it yet are added to the end"""
+    ids = {token: index for index, token in enumerate(vocabulary)}
+    for token in dict.fromkeys(tokens): # the distinct tokens in order, without a python loop over every token
+        if token not in ids:
+            ids[token] = len(vocabulary)
+            vocabulary.append(token)
+    return np.fromiter(map(ids.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+
+
+def cooccurrence_pair_counts(tokens: List[str], window: int) -> Pair_Counts:
+    """the number of times every pair of tokens is at most window tokens apart, the same counts as Compact_Graph.from_cooccurrence"""
+    vocabulary: List[str] = []
+    token_ids = _token_ids(tokens, vocabulary)
+    shifts = range(1, min(max(window, 0), len(tokens) - 1) + 1)
+    keys = np.concatenate([_pair_keys(token_ids[:-i], token_ids[i:]) for i in shifts]) if shifts else token_ids[:0]
+    keys, counts = np.unique(keys, return_counts=True)
+    return Pair_Counts(vocabulary, token_ids, keys, counts.astype(np.int64), window)
+
+
+def edited_span(previous_tokens: Sequence, tokens: Sequence) -> Tuple[int, int, int]:
+    """(start, previous stop, stop) of the tokens between the common prefix and the common suffix of the two token streams
+    a single replaced span is a valid diff of any edit, found in linear time. difflib finds smaller diffs, but it is quadratic
+    in the length of the document and took longer than counting every pair again"""
+    previous_tokens, tokens = np.asarray(previous_tokens), np.asarray(tokens)
+    limit = min(len(previous_tokens), len(tokens))
+    differs = previous_tokens[:limit] != tokens[:limit]
+    start = int(np.argmax(differs)) if differs.any() else limit
+    differs = previous_tokens[::-1][:limit - start] != tokens[::-1][:limit - start]
+    suffix = int(np.argmax(differs)) if differs.any() else limit - start
+    return start, len(previous_tokens) - suffix, len(tokens) - suffix
+
+
+def update_pair_counts(previous: Pair_Counts, tokens: List[str]) -> Pair_Counts:
+    """co-occurrence counts of tokens, from the counts of the previous version of the document and the span the edit replaced.
+    the pairs that touch or span the edit are removed and counted again, every other pair is unchanged"""
+    vocabulary = list(previous.vocabulary)
+    token_ids = _token_ids(tokens, vocabulary)
+    start, previous_stop, stop = edited_span(previous.token_ids, token_ids)
+    removed = np.array(sorted(_pair_positions(len(previous.token_ids), start, previous_stop, previous.window)), dtype=np.int64).reshape(-1, 2)
+    added   = np.array(sorted(_pair_positions(len(token_ids), start, stop, previous.window)), dtype=np.int64).reshape(-1, 2)
+
+    changed_keys, inverse = np.unique(np.concatenate([_pair_keys(previous.token_ids[removed[:, 0]], previous.token_ids[removed[:, 1]]),
+                                                      _pair_keys(token_ids[added[:, 0]], token_ids[added[:, 1]])]), return_inverse=True)
+    changes = np.bincount(inverse, weights=np.r_[-np.ones(len(removed)), np.ones(len(added))], minlength=len(changed_keys)).astype(np.int64)
+
+    # keys are sorted, so the few changed pairs are found and inserted by binary search instead of sorting every pair again
+    positions = np.searchsorted(previous.keys, changed_keys)
+    known = positions < len(previous.keys)
+    known[known] = previous.keys[positions[known]] == changed_keys[known]
+    counts = previous.counts.copy()
+    counts[positions[known]] += changes[known]
+    keys   = np.insert(previous.keys, positions[~known], changed_keys[~known])
+    counts = np.insert(counts, positions[~known], changes[~known])
+
+    occurring = counts > 0 # drops the pairs that no longer occur
+    return Pair_Counts(vocabulary, token_ids, keys[occurring], counts[occurring], previous.window)
+
+
+def graph_from_pair_counts(pair_counts: Pair_Counts) -> Compact_Graph:
+    """co-occurrence graph with nodes in the order the tokens first appear, like Compact_Graph.from_cooccurrence"""
+    graph = Compact_Graph(duplicate_edges='sum')
+    ids, first_positions = np.unique(pair_counts.token_ids, return_index=True)
+    in_order = ids[np.argsort(first_positions)]
+    graph.names = [pair_counts.vocabulary[i] for i in in_order.tolist()]
+    graph.ids = {name: index for index, name in enumerate(graph.names)}
+
+    node_ids = np.full(len(pair_counts.vocabulary), -1, dtype=np.int64)
+    node_ids[in_order] = np.arange(len(in_order))
+    graph.add_edges(node_ids[pair_counts.keys >> PAIR_KEY_SHIFT], node_ids[pair_counts.keys & (2**PAIR_KEY_SHIFT - 1)], pair_counts.counts)
+    return graph
+
+
+def warm_start_scores(graph: Compact_Graph, previous: Ranking_State) -> np.ndarray:
+    """the previous scores of the nodes of graph, nodes that are new get the average score"""
+    previous_scores = previous.scores_by_name()
+    default = 1 / max(graph.num_nodes, 1)
+    return np.array([previous_scores.get(i, default) for i in graph.names], dtype=np.float64)
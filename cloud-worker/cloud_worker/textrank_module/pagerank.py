@@ -1,14 +1,23 @@
 from __future__ import annotations
 
 import logging
-import random
-from dataclasses import asdict, dataclass, field
+from dataclasses import dataclass, field
 from itertools import count
-from typing import Any, List, Tuple, Union
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple, Union
 
+import numpy as np
 from numpy import transpose
+from scipy import sparse
 
-from cloud_worker.textrank_module.pagerank_wt import iterative_pr, noniterative_pr
+from cloud_worker.textrank_module.pagerank_engine import (
+    DEFAULT_MAX_ITERATIONS,
+    PowerIterationResult,
+    normalize_rows,
+    run_pagerank,
+)
+
+if TYPE_CHECKING:
+    from cloud_worker.textrank_module.graph import Compact_Graph
 
 log = logging.getLogger(__name__)
 
@@ -59,12 +68,15 @@ class Undirected_Edge:
     def get_other(self, other_node: Undirected_Node):
         return self.second if self.first == other_node else self.first
     
+    # hashed on the ids of its nodes, the node reprs list their edges, so they were slow to build and changed as edges were added
     def __hash__(self) -> int:
-        return hash(f"{self.first}-{self.second}|{self.second}-{self.first}")
+        return hash((self.first.id, self.second.id))
 
 
         
 class PageRank:
+    backend = 'auto' # one of pagerank_engine.PAGERANK_BACKENDS
+    
     @classmethod
     def convert_connected_nodes_to_matrix(cls, nodes: List[Undirected_Node]):
         M = [[0.0 for j in range(len(nodes))] for i in range(len(nodes))]
@@ -80,7 +92,7 @@ class PageRank:
             ans = []
             for row in arr:
                 row_sum = sum(row)
-                if row_sum != 1:
+                if row_sum != 1 and row_sum != 0:
                     curr = []
                     for num in row:
                         curr.append(num/(row_sum ))
@@ -93,80 +105,112 @@ class PageRank:
         
         return M
     
+    @classmethod
+    def convert_connected_nodes_to_sparse_matrix(cls, nodes: List[Undirected_Node]) -> sparse.csr_matrix:
+        """Build the row-normalised adjacency matrix of the nodes in O(E), where row i holds the weights of the edges of nodes[i]
+        rows of nodes without any connections are left as zeros - pagerank spreads their score over every node instead"""
+        node_index = {node: index for index, node in enumerate(nodes)}
+        rows: List[int] = []
+        cols: List[int] = []
+        weights: List[float] = []
         
+        for row, node in enumerate(nodes):
+            connected_nodes = {edge.get_other(node): edge.weight for edge in node.connected}
+            for other, weight in connected_nodes.items():
+                col = node_index.get(other)
+                if col is None: continue # edges to nodes outside of this graph are ignored
+                rows.append(row)
+                cols.append(col)
+                weights.append(weight)
+        
+        A = sparse.csr_matrix((weights, (rows, cols)), shape=(len(nodes), len(nodes)), dtype=np.float64)
+        return normalize_rows(A)
                 
     
     @classmethod
-    def calculate__undirected_no_optimise(cls, nodes: List[Undirected_Node], iterations:int = 20, random_surf_prob:float=0.1, converge_val=0.001):
-        """Calculate scores for nodes given a list of nodes which are connected via directionless connection (a undirected graph)"""
-        M = cls.convert_connected_nodes_to_matrix(nodes)
-        scores = iterative_pr(M, c1=1-random_surf_prob, converge_val=converge_val)
-        return {k:v  for k,v in zip(nodes, scores)}
-        # node_scores = {i:1.0 for i in nodes}
-        
-        # previous_total_score = None
-        # complete = False
-        
-        # while not complete:
-        #     current_total_score = 0
-        #     node_scores_this_iteration = {k:v for k,v in node_scores.items()} # keep a dict to hold the new scores of the nodes, but only update at the end 
-            
-        #     for node in nodes:
-        #         node_score = 0 if node.connected else 1
-        #         for i in node.connected: 
-        #             # add random surfer probability here to mitigate dead end nodes
-        #             if random.random() - random_surf_prob <= 0:
-        #                 random_node = random.choice(nodes)
-        #                 if random_node.connected: i = random.choice(tuple(random_node.connected))
-
-        #             edge_weight = node_scores[i.get_other(node)]
-        #             node_score += edge_weight 
-        #             log.warning(f'{node.name} {i.get_other(node).name} {edge_weight / len(i.get_other(node).connected)}' )
-        #             # node_score += edge_weight 
-                    
-        #         node_scores_this_iteration[node] = node_score / len(nodes)
-        #         current_total_score += node_score
-                
-        #     node_scores = node_scores_this_iteration
-            
-        #     if previous_total_score:
-        #         log.warning(current_total_score - previous_total_score)
-        #     log.error({k.name: v for k,v in node_scores.items()})
-            
-        #     if previous_total_score and abs(current_total_score - previous_total_score) <= convergence_threshold:
-        #         complete = True
-        #     previous_total_score = current_total_score
-        #     iterations -= 1
-        #     if iterations <= 1: complete = True
-            
-        #     log.debug(f'iterations={iterations}')        
-            
-        # return node_scores
-            
-            
+    def calculate__undirected_no_optimise(cls, nodes: List[Undirected_Node], iterations:int = DEFAULT_MAX_ITERATIONS, random_surf_prob:float=0.1, converge_val=0.001,
+                                          backend:Union[str, None]=None,
+                                          personalization:Union[Dict[Undirected_Node, float], List[Dict[Undirected_Node, float]], None]=None):
+        """Calculate scores for nodes given a list of nodes which are connected via directionless connection (a undirected graph)
+        iterations: maximum number of power iterations to run if the scores have not converged by then
+        backend: name of the pagerank backend to use, defaults to PageRank.backend
+        personalization: teleport weight of each node, nodes that are left out get none. a list of these scores the graph
+            once for every personalization in a single run, and returns a list with the scores of each"""
+        if isinstance(personalization, list) and not personalization:
+            raise ValueError('expected at least one personalization, pass None to rank without one')
+        if not nodes: return [{} for _ in personalization] if isinstance(personalization, list) else {}
         
+        teleport = None
+        if isinstance(personalization, list):
+            teleport = np.array([[i.get(node, 0) for i in personalization] for node in nodes], dtype=np.float64).reshape(len(nodes), len(personalization))
+        elif personalization is not None:
+            teleport = np.array([personalization.get(node, 0) for node in nodes], dtype=np.float64)
+        
+        M = cls.convert_connected_nodes_to_sparse_matrix(nodes).T # pagerank expects column i to hold the out-links of node i
+        result = run_pagerank(M, c1=1-random_surf_prob, converge_val=converge_val, max_iterations=iterations,
+                              backend=backend or cls.backend, personalization=teleport)
+        log.debug(f'pagerank finished after {result.iterations} iterations')
+        if isinstance(personalization, list):
+            return [{k:float(v) for k,v in zip(nodes, column)} for column in result.scores.T]
+        return {k:float(v)  for k,v in zip(nodes, result.scores)}
+    
     @classmethod
-    def calculate__directed_no_optimise(cls, nodes: List['Directed_Node'], iterations:int = 10):
-        raise NotImplementedError
-    #     """Calculate scores for nodes given a list of nodes which are connected via one-way connections (a directed graph)"""
-    #     node_scores = {i:1 for i in nodes}
-        
-    #     complete = False
-    #     current_total_score = None
-        
-    #     while not complete:
-    #         current_total_score = 0
-    #         for node in nodes:
-    #             node_score =  sum(i.weight for i in node.in_set)
-    #             node_scores[node] = node_score
-                
-    #             current_total_score += node_score
-            
-    #         iterations -= 1
-    #         if iterations <= 1: complete = True
-            
-    #     log.debug(f'iterations={iterations}')        
-    #     return node_scores
+    def calculate__compact_graph(cls, graph: 'Compact_Graph', iterations:int = DEFAULT_MAX_ITERATIONS, random_surf_prob:float=0.1, converge_val=0.001,
+                                 backend:Union[str, None]=None, personalization:Union[np.ndarray, None]=None) -> np.ndarray:
+        """Calculate scores for the nodes of a Compact_Graph, returns an array of scores indexed by node id
+        personalization: teleport weights indexed by node id. a (nodes, k) matrix of k personalization vectors returns a (nodes, k) matrix of scores"""
+        return cls.run__compact_graph(graph, iterations, random_surf_prob, converge_val, backend, personalization).scores
+    
+    @classmethod
+    def run__compact_graph(cls, graph: 'Compact_Graph', iterations:int = DEFAULT_MAX_ITERATIONS, random_surf_prob:float=0.1, converge_val=0.001,
+                           backend:Union[str, None]=None, personalization:Union[np.ndarray, None]=None,
+                           initial_scores:Union[np.ndarray, None]=None) -> PowerIterationResult:
+        """calculate__compact_graph, returning the number of iterations it took as well
+        initial_scores: scores indexed by node id to start from, e.g. the scores of an earlier version of the graph"""
+        if not graph.num_nodes:
+            return PowerIterationResult(np.zeros((0, np.shape(personalization)[1]) if np.ndim(personalization) == 2 else 0), 0, True)
+        
+        M = normalize_rows(graph.adjacency_matrix()).T
+        result = run_pagerank(M, c1=1-random_surf_prob, converge_val=converge_val, max_iterations=iterations,
+                              backend=backend or cls.backend, personalization=personalization, initial_scores=initial_scores)
+        log.debug(f'pagerank finished after {result.iterations} iterations')
+        return result
+        
+    @classmethod
+    def convert_directed_nodes_to_sparse_matrix(cls, nodes: List[Directed_Node]) -> sparse.csr_matrix:
+        """Build the row-normalised adjacency matrix of directed nodes in O(E), where row i holds the weights of the edges out of nodes[i]
+        nodes without out-links are left as zero rows"""
+        node_index = {node: index for index, node in enumerate(nodes)}
+        rows: List[int] = []
+        cols: List[int] = []
+        weights: List[float] = []
+        
+        for row, node in enumerate(nodes):
+            for edge in node.out_set:
+                col = node_index.get(edge.to_node)
+                if col is None: continue # edges to nodes outside of this graph are ignored
+                rows.append(row)
+                cols.append(col)
+                weights.append(edge.weight)
+        
+        A = sparse.csr_matrix((weights, (rows, cols)), shape=(len(nodes), len(nodes)), dtype=np.float64)
+        return normalize_rows(A)
+        
+    @classmethod
+    def calculate__directed_no_optimise(cls, nodes: List['Directed_Node'], iterations:int = DEFAULT_MAX_ITERATIONS, random_surf_prob:float=0.1, converge_val=0.001,
+                                        backend:Union[str, None]=None, personalization:Union[Dict['Directed_Node', float], None]=None):
+        """Calculate scores for nodes given a list of nodes which are connected via one-way connections (a directed graph)
+        a node passes its score on along its out-links in proportion to their weights. nodes without out-links spread their score
+        over the teleport distribution, so the total score stays 1
+        takes the same arguments as calculate__undirected_no_optimise"""
+        if not nodes: return {}
+        
+        teleport = None if personalization is None else np.array([personalization.get(node, 0) for node in nodes], dtype=np.float64)
+        M = cls.convert_directed_nodes_to_sparse_matrix(nodes).T # pagerank expects column i to hold the out-links of node i
+        result = run_pagerank(M, c1=1-random_surf_prob, converge_val=converge_val, max_iterations=iterations,
+                              backend=backend or cls.backend, personalization=teleport)
+        log.debug(f'pagerank finished after {result.iterations} iterations')
+        return {k:float(v)  for k,v in zip(nodes, result.scores)}
 
 @dataclass
 class Directed_Node:
@@ -187,9 +231,22 @@ class Directed_Node:
         
     def __hash__(self) -> int:
         return hash(self.id)
+    
+    def __eq__(self, __value: object) -> bool:
+        return isinstance(__value, Directed_Node) and self.id == __value.id
+    
+    def __repr__(self) -> str:
+        return f'Directed Node {self.name}: {[i.to_node.name for i in self.out_set]}'
 
 @dataclass
 class Directed_Edge:
     from_node: Directed_Node
     to_node  : Directed_Node
-    weight: int = 1
\ No newline at end of file
+    weight: Union[int, float] = 1
+    
+    # edges are identified by the nodes they connect, so adding an edge again between the same nodes keeps the first one
+    def __hash__(self) -> int:
+        return hash((self.from_node.id, self.to_node.id))
+    
+    def __eq__(self, __value: object) -> bool:
+        return isinstance(__value, Directed_Edge) and (self.from_node.id, self.to_node.id) == (__value.from_node.id, __value.to_node.id)
\ No newline at end of file
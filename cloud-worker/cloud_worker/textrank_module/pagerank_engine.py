@@ -0,0 +1,158 @@
+"""
+Vectorised power iteration for PageRank.
+
+Takes the same column-stochastic matrix as pagerank_wt.iterative_pr (M[row][col] is the probability of moving from col to row),
+either as a list of lists, a numpy array or a scipy sparse matrix. The backend used is picked from PAGERANK_BACKENDS.
+
+Teleports go to every node with the same probability, unless a personalization is given. Several personalization vectors
+over the same graph are iterated together as the columns of one matrix, so the graph is only multiplied once per iteration.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Union
+
+import numpy as np
+from scipy import sparse
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_ITERATIONS   = 100
+SPARSE_DENSITY_THRESHOLD = 0.1 # the 'auto' backend switches to sparse matrices when at most this fraction of cells are non-zero
+
+Matrix = Union[List[List[Union[int, float]]], np.ndarray, sparse.spmatrix]
+
+
+@dataclass
+class PowerIterationResult:
+    scores:     np.ndarray # one score per node, or a (nodes, vectors) matrix when several personalization vectors were given
+    iterations: int
+    converged:  bool
+
+
+def teleport_matrix(personalization: Union[np.ndarray, None], num_of_pages: int) -> np.ndarray:
+    """(num_of_pages, number of vectors) matrix with one teleport distribution per column
+    personalization: non-negative weights of the nodes, either one vector or a (num_of_pages, k) matrix with one vector per column.
+    weights are scaled to sum to 1, and a vector without any weight teleports uniformly. a matrix without any columns is rejected"""
+    if personalization is None:
+        return np.full((num_of_pages, 1), 1 / num_of_pages)
+
+    teleport = np.array(personalization, dtype=np.float64)
+    if teleport.ndim == 1: teleport = teleport[:, None]
+    if teleport.ndim != 2 or teleport.shape[0] != num_of_pages:
+        raise ValueError(f'expected personalization of {num_of_pages} nodes, got shape {np.shape(personalization)}')
+    if teleport.shape[1] == 0:
+        raise ValueError('expected at least one personalization vector, pass None to teleport uniformly')
+    if (teleport < 0).any() or not np.isfinite(teleport).all():
+        raise ValueError('personalization weights have to be finite and non-negative')
+
+    totals = teleport.sum(axis=0)
+    teleport[:, totals == 0] = 1
+    return teleport / teleport.sum(axis=0)
+
+
+def power_iteration(M: Union[np.ndarray, sparse.spmatrix],
+                    c1: float,
+                    converge_val: float,
+                    max_iterations: int = DEFAULT_MAX_ITERATIONS,
+                    personalization: Union[np.ndarray, None] = None,
+                    initial_scores: Union[np.ndarray, None] = None,
+                    ) -> PowerIterationResult:
+    '''
+    M: column-stochastic transition matrix as a numpy array or scipy sparse matrix
+    c1: probability of following a link instead of teleporting to a random node
+    converge_val: stop once the L1 distance between two iterations is below this value, for every personalization vector
+    max_iterations: stop after this many iterations even if the scores have not converged
+    personalization: teleport weights of the nodes, see teleport_matrix. a (nodes, k) matrix returns a (nodes, k) matrix of scores
+    initial_scores: scores to start iterating from instead of 1/nodes, e.g. the scores of a previous version of the graph.
+        they are scaled to sum to 1, the closer they are to the final scores the fewer iterations it takes to converge
+    '''
+    num_of_pages = M.shape[0]
+    if num_of_pages == 0:
+        return PowerIterationResult(np.zeros(0), 0, True)
+
+    c2 = 1 - c1
+    random_jump_arr = teleport_matrix(personalization, num_of_pages)
+
+    # nodes without any out-links would leak score out of the graph, so their score is spread over the teleport distribution instead
+    dangling = np.asarray(M.sum(axis=0)).ravel() == 0
+    x = np.full(random_jump_arr.shape, 1 / num_of_pages)
+    if initial_scores is not None:
+        x = _initial_scores(initial_scores, random_jump_arr.shape)
+
+    for iteration in range(1, max_iterations + 1):
+        Mx = c1 * (M @ x + x[dangling].sum(axis=0) * random_jump_arr) + c2 * random_jump_arr
+
+        curr_converge = np.abs(Mx - x).sum(axis=0).max()
+        x = Mx
+        if curr_converge < converge_val:
+            return PowerIterationResult(_scores(x, personalization), iteration, True)
+
+    log.warning(f'pagerank did not converge after {max_iterations} iterations (last L1 difference {curr_converge})')
+    return PowerIterationResult(_scores(x, personalization), max_iterations, False)
+
+
+def _initial_scores(initial_scores: np.ndarray, shape) -> np.ndarray:
+    x = np.array(initial_scores, dtype=np.float64).reshape(shape[0], -1)
+    if (x < 0).any() or not np.isfinite(x).all() or (x.sum(axis=0) == 0).any():
+        raise ValueError('initial scores have to be finite, non-negative and not all zero')
+    return np.broadcast_to(x / x.sum(axis=0), shape).copy()
+
+
+def _scores(x: np.ndarray, personalization: Union[np.ndarray, None]) -> np.ndarray:
+    """a single column of scores is returned as a vector, unless a matrix of personalization vectors was given"""
+    return x if np.ndim(personalization) == 2 else x[:, 0]
+
+
+def normalize_rows(A: Union[np.ndarray, sparse.spmatrix]) -> sparse.csr_matrix:
+    """scale every row of A to sum to 1. rows that sum to 0 (nodes without connections) are left as zeros instead of dividing by zero"""
+    A = sparse.csr_matrix(A, dtype=np.float64)
+    row_sums = np.asarray(A.sum(axis=1)).ravel()
+    inverse_row_sums = np.divide(1.0, row_sums, out=np.zeros_like(row_sums), where=row_sums != 0)
+    return sparse.csr_matrix(sparse.diags(inverse_row_sums) @ A)
+
+
+def _dense_backend(M: Matrix, **kwargs) -> PowerIterationResult:
+    M = M.toarray() if sparse.issparse(M) else np.asarray(M, dtype=np.float64)
+    return power_iteration(M, **kwargs)
+
+def _sparse_backend(M: Matrix, **kwargs) -> PowerIterationResult:
+    return power_iteration(sparse.csr_matrix(M, dtype=np.float64), **kwargs)
+
+def _auto_backend(M: Matrix, **kwargs) -> PowerIterationResult:
+    if sparse.issparse(M):
+        density = M.nnz / (M.shape[0] * M.shape[1])
+    else:
+        M = np.asarray(M, dtype=np.float64)
+        density = np.count_nonzero(M) / M.size
+
+    if density <= SPARSE_DENSITY_THRESHOLD:
+        return _sparse_backend(M, **kwargs)
+    return _dense_backend(M, **kwargs)
+
+
+PAGERANK_BACKENDS: Dict[str, Callable[..., PowerIterationResult]] = {
+    'dense':  _dense_backend,
+    'sparse': _sparse_backend,
+    'auto':   _auto_backend,
+}
+
+
+def run_pagerank(M: Matrix,
+                 c1: float,
+                 converge_val: float,
+                 max_iterations: int = DEFAULT_MAX_ITERATIONS,
+                 backend: str = 'auto',
+                 personalization: Union[np.ndarray, None] = None,
+                 initial_scores: Union[np.ndarray, None] = None,
+                 ) -> PowerIterationResult:
+    """run power iteration on M with one of the backends registered in PAGERANK_BACKENDS"""
+    if backend not in PAGERANK_BACKENDS:
+        raise ValueError(f'unknown pagerank backend {backend}, expected one of {list(PAGERANK_BACKENDS)}')
+
+    num_of_pages = M.shape[0] if sparse.issparse(M) else len(M)
+    if num_of_pages == 0:
+        return PowerIterationResult(np.zeros(0), 0, True)
+
+    return PAGERANK_BACKENDS[backend](M, c1=c1, converge_val=converge_val, max_iterations=max_iterations,
+                                      personalization=personalization, initial_scores=initial_scores)
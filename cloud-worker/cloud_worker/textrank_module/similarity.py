@@ -0,0 +1,142 @@
+import logging
+from typing import Callable, Dict, List, Tuple, Union
+
+import numpy as np
+from spacy.tokens import Doc
+
+from cloud_worker.textrank_module.graph import EDGE_DIRECTIONS, Compact_Graph
+
+log = logging.getLogger(__name__)
+
+KNN_BLOCK_SIZE = 1024 # rows of the similarity matrix held at once by the blocked top-k search, it needs block size * sentences floats
+
+
+def sentence_vectors(sentences: List[Doc]) -> np.ndarray:
+    """stack the vectors of the sentences into a (number of sentences, vector width) matrix"""
+    if not sentences: return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack([i.vector for i in sentences]).astype(np.float32, copy=False)
+
+
+def unit_vectors(vectors: np.ndarray) -> np.ndarray:
+    """the rows scaled to length 1, rows without a vector stay zero"""
+    norms = np.linalg.norm(vectors, axis=1)
+    return np.divide(vectors, norms[:, None], out=np.zeros_like(vectors), where=norms[:, None] != 0)
+
+
+def cosine_similarity_matrix(vectors: np.ndarray, others: Union[np.ndarray, None] = None) -> np.ndarray:
+    """cosine similarity of every pair of rows, or of every row of vectors with every row of others.
+    like Doc.similarity, rows without a vector have a similarity of 0 to everything"""
+    units = unit_vectors(vectors)
+    return units @ (units if others is None else unit_vectors(others)).T
+
+
+def sparsify_similarity(similarity: np.ndarray, threshold: float = 0.0, top_k: Union[int, None] = None) -> np.ndarray:
+    """mask of the upper triangle pairs (i < j) that are kept as edges
+    threshold: pairs with a similarity below this are dropped
+    top_k: if given, a pair is only kept if one of its sentences has the other among its top_k most similar sentences"""
+    num_of_sentences = similarity.shape[0]
+    keep = np.triu(similarity >= threshold, k=1)
+
+    if top_k is not None and top_k < num_of_sentences - 1:
+        ranked = similarity.copy()
+        np.fill_diagonal(ranked, -np.inf)
+        top_k_columns = np.argpartition(-ranked, top_k, axis=1)[:, :top_k]
+
+        in_top_k = np.zeros_like(keep)
+        in_top_k[np.arange(num_of_sentences)[:, None], top_k_columns] = True
+        keep &= in_top_k | in_top_k.T
+    return keep
+
+
+Neighbours = Tuple[np.ndarray, np.ndarray, np.ndarray] # (row, neighbour, absolute similarity) for every neighbour found
+
+
+def _blocked_neighbours(units: np.ndarray, top_k: int, block_size: int) -> Neighbours:
+    """the top_k most similar rows of every row, by absolute similarity, computing the similarity matrix block_size rows at a time"""
+    num_of_sentences = len(units)
+    neighbours = np.empty((num_of_sentences, top_k), dtype=np.int64)
+    similarity = np.empty((num_of_sentences, top_k), dtype=np.float32)
+    for start in range(0, num_of_sentences, block_size):
+        block = np.abs(units[start:start + block_size] @ units.T)
+        block[np.arange(len(block)), np.arange(start, start + len(block))] = -np.inf # a sentence is not its own neighbour
+        found = np.argpartition(-block, top_k, axis=1)[:, :top_k]
+        neighbours[start:start + len(block)] = found
+        similarity[start:start + len(block)] = np.take_along_axis(block, found, axis=1)
+    return np.repeat(np.arange(num_of_sentences), top_k), neighbours.ravel(), similarity.ravel()
+
+
+def _faiss_neighbours(units: np.ndarray, top_k: int, block_size: int) -> Neighbours:
+    """the approximate top_k most similar rows of every row from a faiss HNSW index. faiss is optional, so it is only imported here
+    the index holds every row and its negation, so that ranking by inner product ranks by absolute similarity like the blocked search"""
+    import faiss
+    num_of_sentences = len(units)
+    index = faiss.IndexHNSWFlat(units.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+    index.add(np.ascontiguousarray(np.vstack([units, -units]), dtype=np.float32))
+    
+    rows, cols, similarity = [], [], []
+    for start in range(0, num_of_sentences, block_size):
+        found_similarity, found = index.search(np.ascontiguousarray(units[start:start + block_size], dtype=np.float32), top_k + 1)
+        block_rows = np.broadcast_to(np.arange(start, start + len(found))[:, None], found.shape)
+        keep = found >= 0 # -1s pad the rows the index found fewer neighbours for
+        found = found % num_of_sentences # a negated row stands for the row itself
+        keep &= found != block_rows # a sentence is not its own neighbour
+        keep &= np.cumsum(keep, axis=1) <= top_k # like the blocked search, at most top_k neighbours when the sentence itself was not found
+        rows.append(block_rows[keep]); cols.append(found[keep]); similarity.append(np.abs(found_similarity[keep]))
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(similarity)
+
+
+NEIGHBOUR_SEARCHES: Dict[str, Callable[[np.ndarray, int, int], Neighbours]] = {
+    'blocked': _blocked_neighbours,
+    'faiss':   _faiss_neighbours,
+}
+
+
+def top_k_similarity_pairs(vectors: np.ndarray, top_k: int, threshold: float = 0.0,
+                           block_size: int = KNN_BLOCK_SIZE, search: str = 'blocked') -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(first, second, absolute similarity) of the pairs sparsify_similarity keeps for top_k, without the full similarity matrix
+    memory is bounded by block_size * sentences for the search and sentences * top_k for the pairs
+    search: one of NEIGHBOUR_SEARCHES, 'blocked' is exact and 'faiss' is approximate"""
+    if search not in NEIGHBOUR_SEARCHES:
+        raise ValueError(f'unknown neighbour search {search}, expected one of {list(NEIGHBOUR_SEARCHES)}')
+    units = unit_vectors(np.asarray(vectors, dtype=np.float32))
+    rows, cols, similarity = NEIGHBOUR_SEARCHES[search](units, max(min(top_k, len(units) - 1), 0), block_size)
+    
+    # a pair is kept once, whichever of its sentences found the other
+    first, second = np.minimum(rows, cols), np.maximum(rows, cols)
+    _, unique = np.unique(first * len(units) + second, return_index=True)
+    first, second, similarity = first[unique], second[unique], similarity[unique]
+    
+    keep = similarity >= threshold
+    return first[keep], second[keep], similarity[keep]
+
+
+def similarity_graph_from_vectors(names: List[str], vectors: np.ndarray,
+                                  threshold: float = 0.0, top_k: Union[int, None] = None, direction: str = 'undirected',
+                                  search: str = 'blocked') -> Compact_Graph:
+    """connect sentences with edges weighted by the absolute cosine similarity of their vectors. sentences with the same name share a node
+    top_k: connect each sentence only to its top_k most similar sentences, found with search without the full similarity matrix,
+        so long documents are ranked in bounded memory
+    direction: one of EDGE_DIRECTIONS, 'forward' edges go from each sentence to the similar sentences after it,
+        'backward' edges to the ones before it, like a citation of earlier sentences"""
+    if direction not in EDGE_DIRECTIONS:
+        raise ValueError(f'unknown edge direction {direction}, expected one of {EDGE_DIRECTIONS}')
+    graph = Compact_Graph(directed=direction != 'undirected')
+    sentence_ids = np.array([graph.node_id(i) for i in names], dtype=np.int64)
+    if len(names) < 2: return graph
+
+    if top_k is not None and top_k < len(names) - 1:
+        first, second, weight = top_k_similarity_pairs(vectors, top_k, threshold, search=search)
+    else:
+        similarity = np.abs(cosine_similarity_matrix(vectors))
+        first, second = np.nonzero(sparsify_similarity(similarity, threshold)) # first < second, in the order of the sentences
+        weight = similarity[first, second]
+    
+    if direction == 'backward': first, second = second, first
+    graph.add_edges(sentence_ids[first], sentence_ids[second], weight)
+    log.debug(f'similarity graph with {len(names)} sentences and {graph.num_edges} edges')
+    return graph
+
+
+def similarity_graph(sentences: List[Doc], threshold: float = 0.0, top_k: Union[int, None] = None, direction: str = 'undirected',
+                     search: str = 'blocked') -> Compact_Graph:
+    return similarity_graph_from_vectors([i.text for i in sentences], sentence_vectors(sentences), threshold, top_k, direction, search)
@@ -1,8 +1,10 @@
 import logging
 import re
+import threading
 from dataclasses import asdict, dataclass
-from typing import Dict, List, Set, Union
+from typing import Dict, List, Set, Tuple, Union
 
+import numpy as np
 import spacy
 from spacy.tokens import Doc, Span
 
@@ -15,7 +17,18 @@ from .nlp import (
     _remove_stopwords,
     _simple_tokenize,
 )
+from .graph import Compact_Graph
+from .incremental import (
+    Ranking_State,
+    cooccurrence_pair_counts,
+    graph_from_pair_counts,
+    incremental_report,
+    update_pair_counts,
+    warm_start_scores,
+)
 from .pagerank import PageRank, Undirected_Node
+from .similarity import cosine_similarity_matrix, sentence_vectors, similarity_graph
+from .timing import Stage_Timer
 
 """
 TextRank.keyword_extraction__undirected() - return a list of keywords from a string
@@ -23,9 +36,19 @@ TextRank.keyword_extraction__undirected() - return a list of keywords from a str
 
 log = logging.getLogger(__name__)
 
+_NON_ALPHANUMERIC = re.compile(r'[^a-zA-Z0-9 ]')
+
 @dataclass
 class Keyword_Extraction_Result:
-    nodes: List[Undirected_Node]
+    nodes:      List[dict]
+    keyphrases: Dict[str, float]
+    timings:    dict
+
+
+@dataclass
+class Sentence_Extraction_Result:
+    nodes:    List[dict]
+    clusters: List[Set[int]] # sets of node ids from nodes
 
 
 class Singleton(type):
@@ -36,38 +59,154 @@ class Singleton(type):
         return cls._instances[cls]
     
 
+# pipeline components that each kind of task runs, every other component is disabled for its calls
+#   keywords:      part of speech tags, predicted by the tagger from tok2vec and mapped to pos by the attribute ruler
+#   sentence_list: only the word vectors, which are looked up from the vocab without running any component
+# sentences need sentence boundaries and the vectors, the components for the boundaries are in SENTENCE_SEGMENTERS
+TASK_COMPONENTS = {
+    'keywords':      ('tok2vec', 'tagger', 'attribute_ruler'),
+    'sentence_list': (),
+}
+SENTENCE_SEGMENTERS = {
+    'parser':      ('tok2vec', 'parser'), # the dependency parse, the most accurate and the slowest
+    'senter':      ('senter',),           # the pipeline's own sentence recognizer, disabled by default in the trained pipelines
+    'sentencizer': ('sentencizer',),      # rule based, splits on punctuation
+}
+
+
 class TextRank(metaclass=Singleton):
+    spacy_model = 'en_core_web_lg'
+    excluded_components = ('ner', 'lemmatizer') # not used by any task, so they are never loaded
+    sentence_segmenter  = 'parser' # one of SENTENCE_SEGMENTERS, read when the model is loaded
+    sentence_top_k: Union[int, None] = None # top_k of sentence graphs when a method is not given one, None connects every pair of sentences
+    neighbour_search    = 'blocked' # one of NEIGHBOUR_SEARCHES, how the top_k most similar sentences are found
+    
     def __init__(self) -> None:
-        log.info('loading spacy model...')
-        self.nlp = spacy.load('en_core_web_lg') # generate a spacy natural language processing object
+        self._nlp: Union[spacy.language.Language, None] = None
+        self._nlp_lock = threading.Lock()
+        self._disabled_components: Dict[str, List[str]] = {}
+        
+    @property
+    def nlp(self) -> spacy.language.Language:
+        """spacy natural language processing object, loaded on first use so that importing TextRank stays cheap"""
+        if self._nlp is None:
+            with self._nlp_lock:
+                if self._nlp is None:
+                    log.info('loading spacy model...')
+                    self._nlp = self._load_nlp()
+        return self._nlp
+    
+    @nlp.setter
+    def nlp(self, nlp: spacy.language.Language):
+        self._nlp = nlp
+        self._disabled_components = {}
+        
+    def _load_nlp(self) -> spacy.language.Language:
+        if self.sentence_segmenter not in SENTENCE_SEGMENTERS:
+            raise ValueError(f'unknown sentence segmenter {self.sentence_segmenter}, expected one of {list(SENTENCE_SEGMENTERS)}')
+        
+        nlp = spacy.load(self.spacy_model, exclude=list(self.excluded_components))
+        if self.sentence_segmenter == 'senter' and 'senter' in nlp.disabled:
+            nlp.enable_pipe('senter')
+        elif self.sentence_segmenter == 'sentencizer' and 'sentencizer' not in nlp.component_names:
+            nlp.add_pipe('sentencizer')
+        
+        # no task needs the parser once something else sets the sentence boundaries
+        if self.sentence_segmenter != 'parser' and 'parser' in nlp.pipe_names:
+            nlp.disable_pipe('parser')
+        return nlp
+    
+    def disabled_components(self, task: str) -> List[str]:
+        """the enabled components of the pipeline that task does not need"""
+        if task not in self._disabled_components:
+            needed = SENTENCE_SEGMENTERS[self.sentence_segmenter] if task == 'sentences' else TASK_COMPONENTS[task]
+            self._disabled_components[task] = [i for i in self.nlp.pipe_names if i not in needed]
+        return self._disabled_components[task]
+    
+    def parse(self, text: str, task: str) -> Doc:
+        """parse text with only the components task needs"""
+        return self.nlp(text, disable=self.disabled_components(task))
+    
+    def parse_many(self, texts: List[str], task: str, batch_size: int = 32, n_process: int = 1) -> List[Doc]:
+        """parse texts together with nlp.pipe, with only the components task needs
+        n_process above 1 parses in that many child processes, which only pays off for large batches"""
+        return list(self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process, disable=self.disabled_components(task)))
+    
+    def sentence_extraction__undirected(self, text: Union[str, List[str]], converge_val:float=0.01,
+                                        similarity_threshold:float=0.0, top_k:Union[int, None]=None, direction:str='undirected'):
+        """rank sentences by their similarity to the other sentences
+        similarity_threshold: sentence pairs less similar than this are not connected
+        top_k: only connect each sentence to its top_k most similar sentences
+        direction: 'forward' points each sentence at the similar sentences after it, 'backward' at the ones before it"""
+        graph = self._generate_sentence_graph(text, similarity_threshold, top_k, direction)
+        scores = PageRank.calculate__compact_graph(graph, converge_val=converge_val)
+        
+        return self._rank_graph_nodes(graph, scores)
+    
+    def sentence_extraction__queries(self, text: Union[str, List[str]], queries: List[str], converge_val:float=0.01,
+                                     similarity_threshold:float=0.0, top_k:Union[int, None]=None, direction:str='undirected') -> List[List[dict]]:
+        """rank sentences once for every query, for query focused summaries. pagerank teleports to sentences in proportion to
+        their similarity to the query, and every query is scored in the same pagerank run over one sentence graph
+        returns the ranked sentences of each query, in the order of queries"""
+        if not queries: raise ValueError('expected at least one query, use sentence_extraction__undirected to rank without one')
+        sentences = self._parse_sentences(text)
+        graph = self._generate_graph_from_similarity(sentences, similarity_threshold, top_k, direction)
+        personalization = self._query_teleport_weights(graph, sentences, queries)
+        scores = PageRank.calculate__compact_graph(graph, converge_val=converge_val, personalization=personalization)
+        
+        return [self._rank_graph_nodes(graph, scores[:, i]) for i in range(len(queries))]
+    
+    def sentence_extraction__incremental(self, text: Union[str, List[str]], previous: Union[Ranking_State, None]=None, converge_val:float=0.01,
+                                         similarity_threshold:float=0.0, top_k:Union[int, None]=None) -> Tuple[List[dict], Ranking_State]:
+        """sentence_extraction__undirected for a new version of a document, starting pagerank from the scores of its previous version
+        returns the ranked sentences and the state to pass as previous for the next version, whose report says how many iterations were saved"""
+        graph = self._generate_sentence_graph(text, similarity_threshold, top_k)
+        result = PageRank.run__compact_graph(graph, converge_val=converge_val,
+                                             initial_scores=warm_start_scores(graph, previous) if previous and graph.num_nodes else None)
+        
+        state = Ranking_State(names=graph.names, scores=result.scores,
+                              cold_iterations=previous.cold_iterations if previous else result.iterations,
+                              report=incremental_report(previous, result.iterations))
+        return self._rank_graph_nodes(graph, result.scores), state
+    
+    def _query_teleport_weights(self, graph: Compact_Graph, sentences: List[Doc], queries: List[str]) -> np.ndarray:
+        """(nodes, queries) matrix of the similarity of every sentence to every query, where negative similarities count as none"""
+        node_sentences: Dict[int, Doc] = {}
+        for sentence in sentences:
+            node_sentences.setdefault(graph.ids[sentence.text], sentence) # sentences with the same text share a node
+        
+        query_docs = self.parse_many([_remove_non_ascii(_decode_unicode(i)) for i in queries], 'sentence_list')
+        similarity = cosine_similarity_matrix(sentence_vectors([node_sentences[i] for i in range(graph.num_nodes)]), sentence_vectors(query_docs))
+        return np.clip(similarity, 0, None)
+    
+    def sentence_extraction_with_clusters(self, text: Union[str, List[str]], converge_val:float=0.01,
+                                          similarity_threshold:float=0.0, top_k:Union[int, None]=None) -> Sentence_Extraction_Result:
+        """rank sentences and group them into clusters, parsing the sentences and building the similarity graph only once
+        the ids in clusters are the ids of the ranked nodes"""
+        graph = self._generate_sentence_graph(text, similarity_threshold, top_k)
+        scores = PageRank.calculate__compact_graph(graph, converge_val=converge_val)
+        
+        return Sentence_Extraction_Result(nodes=self._rank_graph_nodes(graph, scores), clusters=cluster_sentences(graph))
     
-    def sentence_extraction__undirected(self, text: Union[str, List[str]], converge_val:float=0.01):
+    def _generate_sentence_graph(self, text: Union[str, List[str]], similarity_threshold:float=0.0, top_k:Union[int, None]=None,
+                                 direction:str='undirected') -> Compact_Graph:
+        return self._generate_graph_from_similarity(self._parse_sentences(text), similarity_threshold, top_k, direction)
+    
+    def _parse_sentences(self, text: Union[str, List[str]]) -> List[Doc]:
+        """the sentences of a text, or a list of sentences, as separate docs"""
         if isinstance(text, str):
             text = _decode_unicode(text)
             text = _remove_non_ascii(text)
-            nodes = [i.as_doc() for i in self.nlp(text).sents]
+            nodes = [i.as_doc() for i in self.parse(text, 'sentences').sents]
         
         elif isinstance(text, List):
             text = [_decode_unicode(i) for i in text]
             text = [_remove_non_ascii(i) for i in text]
-            nodes = [self.nlp(i) for i in text]
+            nodes = self.parse_many(text, 'sentence_list')
             
         else: raise ValueError( f'expected str, instead got {type(text)}')
         
-        nodes = self._generate_nodes_from_similarity(nodes)
-        
-        result = PageRank.calculate__undirected_no_optimise(nodes, converge_val=converge_val)
-        
-        sorted_result = sorted(result.items(), key=lambda x:x[1], reverse=True)
-        result_nodes: List[dict] = []
-        
-        for node,score in sorted_result:
-            # convert node to dict for serialization
-                node_dict = node.asdict()
-                node_dict['score'] = score
-                result_nodes.append(node_dict)
-                
-        return result_nodes
+        return nodes
         
     
     def keyword_extraction__undirected(self, string:str,
@@ -78,141 +217,204 @@ class TextRank(metaclass=Singleton):
                                                             #  'VERB','ADV'
                                                              ],
                                        damping_factor=0.1,
-                                       cooccurence_value=2
+                                       cooccurence_value=2,
+                                       timer:Union[Stage_Timer, None]=None,
+                                       seed_keywords:Union[List[str], None]=None,
+                                       direction:str='undirected',
                                        ):
-        
+        """seed_keywords: biases the ranking towards these words and the words around them, by teleporting only to them
+        direction: 'forward' points each word at the words that follow it, 'backward' at the words before it"""
+        timer = timer or Stage_Timer()
         number_to_keep = number_to_keep or len(string) // 3 # as defined in the paper
-        log.debug([(i.text, i.pos_) for i in self.nlp(string)])
-        filtered_text = _decode_unicode(string)
-        filtered_text = _remove_non_ascii(filtered_text)
-        filtered_text = ' '.join([i.text for i in self.nlp(string) if i.pos_ in pos_tags])
-        filtered_text = _remove_stopwords(filtered_text)
-        filtered_text = _simple_tokenize(filtered_text)
-        if not any(filtered_text): return []
-        
-        nodes = self._generate_nodes_from_cooccurence(filtered_text, cooccurence_value)
-        result = PageRank.calculate__undirected_no_optimise(nodes, converge_val=converge_val, random_surf_prob=damping_factor)
+        doc = self._parse_for_keywords(string, timer)
+        return self._keyword_extraction_from_doc(doc, converge_val, number_to_keep, pos_tags, damping_factor, cooccurence_value, timer, seed_keywords, direction)
+    
+    def keyword_extraction_with_keyphrases(self, string:str, **kwargs) -> Keyword_Extraction_Result:
+        """extract keywords and combine them into keyphrases, parsing the text with spacy only once
+        accepts the same keyword arguments as keyword_extraction__undirected"""
+        timer = Stage_Timer()
+        doc = self._parse_for_keywords(string, timer)
+        result = self._keyphrase_extraction_from_doc(string, doc, timer, **kwargs)
         
-        sorted_result = sorted(result.items(), key=lambda x:x[1], reverse=True)
-        sorted_result = sorted_result[:number_to_keep]
+        log.info(f'keyword extraction timings: {timer}')
+        return result
+    
+    def keyword_extraction_with_keyphrases__batch(self, strings:List[str], batch_size:int=32, n_process:int=1, **kwargs) -> List[Keyword_Extraction_Result]:
+        """keyword_extraction_with_keyphrases for many texts, which are parsed together with nlp.pipe
+        the timings of each result do not include the shared clean and parse stages"""
+        batch_timer = Stage_Timer()
+        with batch_timer.stage('clean'):
+            filtered_texts = [_remove_non_ascii(_decode_unicode(i)) for i in strings]
+        with batch_timer.stage('parse'):
+            docs = self.parse_many(filtered_texts, 'keywords', batch_size=batch_size, n_process=n_process)
         
-        result_nodes: List[Dict[str,float]] = []
+        results = [self._keyphrase_extraction_from_doc(string, doc, Stage_Timer(), **kwargs) for string, doc in zip(strings, docs)]
+        log.info(f'keyword extraction of {len(strings)} texts, shared timings: {batch_timer}')
+        return results
+    
+    def _parse_for_keywords(self, string:str, timer:Stage_Timer) -> Doc:
+        with timer.stage('clean'):
+            filtered_text = _decode_unicode(string)
+            filtered_text = _remove_non_ascii(filtered_text)
+        with timer.stage('parse'):
+            doc = self.parse(filtered_text, 'keywords')
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug([(i.text, i.pos_) for i in doc])
+        return doc
+    
+    def keyword_extraction__incremental(self, string:str, previous:Union[Ranking_State, None]=None,
+                                        converge_val:float=0.01,
+                                        number_to_keep: int=0,
+                                        pos_tags:List[str] = ['NOUN','ADJ', 'PROPN'],
+                                        damping_factor=0.1,
+                                        cooccurence_value=2,
+                                        seed_keywords:Union[List[str], None]=None,
+                                        ) -> Tuple[Keyword_Extraction_Result, Ranking_State]:
+        """keyword_extraction_with_keyphrases for a new version of a document, given the state its previous version left
+        the co-occurrence counts are updated with the pairs the edit removed and added, and pagerank starts from the previous scores
+        returns the result and the state to pass as previous for the next version, whose report says how many iterations were saved"""
+        timer = Stage_Timer()
+        number_to_keep = number_to_keep or len(string) // 3
+        doc = self._parse_for_keywords(string, timer)
         
-        for node,score in sorted_result:
-            # convert node to dict for serialization
-                node_dict = node.asdict()
-                node_dict['score'] = score
-                result_nodes.append(node_dict)
-        return result_nodes
-            
-    def _generate_nodes_from_similarity(self, sentences:List[Doc], threshold: float = 0.5):
-        node_dict:Dict[str, Undirected_Node] = {}
-        # helper function to get a Node from the dict or generate a new Node if one doesn't exist
-        def get_from_node_dict(token_orth:str) -> Undirected_Node:
-            if token_orth in node_dict: return node_dict[token_orth]
+        with timer.stage('tokenize'):
+            tokens = self._keyword_tokens(doc, pos_tags)
+        with timer.stage('graph'):
+            if previous is not None and previous.pair_counts is not None and previous.pair_counts.window == cooccurence_value:
+                pair_counts = update_pair_counts(previous.pair_counts, tokens)
             else:
-                node_dict[token_orth] = Undirected_Node(name=token_orth)
-                return node_dict[token_orth]
+                pair_counts = cooccurrence_pair_counts(tokens, cooccurence_value)
+            graph = graph_from_pair_counts(pair_counts)
+        with timer.stage('pagerank'):
+            personalization = self._keyword_teleport_weights(graph, seed_keywords) if seed_keywords else None
+            result = PageRank.run__compact_graph(graph, converge_val=converge_val, random_surf_prob=damping_factor, personalization=personalization,
+                                                 initial_scores=warm_start_scores(graph, previous) if previous and graph.num_nodes else None)
         
+        nodes = self._rank_graph_nodes(graph, result.scores)[:number_to_keep]
+        with timer.stage('keyphrases'):
+            keyphrases = self.regenerate_keyphrases({i['name']: i['score'] for i in nodes}, doc.text)
         
-        for idx, i in enumerate(sentences):
-            i_node = get_from_node_dict(i.text)
-            for jdx, j in enumerate(sentences[idx+1:]):
-                j_node = get_from_node_dict(j.text)
-                score = abs(i.similarity(j))
-                i_node.to(j_node, score)
-        return list(node_dict.values())
+        state = Ranking_State(names=graph.names, scores=result.scores,
+                              cold_iterations=previous.cold_iterations if previous else result.iterations,
+                              pair_counts=pair_counts,
+                              report=incremental_report(previous, result.iterations))
+        log.info(f'incremental keyword extraction timings: {timer}, {state.report}')
+        return Keyword_Extraction_Result(nodes=nodes, keyphrases=keyphrases, timings=timer.asdict()), state
     
-    def _generate_nodes_from_cooccurence(self, tokens: List[str],
-                                         cooccurence_value=2) -> List[Undirected_Node]:
-        """given a string, use coccurence to create an undirected graph where nodes are connected if they are coocurrent"""
-        node_dict = {}
+    def _keyphrase_extraction_from_doc(self, string:str, doc:Doc, timer:Stage_Timer, **kwargs) -> Keyword_Extraction_Result:
+        number_to_keep = kwargs.pop('number_to_keep', 0) or len(string) // 3
+        nodes = self._keyword_extraction_from_doc(doc, number_to_keep=number_to_keep, timer=timer, **kwargs)
+        with timer.stage('keyphrases'):
+            only_text_and_score:Dict[str, float] = {i['name']: i['score'] for i in nodes}
+            keyphrases = self.regenerate_keyphrases(only_text_and_score, doc.text)
+        return Keyword_Extraction_Result(nodes=nodes, keyphrases=keyphrases, timings=timer.asdict())
+    
+    def _keyword_extraction_from_doc(self, doc:Doc,
+                                     converge_val:float=0.01,
+                                     number_to_keep: int=0,
+                                     pos_tags:List[str] = ['NOUN','ADJ', 'PROPN'],
+                                     damping_factor=0.1,
+                                     cooccurence_value=2,
+                                     timer:Union[Stage_Timer, None]=None,
+                                     seed_keywords:Union[List[str], None]=None,
+                                     direction:str='undirected',
+                                     ) -> List[dict]:
+        timer = timer or Stage_Timer()
+        number_to_keep = number_to_keep or len(doc.text) // 3
         
-        # helper function to get a Node from the dict or generate a new Node if one doesn't exist
-        def get_from_node_dict(token_orth:str):
-            if token_orth in node_dict: return node_dict[token_orth]
-            else:
-                node_dict[token_orth] = Undirected_Node(name=token_orth)
-                return node_dict[token_orth]
+        with timer.stage('tokenize'):
+            filtered_text = self._keyword_tokens(doc, pos_tags)
+        if not filtered_text: return []
         
+        with timer.stage('graph'):
+            graph = self._generate_graph_from_cooccurence(filtered_text, cooccurence_value, direction)
+        with timer.stage('pagerank'):
+            personalization = self._keyword_teleport_weights(graph, seed_keywords) if seed_keywords else None
+            scores = PageRank.calculate__compact_graph(graph, converge_val=converge_val, random_surf_prob=damping_factor,
+                                                       personalization=personalization)
         
-        for index,token in enumerate(tokens):
-            node = get_from_node_dict(token)
-            previous, next = self._find_cooccurent(tokens, index, cooccurence_value=cooccurence_value)
-            # log.error(previous)
-            # log.error(next)
-            
-            nodes = [get_from_node_dict(token) for token in (*previous, *next)]
-            # log.error(nodes)
-            # log.error('\n')
+        return self._rank_graph_nodes(graph, scores)[:number_to_keep]
+    
+    def _keyword_tokens(self, doc:Doc, pos_tags:List[str]) -> List[str]:
+        """the tokens of the words with one of pos_tags, without stopwords. the keyword graph is built from these"""
+        filtered_text = ' '.join([i.text for i in doc if i.pos_ in pos_tags])
+        filtered_text = _remove_stopwords(filtered_text)
+        filtered_text = _simple_tokenize(filtered_text)
+        return filtered_text if any(filtered_text) else []
+    
+    def _keyword_teleport_weights(self, graph: Compact_Graph, seed_keywords: List[str]) -> np.ndarray:
+        """teleport only to the nodes of the seed keywords, or to every node if none of them are in the text"""
+        seeds = {i.lower() for i in seed_keywords}
+        weights = np.array([i.lower() in seeds for i in graph.names], dtype=np.float64)
+        if not weights.any(): log.info(f'none of the seed keywords {seed_keywords} are in the text')
+        return weights
+    
+    def _rank_graph_nodes(self, graph: Compact_Graph, scores) -> List[dict]:
+        """serialise the nodes of the graph with their scores, highest score first"""
+        result_nodes: List[dict] = graph.nodes_asdict()
+        for node_dict, score in zip(result_nodes, scores):
+            node_dict['score'] = float(score)
+        return sorted(result_nodes, key=lambda x:x['score'], reverse=True)
             
-            for other_node in nodes:
-                node.to(other_node)
-                
-        return list(node_dict.values())
+    def _generate_nodes_from_similarity(self, sentences:List[Doc], threshold: float = 0.0, top_k:Union[int, None]=None) -> List[Undirected_Node]:
+        return self._generate_graph_from_similarity(sentences, threshold, top_k).to_undirected_nodes()
+    
+    def _generate_graph_from_similarity(self, sentences:List[Doc], threshold: float = 0.0, top_k:Union[int, None]=None,
+                                        direction:str='undirected') -> Compact_Graph:
+        """connect pairs of sentences with an edge weighted by their similarity, computed for every pair at once from the stacked sentence vectors.
+        sentences with the same text share a node. with top_k, or sentence_top_k, each sentence is only connected to its most similar sentences,
+        found in bounded memory, so the graph of a long document has sentences * top_k edges instead of sentences squared.
+        a small top_k changes which sentences rank highest, see SENTENCE_TOP_K"""
+        top_k = top_k if top_k is not None else self.sentence_top_k
+        return similarity_graph(sentences, threshold, top_k, direction, self.neighbour_search)
+    
+    def _generate_nodes_from_cooccurence(self, tokens: List[str],
+                                         cooccurence_value=2) -> List[Undirected_Node]:
+        return self._generate_graph_from_cooccurence(tokens, cooccurence_value).to_undirected_nodes()
+    
+    def _generate_graph_from_cooccurence(self, tokens: List[str],
+                                         cooccurence_value=2, direction:str='undirected') -> Compact_Graph:
+        """given a list of tokens, create a graph where tokens are connected if they are at most cooccurence_value tokens apart,
+        with edges weighted by the number of times the two tokens co-occur. direction is one of EDGE_DIRECTIONS"""
+        return Compact_Graph.from_cooccurrence(tokens, window=cooccurence_value, direction=direction)
         
     def regenerate_keyphrases(self, keyword_dict:Dict[str, int], original_text:str):
-        """combine keywords that are next to each other"""
-        keywords = set(i.lower() for i in keyword_dict)
+        """combine keywords that are next to each other in the text into keyphrases, scored by their best keyword
+        a keyphrase starts at a word that is a keyword, and continues over the following words that are keywords once their
+        punctuation is removed. it ends before the first word that is not, or after a word with a comma or full stop (line breaks count as commas)
+        every word is classified up front, so the phrases are assembled in a single pass over the words"""
+        scores = {k.lower(): v for k,v in keyword_dict.items()}
         log.debug(keyword_dict)
-        keyword_dict_copy = {k.lower():v for k,v in keyword_dict.items()}
         
-        original_text = original_text.lower()
-        split_text = original_text.replace('\n',', ').split(' ')
+        text = original_text.lower().replace('\n', ', ')
+        words = text.split(' ')
+        cleaned_words = _NON_ALPHANUMERIC.sub('', text).split(' ') # spaces are kept, so the cleaned words line up with words
         
-        results:Dict[str, int] = {}
-        keywords_used = set()
+        starts_phrase    = [i in scores for i in words]
+        continues_phrase = [bool(i) and i in scores for i in cleaned_words]
+        ends_phrase      = [',' in i or '.' in i for i in words]
         
-        # find keyphrases in the text by checking for contiguous keywords
-        index = 0
-        while index < len(split_text):
-            token = split_text[index]
-            
-            if token not in keywords: 
-                # the current word is not part of a keyphrase
-                index+=1
-                continue 
-            
-            keywords_used.add(token)
-            max_score = keyword_dict_copy[token]
-            keyphrase = [token]
-            increment = 1
-            
-            while True:
-                next_token = split_text[index+increment] if index+increment <= len(split_text)-1 else ''
-                cleaned_next_token = re.sub(r'[^a-zA-Z0-9]', '', next_token)
-                
-                if not cleaned_next_token or cleaned_next_token not in keywords: # terminating condition - add phrase to results
-                    log.debug(f'adding keyphrase {keyphrase} because not in keywords')
-                    results[' '.join(keyphrase)] = max_score
-                    break
-                
-                score = keyword_dict_copy.get(cleaned_next_token) or keyword_dict_copy.get(next_token) or -1
-                max_score = max(score, max_score)
-                
-                keywords_used.add(cleaned_next_token)
-                keyphrase.append(cleaned_next_token)
-                
-                if (any(i in next_token for i in [',', '.', '\n'])): # if the word has either comma or fullstop, then end the keyphrase
-                    log.debug(f'adding keyphrase {keyphrase} because terminator')
-                    results[' '.join(keyphrase)] = max_score
-                    break
-                
-                increment += 1
-            
-            index+=increment
+        results:Dict[str, int] = {}
+        keyphrase: List[str] = []
+        max_score = 0
+        for index, word in enumerate(words):
+            if keyphrase:
+                if continues_phrase[index]:
+                    cleaned_word = cleaned_words[index]
+                    max_score = max(scores.get(cleaned_word) or scores.get(word) or -1, max_score)
+                    keyphrase.append(cleaned_word)
+                    if not ends_phrase[index]: continue
+                results[' '.join(keyphrase)] = max_score
+                keyphrase = []
             
-        results = {k:v for k,v in results.items() if len(k.split(' ')) > 1}
+            # the word that ended a keyphrase can start the next one
+            if starts_phrase[index]:
+                keyphrase = [word]
+                max_score = scores[word]
         
-        return results
-            
-            
-            
-            
-            # if any(token in l for l in keywords) and index<len(tokenized_text)-1:
-            #     next_token = tokenized_text[index+1]
-            #     if any(next_token in l for l in keywords):
-            #         pass
+        if keyphrase: results[' '.join(keyphrase)] = max_score
+        
+        return {k:v for k,v in results.items() if len(k.split(' ')) > 1}
     
     def _tokenize(self, string:str):
         """tokenize text"""
@@ -222,6 +424,6 @@ class TextRank(metaclass=Singleton):
         """returns the previous-n and next-n tokens 
         eg (0,1,2,3,4) with 2 as index returns ([0,1], (3,4))"""
         if isinstance(tokens, str): tokens = self._tokenize(tokens)
-        return (tokens[index-cooccurence_value:index], tokens[index+1:index+2+1])
+        return (tokens[max(index-cooccurence_value, 0):index], tokens[index+1:index+cooccurence_value+1])
     
     
@@ -0,0 +1,28 @@
+import contextlib
+import logging
+import time
+from typing import Dict
+
+log = logging.getLogger(__name__)
+
+
+class Stage_Timer:
+    """accumulates the wall-clock time and number of calls of each named stage of a job"""
+    def __init__(self) -> None:
+        self.seconds: Dict[str, float] = {}
+        self.calls:   Dict[str, int]   = {}
+        
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+            self.calls[name]   = self.calls.get(name, 0) + 1
+            
+    def asdict(self):
+        return {name: {'seconds': seconds, 'calls': self.calls[name]} for name, seconds in self.seconds.items()}
+    
+    def __repr__(self) -> str:
+        return ' | '.join(f'{name}: {seconds*1000:.1f}ms x{self.calls[name]}' for name, seconds in self.seconds.items())
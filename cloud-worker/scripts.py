@@ -13,6 +13,15 @@ log = logging.getLogger(__name__)
 def start():
     run_process('py -m cloud_worker.main')
     
+def benchmark_startup():
+    run_process('py -m benchmarks.startup')
+    
+def benchmark_throughput():
+    run_process('py -m benchmarks.throughput')
+    
+def benchmark_sentence_graph():
+    run_process('py -m benchmarks.sentence_graph')
+    
 def test():
     parser = argparse.ArgumentParser(
         prog='Run pytest in poetry shell',
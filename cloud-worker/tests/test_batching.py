@@ -0,0 +1,61 @@
+import asyncio
+import logging
+
+import pytest
+
+from cloud_worker.services.batching import MicroBatcher
+
+log = logging.getLogger(__name__)
+
+
+class Recording_Batch_Function:
+    def __init__(self):
+        self.batches = []
+
+    async def __call__(self, items):
+        self.batches.append(list(items))
+        return [i * 10 for i in items]
+
+
+class TestMicroBatcher:
+    def test_full_batch_runs_without_waiting_for_deadline(self):
+        run_batch = Recording_Batch_Function()
+        batcher = MicroBatcher(run_batch, max_batch_size=3, max_wait=60)
+
+        async def submit_all():
+            return await asyncio.wait_for(asyncio.gather(*[batcher.submit(i) for i in range(3)]), timeout=5)
+
+        assert asyncio.run(submit_all()) == [0, 10, 20]
+        assert run_batch.batches == [[0, 1, 2]]
+
+    def test_partial_batch_runs_at_deadline(self):
+        run_batch = Recording_Batch_Function()
+        batcher = MicroBatcher(run_batch, max_batch_size=8, max_wait=0.01)
+
+        async def submit_all():
+            return await asyncio.gather(*[batcher.submit(i) for i in range(3)])
+
+        assert asyncio.run(submit_all()) == [0, 10, 20]
+        assert run_batch.batches == [[0, 1, 2]]
+
+    def test_items_beyond_batch_size_go_to_next_batch(self):
+        run_batch = Recording_Batch_Function()
+        batcher = MicroBatcher(run_batch, max_batch_size=2, max_wait=0.01)
+
+        async def submit_all():
+            return await asyncio.gather(*[batcher.submit(i) for i in range(5)])
+
+        assert asyncio.run(submit_all()) == [0, 10, 20, 30, 40]
+        assert run_batch.batches == [[0, 1], [2, 3], [4]]
+
+    def test_failed_batch_fails_every_item(self):
+        async def run_batch(items):
+            raise RuntimeError('model failed')
+        batcher = MicroBatcher(run_batch, max_batch_size=2, max_wait=0.01)
+
+        async def submit_all():
+            return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+        results = asyncio.run(submit_all())
+
+        assert all(isinstance(i, RuntimeError) for i in results)
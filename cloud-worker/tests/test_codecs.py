@@ -0,0 +1,57 @@
+import logging
+
+import numpy as np
+import pytest
+
+from cloud_worker.services.codecs import (
+    COLUMNAR_CONTENT_TYPE,
+    JSON_CONTENT_TYPE,
+    MSGPACK_CONTENT_TYPE,
+    RESULT_CODECS,
+    get_codec,
+)
+
+log = logging.getLogger(__name__)
+
+KEYWORD_RESULT = {
+    'keyword_nodes': [{'id': 0, 'name': 'compatibility', 'connected': [1, 2], 'score': 0.25},
+                      {'id': 1, 'name': 'systems',       'connected': [0],    'score': 0.125}],
+    'keyphrase_and_scores': [['linear constraints', 0.5], ['systems', 0.125]],
+}
+SENTENCE_LIST_RESULT = {
+    'keyword_extraction_result': [{'id': 0, 'name': 'first sentence', 'connected': [], 'score': np.float64(1.0)}],
+    'clusters': [{2, 0}, {1}],
+}
+
+
+class TestResultCodecs:
+    @pytest.mark.parametrize('content_type', list(RESULT_CODECS))
+    def test_round_trip(self, content_type):
+        codec = get_codec(content_type)
+        
+        assert codec.decode(codec.encode(KEYWORD_RESULT)) == KEYWORD_RESULT
+        assert codec.decode(codec.encode('a caption, a label')) == 'a caption, a label'
+        assert codec.decode(codec.encode([])) == []
+        
+    @pytest.mark.parametrize('content_type', list(RESULT_CODECS))
+    def test_sets_and_numpy_scalars(self, content_type):
+        codec = get_codec(content_type)
+        
+        decoded = codec.decode(codec.encode(SENTENCE_LIST_RESULT))
+        
+        assert decoded['clusters'] == [[0, 2], [1]]
+        assert decoded['keyword_extraction_result'][0]['score'] == 1.0
+        
+    def test_columnar_is_smaller_and_rounds_scores_to_float32(self):
+        nodes = [{'id': i, 'name': f'word{i}', 'connected': [i - 1] if i else [], 'score': 1 / (i + 3)} for i in range(200)]
+        
+        columnar = get_codec(COLUMNAR_CONTENT_TYPE).encode(nodes)
+        decoded = get_codec(COLUMNAR_CONTENT_TYPE).decode(columnar)
+        
+        assert len(columnar) < len(get_codec(MSGPACK_CONTENT_TYPE).encode(nodes)) < len(get_codec(JSON_CONTENT_TYPE).encode(nodes))
+        assert [i['name'] for i in decoded] == [i['name'] for i in nodes]
+        assert [i['score'] for i in decoded] == pytest.approx([i['score'] for i in nodes], rel=1e-6)
+        
+    def test_unknown_content_type(self):
+        with pytest.raises(ValueError):
+            get_codec('application/x-python-pickle')
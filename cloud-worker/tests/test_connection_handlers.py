@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import aio_pika
+import pytest
+
+from cloud_worker.services.connection_handlers import RabbitMQHandler
+
+log = logging.getLogger(__name__)
+
+
+class FakeExchange:
+    def __init__(self):
+        self.published = []
+        
+    async def publish(self, message, routing_key):
+        self.published.append((routing_key, message.body))
+        
+
+class FakeChannel:
+    def __init__(self, exchange):
+        self.default_exchange = exchange
+        self.is_closed = False
+        
+    async def close(self):
+        self.is_closed = True
+        
+
+class FakeConnection:
+    def __init__(self):
+        self.exchange = FakeExchange()
+        self.channels = []
+        self.is_closed = False
+        
+    async def channel(self, publisher_confirms=True):
+        self.channels.append(FakeChannel(self.exchange))
+        return self.channels[-1]
+    
+    async def close(self):
+        self.is_closed = True
+
+
+class TestRabbitMQHandlerPublish:
+    @pytest.fixture(autouse=True)
+    def fake_broker(self, monkeypatch):
+        connections = []
+        async def connect_robust(*args, **kwargs):
+            connections.append(FakeConnection())
+            return connections[-1]
+        
+        monkeypatch.setattr(aio_pika, 'connect_robust', connect_robust)
+        RabbitMQHandler.connection = RabbitMQHandler.channel_pool = RabbitMQHandler.connection_lock = None
+        yield connections
+        RabbitMQHandler.connection = RabbitMQHandler.channel_pool = RabbitMQHandler.connection_lock = None
+        
+    def test_publishes_reuse_one_connection(self, fake_broker):
+        async def publish_many():
+            await asyncio.gather(*[RabbitMQHandler.publish('job_queue', f'message {i}') for i in range(20)])
+            await RabbitMQHandler.publish('job_queue', b'last message')
+            await RabbitMQHandler.close()
+        
+        asyncio.run(publish_many())
+        
+        assert len(fake_broker) == 1
+        assert len(fake_broker[0].exchange.published) == 21
+        assert len(fake_broker[0].channels) <= 10
+        assert fake_broker[0].is_closed
+        
+    def test_reconnects_after_connection_is_closed(self, fake_broker):
+        async def publish_twice():
+            await RabbitMQHandler.publish('job_queue', 'first')
+            await RabbitMQHandler.close()
+            await RabbitMQHandler.publish('job_queue', 'second')
+        
+        asyncio.run(publish_twice())
+        
+        assert len(fake_broker) == 2
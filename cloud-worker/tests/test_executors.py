@@ -0,0 +1,45 @@
+import asyncio
+import logging
+import threading
+
+import pytest
+
+from cloud_worker.services.executors import TaskExecutor
+
+log = logging.getLogger(__name__)
+
+
+def current_thread_name(_):
+    return threading.current_thread().name
+
+
+class TestTaskExecutor:
+    def teardown_method(self):
+        TaskExecutor.shutdown()
+        
+    def test_inline_runs_on_event_loop_thread(self):
+        TaskExecutor.start('inline', concurrency=1)
+        
+        result = asyncio.run(TaskExecutor.run(current_thread_name, None))
+        
+        assert result == threading.current_thread().name
+        
+    def test_gil_releasing_stages_use_thread_pool(self):
+        TaskExecutor.start('inline', concurrency=1)
+        
+        result = asyncio.run(TaskExecutor.run(current_thread_name, None, releases_gil=True))
+        
+        assert result.startswith('task')
+        
+    def test_jobs_run_concurrently(self):
+        TaskExecutor.start('thread', concurrency=2)
+        barrier = threading.Barrier(2, timeout=5)
+        
+        async def run_both():
+            return await asyncio.gather(TaskExecutor.run(barrier.wait), TaskExecutor.run(barrier.wait))
+        
+        assert sorted(asyncio.run(run_both())) == [0, 1]
+        
+    def test_unknown_executor_type(self):
+        with pytest.raises(ValueError):
+            TaskExecutor.start('gpu')
@@ -0,0 +1,125 @@
+import logging
+
+import numpy as np
+import pytest
+
+from cloud_worker.textrank_module.clustering import cluster_sentences
+from cloud_worker.textrank_module.graph import Compact_Graph
+from cloud_worker.textrank_module.pagerank import PageRank, Undirected_Node
+
+log = logging.getLogger(__name__)
+
+class TestCompactGraph:
+    tokens = ['compatibility', 'systems', 'linear', 'constraints', 'set', 'natural', 'numbers', 'systems', 'linear', 'linear']
+    
+    def build_from_tokens(self):
+        graph = Compact_Graph()
+        for index, token in enumerate(self.tokens):
+            for other in self.tokens[index+1:index+3]:
+                graph.add_edge(graph.node_id(token), graph.node_id(other))
+        return graph
+    
+    def build_nodes_from_tokens(self):
+        node_dict = {}
+        for token in self.tokens:
+            node_dict.setdefault(token, Undirected_Node(name=token))
+        for index, token in enumerate(self.tokens):
+            for other in self.tokens[index+1:index+3]:
+                node_dict[token].to(node_dict[other])
+        return list(node_dict.values())
+    
+    def test_vocabulary(self):
+        graph = self.build_from_tokens()
+        
+        assert graph.names == list(dict.fromkeys(self.tokens))
+        assert graph.ids['linear'] == 2
+        assert graph.num_edges == 17
+    
+    def test_scores_match_undirected_nodes(self):
+        graph = self.build_from_tokens()
+        nodes = self.build_nodes_from_tokens()
+        
+        expected = PageRank.calculate__undirected_no_optimise(nodes, converge_val=1e-8)
+        result = PageRank.calculate__compact_graph(graph, converge_val=1e-8)
+        
+        assert np.allclose(result, [expected[node] for node in nodes])
+        
+    def test_duplicate_edges_are_merged(self):
+        graph = Compact_Graph()
+        a, b = graph.node_id('a'), graph.node_id('b')
+        graph.add_edge(a, b)
+        graph.add_edge(b, a)
+        graph.add_edge(a, a)
+        
+        assert graph.adjacency_matrix().toarray().tolist() == [[1, 1], [1, 0]]
+        
+    def test_undirected_node_round_trip(self):
+        graph = self.build_from_tokens()
+        
+        nodes = graph.to_undirected_nodes()
+        result = Compact_Graph.from_undirected_nodes(nodes)
+        
+        assert result.names == graph.names
+        assert (result.adjacency_matrix() != graph.adjacency_matrix()).nnz == 0
+        
+    def test_nodes_asdict(self):
+        graph = self.build_from_tokens()
+        
+        result = graph.nodes_asdict()
+        
+        assert result[0] == {'id': 0, 'name': 'compatibility', 'connected': [1, 2]}
+        assert set(result[2]['connected']) == {0, 1, 2, 3, 4, 6}
+        
+    @pytest.mark.parametrize('window', [0, 1, 2, 3, 12])
+    def test_cooccurrence_counts_every_pair_within_the_window(self, window):
+        graph = Compact_Graph.from_cooccurrence(self.tokens, window=window)
+        
+        expected = np.zeros((graph.num_nodes, graph.num_nodes))
+        for index, token in enumerate(self.tokens):
+            for other in self.tokens[index+1:index+window+1]:
+                first, second = graph.ids[token], graph.ids[other]
+                expected[first, second] += 1
+                if first != second: expected[second, first] += 1
+        
+        assert graph.names == list(dict.fromkeys(self.tokens))
+        assert np.array_equal(graph.adjacency_matrix().toarray(), expected)
+        
+    def test_repeated_cooccurrence_is_summed(self):
+        graph = Compact_Graph.from_cooccurrence(['a', 'b', 'a', 'b'], window=1)
+        
+        assert graph.adjacency_matrix().toarray().tolist() == [[0, 3], [3, 0]]
+        
+    def test_directed_cooccurrence(self):
+        forward  = Compact_Graph.from_cooccurrence(['a', 'b', 'c', 'a'], window=1, direction='forward')
+        backward = Compact_Graph.from_cooccurrence(['a', 'b', 'c', 'a'], window=1, direction='backward')
+        
+        assert forward.adjacency_matrix().toarray().tolist() == [[0, 1, 0], [0, 0, 1], [1, 0, 0]]
+        assert np.array_equal(backward.adjacency_matrix().toarray(), forward.adjacency_matrix().toarray().T)
+        with pytest.raises(ValueError):
+            Compact_Graph.from_cooccurrence(['a', 'b'], direction='sideways')
+            
+    def test_undirected_graph_as_directed_nodes(self):
+        graph = Compact_Graph.from_cooccurrence(self.tokens, window=2)
+        
+        scores = PageRank.calculate__directed_no_optimise(graph.to_directed_nodes(), converge_val=1e-12)
+        
+        assert np.allclose(list(scores.values()), PageRank.calculate__compact_graph(graph, converge_val=1e-12))
+        
+    def test_cooccurrence_of_short_texts(self):
+        assert Compact_Graph.from_cooccurrence([], window=2).num_nodes == 0
+        assert Compact_Graph.from_cooccurrence(['a'], window=2).adjacency_matrix().toarray().tolist() == [[0]]
+
+
+class TestClustering:
+    def test_compact_graph_and_nodes_give_same_clusters(self):
+        graph = Compact_Graph()
+        ids = [graph.node_id(i) for i in 'abcde']
+        weights = {(0, 1): 0.9, (0, 2): 0.2, (1, 2): 0.3, (2, 3): 0.1, (3, 4): 0.95, (1, 4): 0.4}
+        for (first, second), weight in weights.items():
+            graph.add_edge(ids[first], ids[second], weight)
+        
+        result = cluster_sentences(graph)
+        
+        nodes = graph.to_undirected_nodes()
+        assert result == cluster_sentences(nodes)
+        assert result == [{0}, {1}, {2}, {3, 4}]
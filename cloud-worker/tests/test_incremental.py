@@ -0,0 +1,113 @@
+import logging
+import pickle
+import random
+
+import numpy as np
+import pytest
+
+from cloud_worker.textrank_module.graph import Compact_Graph
+from cloud_worker.textrank_module.incremental import (
+    Ranking_State,
+    cooccurrence_pair_counts,
+    graph_from_pair_counts,
+    incremental_report,
+    update_pair_counts,
+    warm_start_scores,
+)
+from cloud_worker.textrank_module.pagerank import PageRank
+
+log = logging.getLogger(__name__)
+
+
+def random_edit(rng: random.Random, tokens, vocabulary):
+    """insert, delete or replace a few tokens at random places"""
+    tokens = list(tokens)
+    for _ in range(rng.randint(1, 4)):
+        position = rng.randint(0, len(tokens))
+        edit = rng.choice(['insert', 'delete', 'replace'])
+        if edit == 'insert':
+            tokens[position:position] = rng.choices(vocabulary, k=rng.randint(1, 3))
+        elif edit == 'delete':
+            del tokens[position:position + rng.randint(1, 3)]
+        else:
+            tokens[position:position + 1] = rng.choices(vocabulary, k=1)
+    return tokens
+
+
+class TestPairCounts:
+    vocabulary = [f'word{i}' for i in range(15)]
+    
+    @pytest.mark.parametrize('window', [1, 2, 3])
+    def test_counts_match_compact_graph(self, window):
+        tokens = random.Random(0).choices(self.vocabulary, k=60)
+        
+        graph = graph_from_pair_counts(cooccurrence_pair_counts(tokens, window))
+        expected = Compact_Graph.from_cooccurrence(tokens, window)
+        
+        assert graph.names == expected.names
+        assert np.array_equal(graph.adjacency_matrix().toarray(), expected.adjacency_matrix().toarray())
+        
+    @pytest.mark.parametrize('seed', range(50))
+    def test_updated_counts_match_counting_again(self, seed):
+        rng = random.Random(seed)
+        window = rng.randint(1, 4)
+        previous_tokens = rng.choices(self.vocabulary, k=rng.randint(0, 40))
+        tokens = random_edit(rng, previous_tokens, self.vocabulary)
+        
+        result = update_pair_counts(cooccurrence_pair_counts(previous_tokens, window), tokens)
+        expected = cooccurrence_pair_counts(tokens, window)
+        
+        assert result.as_counter() == expected.as_counter()
+        assert np.all(np.diff(result.keys) > 0)
+        graph = graph_from_pair_counts(result)
+        assert graph.names == graph_from_pair_counts(expected).names
+        assert np.array_equal(graph.adjacency_matrix().toarray(), graph_from_pair_counts(expected).adjacency_matrix().toarray())
+        
+    def test_token_ids_are_kept_across_versions(self):
+        previous = cooccurrence_pair_counts(['a', 'b', 'c', 'a'], 2)
+        
+        counts = update_pair_counts(previous, ['c', 'd', 'a'])
+        
+        assert counts.vocabulary == ['a', 'b', 'c', 'd']
+        assert counts.token_ids.tolist() == [2, 3, 0]
+        assert graph_from_pair_counts(counts).names == ['c', 'd', 'a']
+        
+    def test_counts_pickle_as_arrays(self):
+        tokens = random.Random(0).choices(self.vocabulary, k=5000)
+        counts = cooccurrence_pair_counts(tokens, 2)
+        
+        # about the size of the arrays, rather than a pickled object for every token and pair
+        assert len(pickle.dumps(counts)) < 10 * counts.token_ids.nbytes
+        assert pickle.loads(pickle.dumps(counts)).as_counter() == counts.as_counter()
+
+
+class TestWarmStart:
+    def rank(self, tokens, previous=None):
+        graph = graph_from_pair_counts(cooccurrence_pair_counts(tokens, 2))
+        result = PageRank.run__compact_graph(graph, converge_val=1e-8,
+                                             initial_scores=warm_start_scores(graph, previous) if previous else None)
+        state = Ranking_State(names=graph.names, scores=result.scores,
+                              cold_iterations=previous.cold_iterations if previous else result.iterations,
+                              report=incremental_report(previous, result.iterations))
+        return result, state
+    
+    def test_small_edit_converges_in_fewer_iterations(self):
+        rng = random.Random(1)
+        vocabulary = [f'word{i}' for i in range(80)]
+        tokens = rng.choices(vocabulary, k=400)
+        edited = tokens[:200] + ['word3', 'word7'] + tokens[201:]
+        
+        _, state = self.rank(tokens)
+        cold, _ = self.rank(edited)
+        warm, warm_state = self.rank(edited, previous=state)
+        
+        assert np.allclose(warm.scores, cold.scores, atol=1e-6)
+        assert warm.iterations < cold.iterations
+        assert warm_state.report == {'warm_started': True, 'iterations': warm.iterations,
+                                     'iterations_saved': state.cold_iterations - warm.iterations}
+        
+    def test_new_nodes_start_from_the_average_score(self):
+        previous = Ranking_State(names=['a', 'b'], scores=np.array([0.75, 0.25]), cold_iterations=10)
+        graph = graph_from_pair_counts(cooccurrence_pair_counts(['a', 'c', 'b', 'd'], 2))
+        
+        assert warm_start_scores(graph, previous).tolist() == [0.75, 0.25, 0.25, 0.25]
@@ -1,8 +1,15 @@
 import logging
 
+import numpy as np
 import pytest
+from scipy import sparse
 
-from cloud_worker.textrank_module.pagerank import PageRank, Undirected_Node
+import networkx as nx
+
+from cloud_worker.textrank_module.graph import Compact_Graph
+from cloud_worker.textrank_module.pagerank import Directed_Edge, Directed_Node, PageRank, Undirected_Node
+from cloud_worker.textrank_module.pagerank_engine import run_pagerank
+from cloud_worker.textrank_module.pagerank_wt import iterative_pr
 
 log = logging.getLogger(__name__)
 
@@ -91,3 +98,221 @@ class TestPagerank:
         assert abs(result[node_c] - 0.2653) < 0.001
         assert abs(result[node_d] - 0.0652) < 0.001
         assert abs(result[node_e] - 0.0582) < 0.001
+
+
+class TestPagerankEngine:
+    M = [[0.5, 0.5, 0],
+         [0.5, 0,   0],
+         [0,   0.5, 1]]
+    
+    @pytest.mark.parametrize('backend', ['dense', 'sparse', 'auto'])
+    def test_matches_iterative_pr(self, backend):
+        expected = iterative_pr(self.M, c1=0.8, converge_val=0.0001)
+        result = run_pagerank(self.M, c1=0.8, converge_val=0.0001, backend=backend)
+        
+        assert result.converged
+        assert np.allclose(result.scores, expected, atol=1e-9)
+        
+    def test_sparse_matrix_input(self):
+        expected = iterative_pr(self.M, c1=0.8, converge_val=0.0001)
+        result = run_pagerank(sparse.csr_matrix(self.M), c1=0.8, converge_val=0.0001)
+        
+        assert np.allclose(result.scores, expected, atol=1e-9)
+        
+    def test_max_iterations_guard(self):
+        result = run_pagerank(self.M, c1=0.8, converge_val=0, max_iterations=5)
+        
+        assert not result.converged
+        assert result.iterations == 5
+        
+    def test_dangling_nodes_keep_total_score(self):
+        M = [[0, 1, 0],
+             [0, 0, 0],
+             [1, 0, 0]]
+        result = run_pagerank(M, c1=0.9, converge_val=1e-10)
+        
+        assert abs(result.scores.sum() - 1) < 1e-6
+        
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            run_pagerank(self.M, c1=0.8, converge_val=0.0001, backend='gpu')
+
+            
+
+class TestPersonalizedPagerank:
+    M = TestPagerankEngine.M
+    
+    def personalized_reference(self, M, teleport, c1, converge_val):
+        """power iteration written out for a single teleport vector"""
+        M, teleport = np.asarray(M, dtype=np.float64), np.asarray(teleport, dtype=np.float64) / sum(teleport)
+        x = np.full(len(M), 1 / len(M))
+        while True:
+            Mx = c1 * M @ x + (1 - c1) * teleport
+            if np.abs(Mx - x).sum() < converge_val: return Mx
+            x = Mx
+    
+    def test_uniform_personalization_matches_plain_pagerank(self):
+        expected = run_pagerank(self.M, c1=0.8, converge_val=1e-10)
+        result = run_pagerank(self.M, c1=0.8, converge_val=1e-10, personalization=np.ones(3))
+        
+        assert np.allclose(result.scores, expected.scores)
+        
+    def test_teleport_vector(self):
+        result = run_pagerank(self.M, c1=0.8, converge_val=1e-12, personalization=np.array([3, 1, 0]))
+        
+        assert np.allclose(result.scores, self.personalized_reference(self.M, [3, 1, 0], c1=0.8, converge_val=1e-12))
+        
+    @pytest.mark.parametrize('backend', ['dense', 'sparse'])
+    def test_several_vectors_are_scored_together(self, backend):
+        teleports = np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 1, 1]]).T
+        
+        result = run_pagerank(self.M, c1=0.8, converge_val=1e-12, backend=backend, personalization=teleports)
+        
+        assert result.scores.shape == (3, 4)
+        for column, teleport in enumerate(teleports.T):
+            assert np.allclose(result.scores[:, column], self.personalized_reference(self.M, teleport, c1=0.8, converge_val=1e-12))
+            
+    def test_vector_without_weight_teleports_uniformly(self):
+        expected = run_pagerank(self.M, c1=0.8, converge_val=1e-10)
+        result = run_pagerank(self.M, c1=0.8, converge_val=1e-10, personalization=np.zeros((3, 1)))
+        
+        assert np.allclose(result.scores[:, 0], expected.scores)
+        
+    @pytest.mark.parametrize('personalization', [np.ones(2), np.array([1, -1, 1]), np.zeros((3, 0))])
+    def test_invalid_personalization(self, personalization):
+        with pytest.raises(ValueError):
+            run_pagerank(self.M, c1=0.8, converge_val=1e-10, personalization=personalization)
+            
+    def test_undirected_nodes(self):
+        nodes = [Undirected_Node(name=i) for i in 'abcd']
+        for first, second in [(0, 1), (1, 2), (2, 3)]:
+            nodes[first].to(nodes[second])
+        
+        start, end = PageRank.calculate__undirected_no_optimise(nodes, converge_val=1e-10, personalization=[{nodes[0]: 1}, {nodes[3]: 1}])
+        single = PageRank.calculate__undirected_no_optimise(nodes, converge_val=1e-10, personalization={nodes[0]: 1})
+        
+        assert start[nodes[0]] > start[nodes[3]] and end[nodes[3]] > end[nodes[0]]
+        assert np.allclose([start[i] for i in nodes], [end[i] for i in reversed(nodes)])
+        assert np.allclose([start[i] for i in nodes], [single[i] for i in nodes])
+        
+    def test_empty_personalization_list(self):
+        nodes = [Undirected_Node(name=i) for i in 'ab']
+        nodes[0].to(nodes[1])
+        
+        with pytest.raises(ValueError):
+            PageRank.calculate__undirected_no_optimise(nodes, personalization=[])
+        with pytest.raises(ValueError):
+            PageRank.calculate__undirected_no_optimise([], personalization=[])
+
+
+class TestDirectedPagerank:
+    # d only has in-links, so its score is spread over the teleport distribution
+    edges = [('a', 'b', 1), ('b', 'c', 2), ('c', 'a', 1), ('a', 'c', 3), ('c', 'd', 1), ('b', 'd', 0.5)]
+    
+    def directed_nodes(self):
+        nodes = {i: Directed_Node(name=i) for i in 'abcd'}
+        for first, second, weight in self.edges:
+            nodes[first].to_node(nodes[second], weight)
+        return list(nodes.values())
+    
+    @pytest.mark.parametrize('backend', ['dense', 'sparse'])
+    def test_matches_networkx(self, backend):
+        graph = nx.DiGraph()
+        graph.add_weighted_edges_from(self.edges)
+        expected = nx.pagerank(graph, alpha=0.9, tol=1e-12)
+        
+        scores = PageRank.calculate__directed_no_optimise(self.directed_nodes(), converge_val=1e-12, backend=backend)
+        
+        assert np.allclose([scores[i] for i in sorted(scores, key=lambda x: x.name)], [expected[i] for i in 'abcd'])
+        assert np.isclose(sum(scores.values()), 1)
+        
+    def test_personalization_matches_networkx(self):
+        graph = nx.DiGraph()
+        graph.add_weighted_edges_from(self.edges)
+        expected = nx.pagerank(graph, alpha=0.9, tol=1e-12, personalization={'a': 1}, dangling={'a': 1})
+        nodes = self.directed_nodes()
+        
+        scores = PageRank.calculate__directed_no_optimise(nodes, converge_val=1e-12, personalization={nodes[0]: 1})
+        
+        assert np.allclose([scores[i] for i in nodes], [expected[i] for i in 'abcd'])
+        
+    def test_matches_compact_graph(self):
+        graph = Compact_Graph.from_cooccurrence(['a', 'b', 'c', 'a', 'd', 'b', 'b'], window=2, direction='forward')
+        
+        scores = PageRank.calculate__directed_no_optimise(graph.to_directed_nodes(), converge_val=1e-12)
+        
+        assert np.allclose(list(scores.values()), PageRank.calculate__compact_graph(graph, converge_val=1e-12))
+        
+    def test_empty_graph(self):
+        assert PageRank.calculate__directed_no_optimise([]) == {}
+        
+    def test_edges_are_hashable(self):
+        a, b = Directed_Node(name='a'), Directed_Node(name='b')
+        a.to_node(b, 2)
+        a.to_node(b, 5)
+        
+        assert len(a.out_set) == 1 and len(b.in_set) == 1
+        assert Directed_Edge(a, b) in a.out_set and Directed_Edge(b, a) not in a.out_set
+        
+    def test_undirected_edges_keep_their_hash(self):
+        a, b, c = Undirected_Node(name='a'), Undirected_Node(name='b'), Undirected_Node(name='c')
+        a.to(b)
+        edge = next(iter(a.connected))
+        a.to(c) # adding edges used to change the hash of the edges already in the set
+        
+        assert edge in a.connected and edge in b.connected
+
+
+class TestSparseMatrixConstruction:
+    def test_matches_dense_matrix(self):
+        node_a = Undirected_Node(name='A')
+        node_b = Undirected_Node(name='B')
+        node_c = Undirected_Node(name='C')
+        node_d = Undirected_Node(name='D')
+        node_a.to(node_b, 2)
+        node_a.to(node_c)
+        node_b.to(node_c)
+        node_c.to(node_d, 0.5)
+        nodes = [node_a, node_b, node_c, node_d]
+        
+        dense = PageRank.convert_connected_nodes_to_matrix(nodes)
+        result = PageRank.convert_connected_nodes_to_sparse_matrix(nodes)
+        
+        assert np.allclose(result.T.toarray(), dense)
+        
+    def test_rows_are_normalised(self):
+        node_a = Undirected_Node(name='A')
+        node_b = Undirected_Node(name='B')
+        node_c = Undirected_Node(name='C')
+        node_a.to(node_b, 3)
+        node_a.to(node_c)
+        nodes = [node_a, node_b, node_c]
+        
+        result = PageRank.convert_connected_nodes_to_sparse_matrix(nodes)
+        
+        assert np.allclose(result.sum(axis=1), 1)
+        assert np.allclose(result.toarray()[0], [0, 0.75, 0.25])
+        
+    def test_zero_degree_row(self):
+        node_a = Undirected_Node(name='A')
+        node_b = Undirected_Node(name='B')
+        node_c = Undirected_Node(name='C')
+        node_a.to(node_b)
+        nodes = [node_a, node_b, node_c]
+        
+        result = PageRank.convert_connected_nodes_to_sparse_matrix(nodes)
+        
+        assert result.nnz == 2
+        assert np.allclose(result.toarray()[2], [0, 0, 0])
+        
+    def test_zero_degree_node_scores(self):
+        node_a = Undirected_Node(name='A')
+        node_b = Undirected_Node(name='B')
+        node_c = Undirected_Node(name='C')
+        node_a.to(node_b)
+        nodes = [node_a, node_b, node_c]
+        
+        result = PageRank.calculate__undirected_no_optimise(nodes, converge_val=1e-8)
+        
+        assert abs(sum(result.values()) - 1) < 1e-6
+        assert result[node_a] > result[node_c]
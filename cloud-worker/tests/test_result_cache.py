@@ -0,0 +1,58 @@
+import logging
+import time
+
+from cloud_worker.services.result_cache import ResultCache, request_cache_key
+
+log = logging.getLogger(__name__)
+
+
+class TestRequestCacheKey:
+    def test_same_request_same_key(self):
+        assert request_cache_key('KEYWORD_EXTRACTION', 'some text') == request_cache_key('KEYWORD_EXTRACTION', ' some text\n')
+        assert request_cache_key('KEYWORD_EXTRACTION', 'line\r\nline') == request_cache_key('KEYWORD_EXTRACTION', 'line\nline')
+        assert request_cache_key('KEYWORD_EXTRACTION', 'caf\u00e9') == request_cache_key('KEYWORD_EXTRACTION', 'cafe\u0301')
+        
+    def test_key_depends_on_task_type_and_parameters(self):
+        key = request_cache_key('KEYWORD_EXTRACTION', 'some text')
+        
+        assert key != request_cache_key('SENTENCE_EXTRACTION', 'some text')
+        assert key != request_cache_key('KEYWORD_EXTRACTION', 'some text', {'number_to_keep': 5})
+        assert request_cache_key('IMAGE_TRANSCRIPTION', b'\x89PNG', {'codec': 'png', 'a': 1}) == \
+               request_cache_key('IMAGE_TRANSCRIPTION', b'\x89PNG', {'a': 1, 'codec': 'png'})
+        
+
+class TestResultCache:
+    def test_hits_and_misses(self):
+        cache = ResultCache(max_entries=10, ttl=0)
+        cache.put('key', (b'result', {'pickled': True}))
+        
+        assert cache.get('key') == (b'result', {'pickled': True})
+        assert cache.get('other') is None
+        assert cache.metrics.hits == 1
+        assert cache.metrics.misses == 1
+        
+    def test_least_recently_used_is_evicted(self):
+        cache = ResultCache(max_entries=2, ttl=0)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert cache.metrics.evictions == 1
+        
+    def test_ttl(self):
+        cache = ResultCache(max_entries=10, ttl=0.01)
+        cache.put('a', 1)
+        time.sleep(0.02)
+        
+        assert cache.get('a') is None
+        assert len(cache) == 0
+        
+    def test_disabled(self):
+        cache = ResultCache(max_entries=0)
+        cache.put('a', 1)
+        
+        assert cache.get('a') is None
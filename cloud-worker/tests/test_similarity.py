@@ -0,0 +1,125 @@
+import logging
+
+import numpy as np
+import pytest
+
+from cloud_worker.textrank_module.similarity import (
+    cosine_similarity_matrix,
+    similarity_graph_from_vectors,
+    sparsify_similarity,
+    top_k_similarity_pairs,
+)
+
+log = logging.getLogger(__name__)
+
+class TestSimilarity:
+    vectors = np.array([[1, 0, 0],
+                        [1, 1, 0],
+                        [0, 0, 1],
+                        [0, 0, 0],
+                        [-1, 0, 0.1]], dtype=np.float32)
+    
+    def test_matches_pairwise_cosine(self):
+        result = cosine_similarity_matrix(self.vectors)
+        
+        for i, first in enumerate(self.vectors):
+            for j, second in enumerate(self.vectors):
+                norm = np.linalg.norm(first) * np.linalg.norm(second)
+                expected = first @ second / norm if norm else 0
+                assert abs(result[i, j] - expected) < 1e-6
+                
+    def test_threshold(self):
+        similarity = np.abs(cosine_similarity_matrix(self.vectors))
+        
+        result = sparsify_similarity(similarity, threshold=0.5)
+        
+        assert set(zip(*np.nonzero(result))) == {(0, 1), (0, 4), (1, 4)}
+        
+    def test_top_k(self):
+        similarity = np.array([[1,   0.9, 0.1, 0.2],
+                               [0.9, 1,   0.3, 0.1],
+                               [0.1, 0.3, 1,   0.8],
+                               [0.2, 0.1, 0.8, 1  ]])
+        
+        result = sparsify_similarity(similarity, top_k=1)
+        
+        assert set(zip(*np.nonzero(result))) == {(0, 1), (2, 3)}
+        
+    def test_graph_is_fully_connected_by_default(self):
+        names = ['a', 'b', 'c', 'd', 'e']
+        
+        graph = similarity_graph_from_vectors(names, self.vectors)
+        
+        assert graph.num_nodes == 5
+        assert graph.num_edges == 10
+        
+    def test_duplicate_sentences_share_a_node(self):
+        graph = similarity_graph_from_vectors(['a', 'b', 'a'], self.vectors[:3])
+        
+        assert graph.names == ['a', 'b']
+        assert graph.num_edges == 3
+        
+    def test_directed_edges_follow_the_order_of_the_sentences(self):
+        names = ['a', 'b', 'c', 'd', 'e']
+        undirected = similarity_graph_from_vectors(names, self.vectors).adjacency_matrix().toarray()
+        
+        forward  = similarity_graph_from_vectors(names, self.vectors, direction='forward').adjacency_matrix().toarray()
+        backward = similarity_graph_from_vectors(names, self.vectors, direction='backward').adjacency_matrix().toarray()
+        
+        assert np.allclose(forward, np.triu(undirected))
+        assert np.allclose(backward, forward.T)
+
+
+
+class TestTopKSimilarityGraph:
+    vectors = np.random.default_rng(0).normal(size=(60, 8)).astype(np.float32)
+    
+    @pytest.mark.parametrize('top_k', [1, 3, 10])
+    @pytest.mark.parametrize('block_size', [1, 7, 1024])
+    def test_matches_all_pairs_top_k(self, top_k, block_size):
+        similarity = np.abs(cosine_similarity_matrix(self.vectors))
+        expected = set(zip(*np.nonzero(sparsify_similarity(similarity, threshold=0.2, top_k=top_k))))
+        
+        first, second, weight = top_k_similarity_pairs(self.vectors, top_k, threshold=0.2, block_size=block_size)
+        
+        assert set(zip(first.tolist(), second.tolist())) == expected
+        assert np.allclose(weight, similarity[first, second])
+        
+    def test_graph_has_at_most_top_k_edges_per_sentence(self):
+        names = [str(i) for i in range(len(self.vectors))]
+        
+        graph = similarity_graph_from_vectors(names, self.vectors, top_k=2)
+        
+        assert len(self.vectors) <= graph.num_edges <= 2 * len(self.vectors)
+        assert all(len(i) >= 2 for i in graph.neighbours())
+        
+    def test_large_top_k_connects_every_pair(self):
+        first, _, _ = top_k_similarity_pairs(self.vectors[:5], top_k=10)
+        
+        assert len(first) == 10
+        
+    def test_unknown_search(self):
+        with pytest.raises(ValueError):
+            top_k_similarity_pairs(self.vectors, top_k=2, search='annoy')
+            
+    def test_faiss_search_finds_the_nearest_neighbours(self):
+        pytest.importorskip('faiss')
+        exact = set(zip(*top_k_similarity_pairs(np.abs(self.vectors), top_k=3)[:2]))
+        
+        approximate = set(zip(*top_k_similarity_pairs(np.abs(self.vectors), top_k=3, search='faiss')[:2]))
+        
+        assert len(exact & approximate) / len(exact) > 0.9
+        
+    def test_searches_agree_on_negative_similarities(self):
+        pytest.importorskip('faiss')
+        rng = np.random.default_rng(1)
+        # pairs of nearly opposite sentences, so each sentence's nearest neighbour by absolute similarity is negatively similar to it
+        directions = rng.normal(size=(10, 16))
+        vectors = np.vstack([directions, -directions + rng.normal(scale=0.05, size=directions.shape)]).astype(np.float32)
+        
+        first, second, weight = top_k_similarity_pairs(vectors, top_k=1)
+        faiss_first, faiss_second, faiss_weight = top_k_similarity_pairs(vectors, top_k=1, search='faiss')
+        
+        assert (cosine_similarity_matrix(vectors)[first, second] < -0.9).all()
+        assert np.array_equal(first, faiss_first) and np.array_equal(second, faiss_second)
+        assert np.allclose(weight, faiss_weight, atol=1e-5)
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+
+import pytest
+
+from cloud_worker.services import task_processer
+from cloud_worker.services.executors import TaskExecutor
+from cloud_worker.services.task_processer import TaskProcesor, TaskType
+
+log = logging.getLogger(__name__)
+
+
+class Task_Message:
+    """the parts of an aio_pika incoming message that TaskProcesor.process_task uses"""
+    def __init__(self, task_id: str, body: bytes, task_type: TaskType = TaskType.KEYWORD_EXTRACTION):
+        self.headers = {'task_type': task_type.value, 'task_id': task_id, 'other_info': {}}
+        self.body = body
+        self.nacked = []
+        
+    async def nack(self, requeue=True):
+        self.nacked.append(requeue)
+
+
+@pytest.fixture
+def published(monkeypatch):
+    results = []
+    async def publish_result(message, headers):
+        results.append((message, headers))
+    
+    monkeypatch.setattr(TaskProcesor, 'publish_result', publish_result)
+    TaskProcesor.result_cache.clear()
+    TaskExecutor.start('inline', concurrency=1, initializer=None)
+    yield results
+    TaskExecutor.shutdown()
+    TaskProcesor.result_cache.clear()
+
+
+class TestTaskProcesor:
+    def test_unserved_task_type_is_not_requeued(self, published, monkeypatch):
+        monkeypatch.setattr(TaskProcesor, 'task_types', {TaskType.IMAGE_TRANSCRIPTION.value})
+        message = Task_Message('task-1', b'some text')
+        
+        asyncio.run(TaskProcesor.process_task(message))
+        
+        assert message.nacked == [False]
+        assert [(headers['task_id'], headers['failed']) for _, headers in published] == [('task-1', True)]
+        
+    def test_unserved_batch_fails_every_task(self, published, monkeypatch):
+        monkeypatch.setattr(TaskProcesor, 'task_types', {TaskType.IMAGE_TRANSCRIPTION.value})
+        message = Task_Message('batch', json.dumps(['first text', 'last text']).encode(), TaskType.KEYWORD_EXTRACTION_BATCH)
+        message.headers['other_info'] = {'task_ids': ['task-1', 'task-2']}
+        
+        asyncio.run(TaskProcesor.process_task(message))
+        
+        assert message.nacked == [False]
+        assert sorted(headers['task_id'] for _, headers in published) == ['task-1', 'task-2']
+        assert all(headers['failed'] and headers['task_type'] == TaskType.KEYWORD_EXTRACTION.value for _, headers in published)
+        
+    def test_restricted_task_types_need_per_task_type_routing(self, monkeypatch):
+        monkeypatch.setattr(TaskProcesor, 'task_types', {TaskType.IMAGE_TRANSCRIPTION.value})
+        
+        TaskProcesor.check_routing('per_task_type')
+        with pytest.raises(ValueError):
+            TaskProcesor.check_routing('single')
+        monkeypatch.setattr(TaskProcesor, 'task_types', {i.value for i in TaskType})
+        TaskProcesor.check_routing('single')
+        
+    def test_ready_once_every_queue_is_consumed(self, monkeypatch):
+        listening = []
+        class Queue_Provider:
+            @staticmethod
+            async def declare_exchange(name): pass
+            @staticmethod
+            async def listen(queue_name, on_message_handler=None, prefetch_count=1, consuming=None):
+                listening.append(queue_name)
+                await asyncio.sleep(0)
+                consuming.set()
+                await asyncio.Future()
+        monkeypatch.setattr(TaskProcesor, 'work_queue_provider', Queue_Provider)
+        monkeypatch.setattr(TaskProcesor, 'task_types', {TaskType.KEYWORD_EXTRACTION.value, TaskType.IMAGE_TRANSCRIPTION.value})
+        
+        async def wait_until_ready():
+            ready = asyncio.Event()
+            listener = asyncio.create_task(TaskProcesor.listen_for_incoming_tasks(ready))
+            await asyncio.wait_for(ready.wait(), 1)
+            listener.cancel()
+            return len(listening)
+        
+        assert asyncio.run(wait_until_ready()) == 2
+        
+    def test_task_without_result_publishes_a_failure(self, published, monkeypatch):
+        async def run_task(message): return None
+        monkeypatch.setattr(TaskProcesor, 'run_task', run_task)
+        message = Task_Message('task-1', b'some text')
+        
+        asyncio.run(TaskProcesor.process_task(message))
+        asyncio.run(TaskProcesor.process_task(message))
+        
+        assert len(published) == 2 # failures are not cached
+        assert all(headers['failed'] and headers['cache_key'] and headers['task_id'] == 'task-1' for _, headers in published)
+
+    def test_raising_job_publishes_a_failure(self, published, monkeypatch):
+        def keyword_extraction_job(text, seed_keywords=None, direction=None):
+            raise RuntimeError('job failed')
+        monkeypatch.setattr(task_processer, 'keyword_extraction_job', keyword_extraction_job)
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(TaskProcesor.process_task(Task_Message('task-1', b'some text')))
+
+        assert len(published) == 1
+        body, headers = published[0]
+        assert headers['failed'] and headers['task_id'] == 'task-1'
+        assert 'job failed' in TaskProcesor.result_codec.decode(body)['error']
+        assert TaskProcesor.result_cache.get(headers['cache_key']) is None
+
+    def test_repeated_task_reuses_cached_result(self, published, monkeypatch):
+        calls = []
+        def keyword_extraction_job(text, seed_keywords=None, direction=None):
+            calls.append(text)
+            return {'keyword_nodes': [], 'keyphrase_and_scores': []}
+        monkeypatch.setattr(task_processer, 'keyword_extraction_job', keyword_extraction_job)
+        
+        asyncio.run(TaskProcesor.process_task(Task_Message('task-1', b'some text')))
+        asyncio.run(TaskProcesor.process_task(Task_Message('task-2', b'some text')))
+        
+        assert calls == ['some text']
+        assert [headers['task_id'] for _, headers in published] == ['task-1', 'task-2']
+        assert published[0][0] == published[1][0]
+        assert published[0][1]['cache_key'] == published[1][1]['cache_key']
+        
+    def test_versions_of_a_document_are_ranked_from_the_previous_state(self, published, monkeypatch):
+        previous_states = []
+        def incremental_keyword_extraction_job(text, previous_state=None, seed_keywords=None):
+            previous_states.append(previous_state)
+            return {'keyword_nodes': [], 'keyphrase_and_scores': []}, f'state of {text}'
+        monkeypatch.setattr(task_processer, 'incremental_keyword_extraction_job', incremental_keyword_extraction_job)
+        TaskProcesor.document_states.clear()
+        
+        for task_id, text in [('task-1', b'first version'), ('task-2', b'second version')]:
+            message = Task_Message(task_id, text)
+            message.headers['other_info'] = {'document_id': 'doc-1'}
+            asyncio.run(TaskProcesor.process_task(message))
+        
+        assert previous_states == [None, 'state of first version']
+        assert len(published) == 2
+        TaskProcesor.document_states.clear()
+        
+    def test_document_id_always_gives_the_incremental_result(self, published, monkeypatch):
+        def incremental_sentence_extraction_job(text, previous_state=None):
+            return {'sentences': [], 'incremental': {'warm_started': previous_state is not None}}, 'state'
+        monkeypatch.setattr(task_processer, 'incremental_sentence_extraction_job', incremental_sentence_extraction_job)
+        monkeypatch.setattr(TaskProcesor, 'result_codec', task_processer.get_codec('application/json'))
+        TaskProcesor.document_states.clear()
+        
+        message = Task_Message('task-1', b'some text', TaskType.SENTENCE_EXTRACTION)
+        message.headers['other_info'] = {'document_id': 'doc-1', 'queries': ['a'], 'direction': 'forward'}
+        asyncio.run(TaskProcesor.process_task(message))
+        
+        assert json.loads(published[0][0]) == {'sentences': [], 'incremental': {'warm_started': False}}
+        TaskProcesor.document_states.clear()
+        
+    def test_unknown_task_types_are_rejected_at_startup(self, monkeypatch):
+        monkeypatch.setattr(TaskProcesor, 'task_types', {'KEYWORD_EXTRACTON'})
+        
+        with pytest.raises(ValueError):
+            asyncio.run(TaskProcesor.load_models())
+
+
+class TestQueuePrefetch:
+    def test_one_queue_per_served_task_type(self, monkeypatch):
+        monkeypatch.setattr(TaskProcesor, 'task_types', {TaskType.KEYWORD_EXTRACTION.value, TaskType.IMAGE_TRANSCRIPTION.value})
+        monkeypatch.setattr(task_processer, 'WORKER_QUEUE_PREFETCH', {TaskType.KEYWORD_EXTRACTION.value: 2})
+        
+        assert TaskProcesor.queue_prefetch('per_task_type') == {
+            'job_queue.IMAGE_TRANSCRIPTION': task_processer.IMAGE_BATCH_SIZE,
+            'job_queue.KEYWORD_EXTRACTION':  2,
+        }
+        
+    def test_single_queue(self, monkeypatch):
+        monkeypatch.setattr(TaskProcesor, 'task_types', {TaskType.KEYWORD_EXTRACTION.value})
+        
+        assert TaskProcesor.queue_prefetch('single') == {'job_queue': task_processer.WORKER_CONCURRENCY}
+
+
+class TestBatchTasks:
+    def test_one_result_per_text(self, published, monkeypatch):
+        batches = []
+        def keyword_extraction_batch_job(texts):
+            batches.append(texts)
+            return [{'keyword_nodes': [], 'keyphrase_and_scores': [[i, 1.0]]} for i in texts]
+        monkeypatch.setattr(task_processer, 'keyword_extraction_batch_job', keyword_extraction_batch_job)
+        monkeypatch.setattr(task_processer, 'keyword_extraction_job', lambda text, seed_keywords=None, direction=None: keyword_extraction_batch_job([text])[0])
+        
+        asyncio.run(TaskProcesor.process_task(Task_Message('task-0', b'cached text')))
+        message = Task_Message('batch', json.dumps(['first text', 'cached text', 'last text']).encode(), TaskType.KEYWORD_EXTRACTION_BATCH)
+        message.headers['other_info'] = {'task_ids': ['task-1', 'task-2', 'task-3']}
+        asyncio.run(TaskProcesor.process_task(message))
+        
+        assert batches == [['cached text'], ['first text', 'last text']]
+        results = {headers['task_id']: (TaskProcesor.result_codec.decode(body), headers) for body, headers in published}
+        assert results['task-1'][0]['keyphrase_and_scores'] == [['first text', 1.0]]
+        assert results['task-2'][0]['keyphrase_and_scores'] == [['cached text', 1.0]]
+        assert results['task-3'][1]['task_type'] == TaskType.KEYWORD_EXTRACTION.value
+        assert results['task-2'][1]['cache_key'] == results['task-0'][1]['cache_key']
@@ -1,4 +1,6 @@
 import logging
+import random
+import re
 import unittest
 from typing import Dict, List
 
@@ -53,6 +55,17 @@ class Test_TextRank_Sentence_Extraction:
         # result = self.sentence_extraction(input_text)
         assert False
 
+class Test_TextRank_Sentence_Extraction_With_Clusters:
+    sentence_extraction_with_clusters = TextRank().sentence_extraction_with_clusters
+    
+    def test_cluster_ids_match_node_ids(self):
+        input_text = ['a photo of a cat 0', 'a photo of a dog 1', 'a painting of a cat 2', 'a red sports car 3']
+        
+        result = self.sentence_extraction_with_clusters(input_text)
+        
+        assert {i['id'] for i in result.nodes} == set().union(*result.clusters)
+        assert len(result.nodes) == len(input_text)
+
 class Test_TextRank__Keyword_Extraction:
     keyword_extraction    = TextRank().keyword_extraction__undirected
     regenerate_keyphrases = TextRank().regenerate_keyphrases
@@ -86,6 +99,18 @@ class Test_TextRank__Keyword_Extraction:
         return [i['name'] for i in nodelist]
     
 
+class Test_TextRank__Keyword_Extraction_With_Keyphrases:
+    keyword_extraction_with_keyphrases = TextRank().keyword_extraction_with_keyphrases
+    
+    def test_text_is_parsed_once(self):
+        input_text = "Criteria of compatibility of a system of linear Diophantine equations, strict inequations, and nonstrict inequations are considered."
+        
+        result = self.keyword_extraction_with_keyphrases(input_text)
+        
+        assert result.timings['parse']['calls'] == 1
+        assert 'linear diophantine equations' in result.keyphrases
+        
+
 class Test_TextRank__Keyword_Extraction__No_Keyphrase_Regeneration:
     keyword_extraction = TextRank().keyword_extraction__undirected
     extended_pos_tags = ['NOUN','ADJ', 
@@ -206,6 +231,10 @@ class Test_TextRank__Keyword_Extraction__No_Keyphrase_Regeneration:
 class Test_TextRank_Utils:
     regenerate_keyphrases = TextRank().regenerate_keyphrases
     
+    def test_sentence_extraction__queries__no_queries(self):
+        with pytest.raises(ValueError):
+            TextRank().sentence_extraction__queries('first sentence. second sentence.', [])
+    
     def test_regenerate_keyphrases(self):
         input_text = 'a b c'
         keywords = {'a': 1, 'b': 1}
@@ -311,4 +340,113 @@ class Test_TextRank_Utils:
         keywords = {'feature': 46, 'selection': 36, 'dense': 16, 'groups': 16, 'algorithms': 12}
         expected_results = {'feature selection': 46, 'dense feature groups': 46, 'feature selection algorithms': 46, 'feature selection algorithms selection': 46, 'feature groups': 46}
         result = self.regenerate_keyphrases(keywords, input_text)
-        assert result == expected_results
\ No newline at end of file
+        assert result == expected_results
+
+class Test_TextRank_Task_Pipelines:
+    @pytest.fixture
+    def text_rank(self, monkeypatch):
+        """TextRank with a blank pipeline that only has a sentencizer, restoring the loaded model afterwards"""
+        import spacy
+        text_rank = TextRank()
+        loaded_nlp = text_rank._nlp
+        
+        nlp = spacy.blank('en')
+        nlp.add_pipe('sentencizer')
+        monkeypatch.setattr(TextRank, 'sentence_segmenter', 'sentencizer')
+        text_rank.nlp = nlp
+        yield text_rank
+        text_rank.nlp = loaded_nlp
+        
+    def test_components_not_needed_by_a_task_are_disabled(self, text_rank):
+        assert text_rank.disabled_components('keywords') == ['sentencizer']
+        assert text_rank.disabled_components('sentence_list') == ['sentencizer']
+        assert text_rank.disabled_components('sentences') == []
+        
+    def test_parse_runs_only_the_components_of_the_task(self, text_rank):
+        text = 'The first sentence. The second one.'
+        
+        assert len(list(text_rank.parse(text, 'sentences').sents)) == 2
+        assert not text_rank.parse(text, 'keywords').has_annotation('SENT_START')
+        
+    def test_parse_many_keeps_the_order_of_the_texts(self, text_rank):
+        texts = [f'text number {i}' for i in range(5)]
+        
+        assert [i.text for i in text_rank.parse_many(texts, 'sentence_list', batch_size=2)] == texts
+
+
+
+def reference_regenerate_keyphrases(keyword_dict:Dict[str, int], original_text:str):
+    """regenerate_keyphrases as it was before it was rewritten as a single pass, the rewrite has to return the same keyphrases"""
+    keywords = set(i.lower() for i in keyword_dict)
+    log.debug(keyword_dict)
+    keyword_dict_copy = {k.lower():v for k,v in keyword_dict.items()}
+    
+    original_text = original_text.lower()
+    split_text = original_text.replace('\n',', ').split(' ')
+    
+    results:Dict[str, int] = {}
+    keywords_used = set()
+    
+    # find keyphrases in the text by checking for contiguous keywords
+    index = 0
+    while index < len(split_text):
+        token = split_text[index]
+        
+        if token not in keywords: 
+            # the current word is not part of a keyphrase
+            index+=1
+            continue 
+        
+        keywords_used.add(token)
+        max_score = keyword_dict_copy[token]
+        keyphrase = [token]
+        increment = 1
+        
+        while True:
+            next_token = split_text[index+increment] if index+increment <= len(split_text)-1 else ''
+            cleaned_next_token = re.sub(r'[^a-zA-Z0-9]', '', next_token)
+            
+            if not cleaned_next_token or cleaned_next_token not in keywords: # terminating condition - add phrase to results
+                log.debug(f'adding keyphrase {keyphrase} because not in keywords')
+                results[' '.join(keyphrase)] = max_score
+                break
+            
+            score = keyword_dict_copy.get(cleaned_next_token) or keyword_dict_copy.get(next_token) or -1
+            max_score = max(score, max_score)
+            
+            keywords_used.add(cleaned_next_token)
+            keyphrase.append(cleaned_next_token)
+            
+            if (any(i in next_token for i in [',', '.', '\n'])): # if the word has either comma or fullstop, then end the keyphrase
+                log.debug(f'adding keyphrase {keyphrase} because terminator')
+                results[' '.join(keyphrase)] = max_score
+                break
+            
+            increment += 1
+        
+        index+=increment
+        
+    results = {k:v for k,v in results.items() if len(k.split(' ')) > 1}
+    
+    return results
+
+
+class Test_TextRank_Regenerate_Keyphrases_Matches_Reference:
+    regenerate_keyphrases = TextRank().regenerate_keyphrases
+    VOCABULARY = ['feature', 'Feature', 'selection', 'dense', 'groups', 'c++', 'u.s', 'data', 'the', 'of', 'a', 'café', '']
+    PUNCTUATION = ['', '', '', ',', '.', '\n', ';', ')', '-']
+    
+    def random_case(self, rng: random.Random):
+        words = [rng.choice(self.VOCABULARY) + rng.choice(self.PUNCTUATION) for _ in range(rng.randint(0, 60))]
+        text = ''.join(word + rng.choice([' ', ' ', ' ', '  ', '\n']) for word in words)
+        keyword_pool = [i.lower() for i in self.VOCABULARY] + ['feature,', 'u.s', 'us', 'c']
+        keywords = {i: rng.choice([0, 1, 2, 2.0, 0.5, 3]) for i in rng.sample(keyword_pool, rng.randint(0, len(keyword_pool)))}
+        return keywords, text
+    
+    @pytest.mark.parametrize('seed', range(300))
+    def test_random_texts(self, seed):
+        keywords, text = self.random_case(random.Random(seed))
+        
+        result = self.regenerate_keyphrases(keywords, text)
+        
+        assert repr(result) == repr(reference_regenerate_keyphrases(keywords, text)) # same keyphrases, order and score types
@@ -1,13 +1,40 @@
-from typing import List
+from typing import List, Literal, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, root_validator
+
+
+Edge_Direction = Literal['undirected', 'forward', 'backward']
+
+
+def check_incremental_options(values: dict, unsupported: List[str]) -> dict:
+    """a document_id ranks the text incrementally from its previous version, which only keeps undirected rankings without these options"""
+    if not values.get('document_id'): return values
+    if values.get('direction') not in (None, 'undirected'):
+        raise ValueError(f"document_id can only be used with an undirected ranking, not direction '{values['direction']}'")
+    for option in unsupported:
+        if values.get(option): raise ValueError(f'document_id can not be used together with {option}')
+    return values
 
 
 class Text_Transcribe_Request(BaseModel):
     text: str
+    seed_keywords: List[str] = [] # bias the ranking towards these words, e.g. the topic of the text
+    document_id: Union[str, None] = None # rank a new version of the document from its previous ranking, the result then reports the iterations saved
+    direction: Union[Edge_Direction, None] = None # 'forward' points each word at the words after it, 'backward' at the ones before it
+    
+    @root_validator(skip_on_failure=True)
+    def check_document_id(cls, values):
+        return check_incremental_options(values, unsupported=[])
     
 class Sentence_Extraction_Request(BaseModel):
     text: str
+    queries: List[str] = [] # rank the sentences once for every query, towards the sentences similar to it. the result is then a list of rankings
+    document_id: Union[str, None] = None # as for Text_Transcribe_Request, the result is then an object with the sentences and the incremental report
+    direction: Union[Edge_Direction, None] = None # 'forward' points each sentence at the similar sentences after it, 'backward' at the ones before it
+    
+    @root_validator(skip_on_failure=True)
+    def check_document_id(cls, values):
+        return check_incremental_options(values, unsupported=['queries'])
     
     
 class Image_Rank_with_Sentences(BaseModel):
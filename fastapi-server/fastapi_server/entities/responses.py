@@ -1,3 +1,4 @@
+import json
 from dataclasses import dataclass
 from typing import List
 
@@ -10,12 +11,25 @@ def job_created_response__multiple(task_ids:List[str]):
 def job_created_response(task_id:str):
     return {'task_id': task_id}
 
+def batch_created_response(batch_id:str, task_ids:List[str]):
+    return {'batch_id': batch_id, 'task_id_list': task_ids}
+
 def job_completed_response(task_id:str, result):
     return {
         'task_id': task_id,
         'result': result
     }
 
+def encoded_job_completed_response(task_id:str, encoded_result: bytes) -> bytes:
+    """job_completed_response encoded as json, for a result that is already json"""
+    return b'{"task_id":' + json.dumps(task_id).encode() + b',"result":' + encoded_result + b'}'
+
+def job_pending_response(task_id:str):
+    return {
+        'task_id': task_id,
+        'message': 'the task has not completed yet'
+    }
+
 def text_response(text:str):
     return {'message': text}
 
@@ -4,13 +4,11 @@ import logging
 import uvicorn
 from fastapi import FastAPI, File, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi_server.constants import RABBITMQ_JOB_QUEUE_NAME, RABBITMQ_RESULT_QUEUE_NAME
 from fastapi_server.entities.POST_bodies import Text_Transcribe_Request
 from fastapi_server.entities.responses import healthcheck_response
 from fastapi_server.routers import router
 from fastapi_server.services.connection_handlers import RabbitMQHandler
 from fastapi_server.services.task_processor import JobProcessor
-from sse_starlette.sse import EventSourceResponse
 
 logging.basicConfig(format='%(name)s-%(levelname)s|%(lineno)d:  %(message)s', level=logging.INFO)
 log = logging.getLogger(__name__)
@@ -46,10 +44,12 @@ def run_task(coro):
 
 @app.on_event('startup')
 async def before_start():
-    t = run_task(
-        RabbitMQHandler.listen(RABBITMQ_RESULT_QUEUE_NAME, on_message_handler=JobProcessor.handle_new_result)
-    )
-    tasks.add(t)
+    run_task(JobProcessor.listen_for_results())
+
+
+@app.on_event('shutdown')
+async def before_shutdown():
+    await RabbitMQHandler.close()
 
 
 @app.get('/')
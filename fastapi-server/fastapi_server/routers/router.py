@@ -1,14 +1,16 @@
 import asyncio
+import json
 import logging
 import shutil
 import tempfile
 from dataclasses import dataclass
-from typing import List
+from typing import List, Union
 
 from fastapi import (
     APIRouter,
     File,
     HTTPException,
+    Query,
     Request,
     Response,
     UploadFile,
@@ -16,19 +18,28 @@ from fastapi import (
     WebSocketDisconnect,
     status,
 )
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi_server.constants import BATCH_MAX_DOCUMENTS, RESULT_LONG_POLL_TIMEOUT, RESULT_STREAM_TIMEOUT
 from fastapi_server.entities.POST_bodies import (
     Image_Rank_with_Sentences,
     Sentence_Extraction_Request,
     Text_Transcribe_Request,
 )
 from fastapi_server.entities.responses import (
+    batch_created_response,
+    encoded_job_completed_response,
     endpoint_not_implemented_response,
     job_completed_response,
     job_created_response,
     job_created_response__multiple,
+    job_pending_response,
     text_response,
 )
-from fastapi_server.services.task_processor import JobProcessor
+from fastapi_server.services.codecs import JSON_CONTENT_TYPE
+from fastapi_server.services.image_uploads import prepare_image_upload
+from fastapi_server.services.task_processor import JobProcessor, JobSpecification
+from sse_starlette.sse import EventSourceResponse
 
 logging.basicConfig(format='%(name)s-%(levelname)s|%(lineno)d:  %(message)s', level=logging.INFO)
 log = logging.getLogger(__name__)
@@ -57,6 +68,67 @@ async def sentence_extraction_route(body: Sentence_Extraction_Request):
     else:
         raise HTTPException(status_code=500, detail='an error occured while creating the task')
     
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/jsonlines')
+
+
+def batch_document_text(document, text_field: str) -> str:
+    """a batch document is either a string, or an object with the text in text_field"""
+    if isinstance(document, str): return document
+    if isinstance(document, dict) and isinstance(document.get(text_field), str): return document[text_field]
+    raise HTTPException(400, f"batch documents must be strings or objects with a '{text_field}' string field")
+
+
+async def read_batch_documents(request: Request, text_field: str) -> List[str]:
+    """texts of a json list of documents, an object with a 'texts' list, or an ndjson stream with one document per line
+    ndjson is parsed line by line as the body arrives, and too many documents are rejected without reading the rest"""
+    texts = []
+    def add(document):
+        texts.append(batch_document_text(document, text_field))
+        if len(texts) > BATCH_MAX_DOCUMENTS: raise HTTPException(413, f'a batch can have at most {BATCH_MAX_DOCUMENTS} documents')
+    
+    try:
+        if request.headers.get('content-type', '').split(';')[0].strip() in NDJSON_CONTENT_TYPES:
+            buffer = b''
+            async for chunk in request.stream():
+                *lines, buffer = (buffer + chunk).split(b'\n')
+                for line in lines:
+                    if line.strip(): add(json.loads(line))
+            if buffer.strip(): add(json.loads(buffer))
+        else:
+            body = await request.json()
+            documents = body.get('texts') if isinstance(body, dict) else body
+            if not isinstance(documents, list): raise HTTPException(400, "the batch has to be a list of documents, or an object with a 'texts' list")
+            for document in documents: add(document)
+    except json.JSONDecodeError as e:
+        raise HTTPException(400, f'unable to parse batch: {e}')
+    return texts
+
+
+@router.post('/text_rank_batch')
+async def text_rank_batch_route(request: Request, text_field: str = 'text'):
+    """keyword extraction for many texts, sent as a json list or as ndjson. the results are streamed from batch_results"""
+    texts = await read_batch_documents(request, text_field)
+    if not texts: raise HTTPException(400, 'the batch has no documents')
+    
+    batch = await JobProcessor.create_keyword_extraction_batch(texts)
+    if not batch:
+        raise HTTPException(status_code=500, detail='an error occured while creating the tasks')
+    return batch_created_response(batch.batch_id, batch.task_ids)
+
+
+@router.get('/batch_results')
+async def batch_results_route(batch_id: str):
+    """ndjson stream of the results of a batch, one line per text as soon as it completes"""
+    task_ids = JobProcessor.get_batch(batch_id)
+    if task_ids is None: raise HTTPException(404, f'no batch with id {batch_id}')
+    
+    async def result_lines():
+        async for job in JobProcessor.iterate_results(task_ids, RESULT_STREAM_TIMEOUT):
+            yield job_result_json(job) + b'\n'
+    
+    return StreamingResponse(result_lines(), media_type='application/x-ndjson')
+
+
 @router.post('/create_image_rank_w_sentences_job')
 async def create_image_rank_w_sentences_route(body: Image_Rank_with_Sentences):
     job = await JobProcessor.create_image_rank_w_sentences_job(body)
@@ -75,16 +147,15 @@ async def image_transcribe_route(images: list[UploadFile]):
         data: bytes
         codec: str
     
+    # images are read and downscaled one at a time, so only one full size upload is held in memory.
+    # every image is checked before any job is published, so a bad file does not leave a request half started
     data = []
     for image in images:
         suffix = get_file_suffix(image).lower()
         if suffix not in ('png','jpg'): raise HTTPException(400, f'The file must be either a .jpg or .png file: got {suffix} instead')
         
-        file_data = image.file.read()
-        if len(file_data) > 52_428_800: #50mb
-            raise HTTPException(status_code=413, detail='Image files cannot be larger than 50mb')
-        
-        data.append(ImageToBeProcessed(file_data, suffix))
+        data.append(ImageToBeProcessed(*await prepare_image_upload(image)))
+        await image.close()
     
     
     jobs = [JobProcessor.create_image_rank_job(i.data, i.codec) for i in data]
@@ -102,15 +173,64 @@ async def image_transcribe_route(images: list[UploadFile]):
         return text_response(f'unable to create job. please try again')
     
 
+@router.get('/result_store_metrics')
+async def result_store_metrics_route():
+    return JobProcessor.completed_jobs.metrics().asdict()
+
+
+@router.get('/result_cache_metrics')
+async def result_cache_metrics_route():
+    return JobProcessor.result_cache.metrics().asdict()
+
+
+def job_result_json(job: JobSpecification) -> bytes:
+    """job_completed_response as json. results the worker encoded as json are passed through without decoding them"""
+    if job.content_type == JSON_CONTENT_TYPE:
+        return encoded_job_completed_response(job.task_id, job.data) # type: ignore
+    return json.dumps(jsonable_encoder(job_completed_response(task_id=job.task_id, result=job.decoded_data()))).encode()
+
+
+def job_result_response(job: JobSpecification, accept: str = '') -> Response:
+    """clients that accept the encoding the worker used get the result bytes as they are, with the task id in the X-Task-Id header"""
+    accepted_types = [i.split(';')[0].strip() for i in accept.split(',')]
+    if job.content_type != JSON_CONTENT_TYPE and job.content_type in accepted_types:
+        return Response(job.data, media_type=job.content_type, headers={'X-Task-Id': job.task_id})
+    return Response(job_result_json(job), media_type=JSON_CONTENT_TYPE)
+
+
 @router.get('/check_task_result')
-async def get_job_result_route(task_id: str):
+async def get_job_result_route(request: Request, task_id: str,
+                               timeout: float = Query(RESULT_LONG_POLL_TIMEOUT, ge=0, le=RESULT_STREAM_TIMEOUT)):
+    """long-poll for the result of a task. answers with 202 if the task has not completed after timeout seconds"""
+    job = await JobProcessor.wait_for_result(task_id, timeout)
+    if not job:
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=job_pending_response(task_id))
+    
+    log.info(f'returning result of task {job.task_id}')
+    return job_result_response(job, request.headers.get('accept', ''))
 
-    while True:
-        job = JobProcessor.check_job_status(task_id)
-        if job:
-            log.info(job_completed_response(task_id=job.task_id, result=job.data))
-            return job_completed_response(task_id=job.task_id, result=job.data)
-        else:
-            await asyncio.sleep(1)
-            
+
+@router.get('/task_result_stream')
+async def task_result_stream_route(request: Request, task_id: List[str] = Query(...)):
+    """server-sent events stream with one 'result' event per task as soon as it completes"""
+    async def result_events():
+        async for job in JobProcessor.iterate_results(task_id, RESULT_STREAM_TIMEOUT):
+            if await request.is_disconnected(): break
+            yield {'event': 'result', 'data': job_result_json(job).decode()}
+    
+    return EventSourceResponse(result_events())
+
+
+@router.websocket('/ws/task_result')
+async def task_result_websocket_route(websocket: WebSocket):
+    """clients send a json list of task ids, and receive each result as soon as it completes"""
+    await websocket.accept()
+    try:
+        task_ids = await websocket.receive_json()
+        if isinstance(task_ids, str): task_ids = [task_ids]
         
+        async for job in JobProcessor.iterate_results(task_ids, RESULT_STREAM_TIMEOUT):
+            await websocket.send_text(job_result_json(job).decode())
+        await websocket.close()
+    except WebSocketDisconnect:
+        log.info('websocket client disconnected before all results were sent')
@@ -0,0 +1,112 @@
+"""
+Result codecs - how job results are encoded on their way from the workers to the api server, kept in step with cloud_worker.services.codecs by tests/test_wire_format.py.
+Results are stored as the bytes the worker sent, and only decoded when a client needs them in another encoding.
+"""
+
+import json
+import logging
+from typing import Any, Dict
+
+import msgpack
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+RESULT_SCHEMA_VERSION = 1 # sent with every result, bumped whenever the shape of a job result changes
+
+JSON_CONTENT_TYPE     = 'application/json'
+MSGPACK_CONTENT_TYPE  = 'application/msgpack'
+COLUMNAR_CONTENT_TYPE = 'application/vnd.columnar+msgpack'
+
+
+class ResultCodec:
+    content_type: str
+
+    def encode(self, result: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes) -> Any:
+        raise NotImplementedError
+
+
+def _to_builtin(value: Any) -> Any:
+    """sets (sentence clusters) and numpy scalars are not part of json or msgpack"""
+    if isinstance(value, (set, frozenset)): return sorted(value)
+    if isinstance(value, np.generic):       return value.item()
+    raise TypeError(f'cannot encode {type(value)}')
+
+
+class JsonCodec(ResultCodec):
+    content_type = JSON_CONTENT_TYPE
+
+    def encode(self, result: Any) -> bytes:
+        return json.dumps(result, separators=(',', ':'), default=_to_builtin).encode()
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class MsgpackCodec(ResultCodec):
+    content_type = MSGPACK_CONTENT_TYPE
+
+    def encode(self, result: Any) -> bytes:
+        return msgpack.packb(result, default=_to_builtin)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, strict_map_key=False)
+
+
+class ColumnarCodec(MsgpackCodec):
+    """msgpack, with lists of dicts that share the same keys (the node lists of every text job) stored as one array per key
+    instead of one map per row. numeric columns are packed as float32 arrays, so decoded scores have float32 precision"""
+    content_type = COLUMNAR_CONTENT_TYPE
+    COLUMNS_KEY = '__columns__'
+    FLOAT32_KEY = '__float32__'
+
+    def encode(self, result: Any) -> bytes:
+        return msgpack.packb(self._to_columns(result), default=_to_builtin)
+
+    def decode(self, data: bytes) -> Any:
+        return self._to_rows(msgpack.unpackb(data, strict_map_key=False))
+
+    def _to_columns(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            return {key: self._to_columns(i) for key, i in value.items()}
+        if not isinstance(value, (list, tuple)):
+            return value
+
+        is_table = value and all(isinstance(i, dict) for i in value) and all(i.keys() == value[0].keys() for i in value)
+        if not is_table:
+            return [self._to_columns(i) for i in value]
+
+        columns = {}
+        for key in value[0]:
+            column = [row[key] for row in value]
+            is_numeric = all(isinstance(i, (int, float, np.number)) and not isinstance(i, bool) for i in column)
+            if is_numeric and not all(isinstance(i, (int, np.integer)) for i in column):
+                columns[key] = {self.FLOAT32_KEY: np.asarray(column, dtype='<f4').tobytes()}
+            else:
+                columns[key] = self._to_columns(column)
+        return {self.COLUMNS_KEY: columns, 'length': len(value)}
+
+    def _to_rows(self, value: Any) -> Any:
+        if isinstance(value, list):
+            return [self._to_rows(i) for i in value]
+        if not isinstance(value, dict):
+            return value
+        if self.FLOAT32_KEY in value:
+            return np.frombuffer(value[self.FLOAT32_KEY], dtype='<f4').tolist()
+        if self.COLUMNS_KEY not in value:
+            return {key: self._to_rows(i) for key, i in value.items()}
+
+        columns = {key: self._to_rows(column) for key, column in value[self.COLUMNS_KEY].items()}
+        return [{key: column[index] for key, column in columns.items()} for index in range(value['length'])]
+
+
+RESULT_CODECS: Dict[str, ResultCodec] = {i.content_type: i for i in (JsonCodec(), MsgpackCodec(), ColumnarCodec())}
+
+
+def get_codec(content_type: str) -> ResultCodec:
+    if content_type not in RESULT_CODECS:
+        raise ValueError(f'unknown result content type {content_type}, expected one of {list(RESULT_CODECS)}')
+    return RESULT_CODECS[content_type]
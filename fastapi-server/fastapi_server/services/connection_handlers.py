@@ -2,19 +2,58 @@ import asyncio
 import inspect
 import logging
 import tempfile
-from typing import BinaryIO, Callable, Coroutine, Union
+from typing import BinaryIO, Callable, Coroutine, List, Tuple, Union
 
 import aio_pika
-from aio_pika.abc import AbstractIncomingMessage
-from fastapi_server.constants import RABBITMQ_CONNECTION_URL, RABBITMQ_JOB_QUEUE_NAME
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage, AbstractRobustConnection
+from aio_pika.pool import Pool
+from fastapi_server.constants import (
+    RABBITMQ_CHANNEL_POOL_SIZE,
+    RABBITMQ_CONNECTION_URL,
+    RABBITMQ_JOB_QUEUE_NAME,
+    RABBITMQ_PUBLISHER_CONFIRMS,
+)
 
 log = logging.getLogger(__name__)
 
 
 class RabbitMQHandler:
+    # publishing reuses one long-lived connection and a pool of channels instead of a new connection per message
+    connection:      Union[AbstractRobustConnection, None] = None
+    channel_pool:    Union[Pool, None] = None
+    connection_lock: Union[asyncio.Lock, None] = None
+    
+    @classmethod
+    async def get_connection(cls) -> AbstractRobustConnection:
+        """the shared publishing connection. it is a robust connection, so it reconnects by itself if the broker goes away"""
+        cls.connection_lock = cls.connection_lock or asyncio.Lock()
+        async with cls.connection_lock:
+            if cls.connection is None or cls.connection.is_closed:
+                cls.connection = await aio_pika.connect_robust(RABBITMQ_CONNECTION_URL, timeout=5)
+        return cls.connection
+    
+    @classmethod
+    async def _get_channel(cls) -> AbstractChannel:
+        connection = await cls.get_connection()
+        return await connection.channel(publisher_confirms=RABBITMQ_PUBLISHER_CONFIRMS)
+    
+    @classmethod
+    def get_channel_pool(cls) -> Pool:
+        if cls.channel_pool is None:
+            cls.channel_pool = Pool(cls._get_channel, max_size=RABBITMQ_CHANNEL_POOL_SIZE)
+        return cls.channel_pool
+    
+    @classmethod
+    async def close(cls) -> None:
+        if cls.channel_pool is not None:
+            await cls.channel_pool.close()
+        if cls.connection is not None:
+            await cls.connection.close()
+        cls.channel_pool = cls.connection = None
+    
     @classmethod
     async def listen(cls, queue_name:str , on_message_handler: Union[Callable, Coroutine, None]=None) -> None:
-        connection = await aio_pika.connect(RABBITMQ_CONNECTION_URL, timeout=5)
+        connection = await aio_pika.connect_robust(RABBITMQ_CONNECTION_URL, timeout=5)
 
         if on_message_handler:
             on_message_handler = cls.wrap_message_handler(on_message_handler)
@@ -37,34 +76,73 @@ class RabbitMQHandler:
             await asyncio.Future() # keep the listener running indefinitely 
 
     @classmethod
-    async def publish(cls, queue_name:str, message: Union[str, BinaryIO, tempfile.SpooledTemporaryFile, tempfile._TemporaryFileWrapper, bytes], headers=None) -> None:
-        headers = headers or {}
-        connection = await aio_pika.connect(RABBITMQ_CONNECTION_URL)
+    async def listen_to_exchange(cls, exchange_name:str, on_message_handler: Union[Callable, Coroutine], prefetch_count:int=1) -> None:
+        """consume every message published to a fanout exchange through a queue that belongs to this process only"""
+        connection = await aio_pika.connect_robust(RABBITMQ_CONNECTION_URL, timeout=5)
+        on_message_handler = cls.wrap_message_handler(on_message_handler)
 
         async with connection:
             channel = await connection.channel()
-            
-            if isinstance(message, str):
-                message_body = message.encode()
-            elif isinstance(message, (BinaryIO, tempfile.SpooledTemporaryFile, tempfile._TemporaryFileWrapper)):
-                message_body = message.read()
-            elif isinstance(message, bytes):
-                message_body = message
-            else:
-                log.exception(f"Tried to publish message of type{type(message)}")
-                raise ValueError
-
-            message_obj = aio_pika.Message(
-                message_body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-                headers=headers
-            )
+            await channel.set_qos(prefetch_count=prefetch_count)
+
+            exchange = await channel.declare_exchange(exchange_name, aio_pika.ExchangeType.FANOUT, durable=True)
+            queue = await channel.declare_queue(exclusive=True) # server-named queue that is deleted when this process disconnects
+            await queue.bind(exchange)
+            await queue.consume(on_message_handler)
 
-            # Sending the message
-            await channel.default_exchange.publish(
+            log.info(f" [*] Waiting for messages from exchange {exchange_name} on queue {queue.name}")
+            await asyncio.Future() # keep the listener running indefinitely
+
+    @classmethod
+    async def publish(cls, queue_name:str, message: Union[str, BinaryIO, tempfile.SpooledTemporaryFile, tempfile._TemporaryFileWrapper, bytes], headers=None, exchange_name:Union[str, None]=None) -> None:
+        """publish a message to queue_name, or to the exchange exchange_name with queue_name as the routing key
+        the exchange has to be declared beforehand with declare_exchange"""
+        headers = headers or {}
+        if isinstance(message, str):
+            message_body = message.encode()
+        elif isinstance(message, (BinaryIO, tempfile.SpooledTemporaryFile, tempfile._TemporaryFileWrapper)):
+            message_body = message.read()
+        elif isinstance(message, bytes):
+            message_body = message
+        else:
+            log.exception(f"Tried to publish message of type{type(message)}")
+            raise ValueError
+
+        message_obj = aio_pika.Message(
+            message_body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            headers=headers
+        )
+
+        # Sending the message on a pooled channel
+        async with cls.get_channel_pool().acquire() as channel:
+            exchange = await channel.get_exchange(exchange_name, ensure=False) if exchange_name else channel.default_exchange
+            await exchange.publish(
                 message_obj, routing_key=queue_name,
             )
         log.debug(f'sent on channel {queue_name} | {message_obj}')
 
+    @classmethod
+    async def publish_many(cls, queue_name:str, messages: List[Tuple[bytes, dict]]) -> None:
+        """publish (body, headers) messages to queue_name over a single pooled channel
+        the publishes are pipelined, so the broker confirms them together instead of one round trip per message"""
+        async with cls.get_channel_pool().acquire() as channel:
+            await asyncio.gather(*[channel.default_exchange.publish(
+                aio_pika.Message(body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT, headers=headers), routing_key=queue_name,
+            ) for body, headers in messages])
+        log.debug(f'sent {len(messages)} messages on channel {queue_name}')
+
+    @classmethod
+    async def declare_exchange(cls, exchange_name:str) -> None:
+        """declare a durable fanout exchange, every queue bound to it receives a copy of each message"""
+        async with cls.get_channel_pool().acquire() as channel:
+            await channel.declare_exchange(exchange_name, aio_pika.ExchangeType.FANOUT, durable=True)
+
+    @classmethod
+    async def declare_queue(cls, queue_name:str) -> None:
+        """declare a durable queue, so messages published to it are kept until a worker subscribes"""
+        async with cls.get_channel_pool().acquire() as channel:
+            await channel.declare_queue(queue_name, durable=True)
+
     @classmethod
     def wrap_message_handler(cls, f: Union[Callable, Coroutine]):
         if inspect.iscoroutinefunction(f):
@@ -0,0 +1,67 @@
+import io
+import logging
+from typing import Tuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi_server.constants import IMAGE_UPLOAD_CHUNK_SIZE, IMAGE_UPLOAD_MAX_BYTES, IMAGE_UPLOAD_MAX_SIDE
+from PIL import Image
+from starlette.concurrency import run_in_threadpool
+
+log = logging.getLogger(__name__)
+
+# the first bytes of every file of each supported format
+IMAGE_SIGNATURES = {
+    'png': b'\x89PNG\r\n\x1a\n',
+    'jpg': b'\xff\xd8\xff',
+}
+
+
+def detect_image_format(header: bytes) -> str:
+    for codec, signature in IMAGE_SIGNATURES.items():
+        if header.startswith(signature): return codec
+    raise HTTPException(400, f'The file must be either a .jpg or .png image')
+
+
+async def read_image_upload(image: UploadFile, max_bytes: int = IMAGE_UPLOAD_MAX_BYTES,
+                            chunk_size: int = IMAGE_UPLOAD_CHUNK_SIZE) -> Tuple[bytes, str]:
+    """read an uploaded image a chunk at a time without blocking the event loop, returning its bytes and its format
+    uploads that are not png or jpg images are rejected after their first chunk, and ones that are too large as soon as they pass max_bytes"""
+    too_large = HTTPException(status_code=413, detail=f'Image files cannot be larger than {max_bytes // 1_048_576}mb')
+    if image.size is not None and image.size > max_bytes: raise too_large
+    
+    chunks = [await image.read(chunk_size)]
+    codec = detect_image_format(chunks[0])
+    
+    size = len(chunks[0])
+    while chunk := await image.read(chunk_size):
+        size += len(chunk)
+        if size > max_bytes: raise too_large
+        chunks.append(chunk)
+    return b''.join(chunks), codec
+
+
+def downscale_image(data: bytes, codec: str, max_side: int = IMAGE_UPLOAD_MAX_SIDE) -> Tuple[bytes, str]:
+    """scale the image down so its longest side is at most max_side and re-encode it as a jpg, the workers only need an RGB image of that size
+    images that are already small enough, or that cannot be decoded, are returned as they are"""
+    if max_side <= 0: return data, codec
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if max(image.size) <= max_side: return data, codec
+            
+            original_size = image.size
+            image = image.convert('RGB')
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=90)
+    except Exception:
+        log.exception('unable to downscale image, sending it as it was uploaded')
+        return data, codec
+    
+    log.debug(f'downscaled image from {original_size} to {image.size}, {len(data)} to {output.tell()} bytes')
+    return output.getvalue(), 'jpg'
+
+
+async def prepare_image_upload(image: UploadFile) -> Tuple[bytes, str]:
+    """the validated, downscaled image to publish for an upload, and its format"""
+    data, codec = await read_image_upload(image)
+    return await run_in_threadpool(downscale_image, data, codec)
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import logging
+import threading
+import unicodedata
+from dataclasses import asdict, dataclass
+from typing import Callable, Union
+
+from fastapi_server.constants import (
+    RESULT_CACHE_IN_FLIGHT_TTL,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_TTL,
+)
+from fastapi_server.services.result_store import InMemoryResultStore
+
+log = logging.getLogger(__name__)
+
+
+def normalize_payload(payload: Union[str, bytes]) -> bytes:
+    """texts that only differ in unicode composition, line endings or surrounding whitespace are treated as the same request"""
+    if isinstance(payload, (bytes, bytearray)): return bytes(payload)
+    text = unicodedata.normalize('NFC', payload).replace('\r\n', '\n').strip()
+    return text.encode()
+
+
+def request_cache_key(task_type: str, payload: Union[str, bytes], parameters: Union[dict, None] = None) -> str:
+    """sha256 of the task type, the normalized payload and the job parameters. the worker computes the same key for requests without one,
+    checked by tests/test_wire_format.py"""
+    digest = hashlib.sha256()
+    digest.update(task_type.encode())
+    digest.update(b'\0')
+    digest.update(json.dumps(parameters or {}, sort_keys=True, default=str).encode())
+    digest.update(b'\0')
+    digest.update(normalize_payload(payload))
+    return digest.hexdigest()
+
+
+@dataclass
+class ResultCacheMetrics:
+    hits:      int = 0 # answered with the task id of a completed job
+    coalesced: int = 0 # answered with the task id of a job that is still running
+    misses:    int = 0
+    entries:   int = 0
+    in_flight: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.coalesced + self.misses
+        return (self.hits + self.coalesced) / lookups if lookups else 0.0
+
+    def asdict(self) -> dict:
+        return {**asdict(self), 'hit_rate': self.hit_rate}
+
+
+class ResultCache:
+    """maps the cache key of a request to the task id that answers it, either a completed job or one that is still in flight"""
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, ttl: float = RESULT_CACHE_TTL,
+                 in_flight_ttl: float = RESULT_CACHE_IN_FLIGHT_TTL) -> None:
+        self.completed = InMemoryResultStore(max_entries=max_entries, ttl=ttl)
+        self.in_flight = InMemoryResultStore(max_entries=max_entries, ttl=in_flight_ttl) # jobs that never answer expire after in_flight_ttl
+        self._metrics  = ResultCacheMetrics()
+        self._lock     = threading.Lock()
+
+    def lookup(self, key: str, is_completed: Callable[[str], bool]) -> Union[str, None]:
+        """task id whose result answers the request, or None if a new job has to be started
+        is_completed: checks that the result of a cached task id has not been evicted from the result store in the meantime"""
+        with self._lock:
+            task_id = self.completed.get(key)
+            if task_id is not None and is_completed(task_id):
+                self._metrics.hits += 1
+                return task_id
+            if task_id is not None: self.completed.delete(key)
+
+            task_id = self.in_flight.get(key)
+            if task_id is not None:
+                self._metrics.coalesced += 1
+                return task_id
+
+            self._metrics.misses += 1
+            return None
+
+    def start(self, key: str, task_id: str) -> None:
+        """identical requests are coalesced onto task_id until it completes"""
+        with self._lock:
+            self.in_flight.put(key, task_id)
+
+    def abandon(self, key: str, task_id: str) -> None:
+        """the job could not be started, so later requests start their own"""
+        with self._lock:
+            if self.in_flight.get(key) == task_id: self.in_flight.delete(key)
+
+    def complete(self, key: str, task_id: str) -> None:
+        with self._lock:
+            self.in_flight.delete(key)
+            self.completed.put(key, task_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.completed.clear()
+            self.in_flight.clear()
+            self._metrics = ResultCacheMetrics()
+
+    def metrics(self) -> ResultCacheMetrics:
+        self._metrics.entries   = self.completed.metrics().entries
+        self._metrics.in_flight = self.in_flight.metrics().entries
+        return self._metrics
@@ -0,0 +1,255 @@
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Tuple, Union
+
+from fastapi_server.constants import (
+    RESULT_STORE,
+    RESULT_STORE_MAX_BYTES,
+    RESULT_STORE_MAX_ENTRIES,
+    RESULT_STORE_SQLITE_PATH,
+    RESULT_STORE_TTL,
+)
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class ResultStoreMetrics:
+    hits:        int = 0
+    misses:      int = 0
+    evictions:   int = 0 # entries removed to stay under max_entries or max_bytes
+    expirations: int = 0 # entries removed because their ttl passed
+    entries:     int = 0
+    bytes:       int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def asdict(self) -> dict:
+        return {**asdict(self), 'hit_rate': self.hit_rate}
+
+
+def size_of(value: Any) -> int:
+    """approximate memory used by a stored value, measured by its serialised size"""
+    if isinstance(value, (bytes, bytearray)): return len(value)
+    if isinstance(value, str): return len(value.encode())
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class ResultStore(ABC):
+    """key-value store for job results with a size cap, a ttl per entry and least-recently-used eviction"""
+    blocking = False # whether get and put wait on disk, callers on the event loop then run lookups in a thread
+    
+    def __init__(self, max_entries: int = RESULT_STORE_MAX_ENTRIES, max_bytes: int = RESULT_STORE_MAX_BYTES,
+                 ttl: Union[float, None] = RESULT_STORE_TTL) -> None:
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        self.ttl         = ttl
+        self._metrics    = ResultStoreMetrics()
+
+    @abstractmethod
+    def get(self, key: str, default=None) -> Any: ...
+
+    @abstractmethod
+    def put(self, key: str, value: Any, ttl: Union[float, None] = None) -> None:
+        """store value under key. ttl overrides the store ttl for this entry"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None: ...
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+    def metrics(self) -> ResultStoreMetrics:
+        return self._metrics
+
+    @abstractmethod
+    def __contains__(self, key: str) -> bool: ...
+
+    def _expires_at(self, ttl: Union[float, None]) -> Union[float, None]:
+        ttl = ttl if ttl is not None else self.ttl
+        return time.monotonic() + ttl if ttl else None
+
+
+class InMemoryResultStore(ResultStore):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._entries: 'OrderedDict[str, Tuple[Any, Union[float, None], int]]' = OrderedDict() # key: (value, expires_at, size), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default=None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry):
+                self._remove(key)
+                self._metrics.expirations += 1
+                entry = None
+
+            if entry is None:
+                self._metrics.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self._metrics.hits += 1
+            return entry[0]
+
+    def put(self, key: str, value: Any, ttl: Union[float, None] = None) -> None:
+        size = size_of(value)
+        with self._lock:
+            if key in self._entries: self._remove(key)
+            self._entries[key] = (value, self._expires_at(ttl), size)
+            self._metrics.entries += 1
+            self._metrics.bytes   += size
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries: self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._metrics = ResultStoreMetrics()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._is_expired(entry)
+
+    def _is_expired(self, entry) -> bool:
+        expires_at = entry[1]
+        return expires_at is not None and expires_at <= time.monotonic()
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self._metrics.entries -= 1
+        self._metrics.bytes   -= size
+
+    def _evict(self) -> None:
+        # expired entries are dropped when they are looked up, or here while they are the least recently used entry, so a put never
+        # scans the whole store. then the least recently used entries are dropped until the store is under its limits again
+        while self._entries and self._is_expired(next(iter(self._entries.values()))):
+            self._remove(next(iter(self._entries)))
+            self._metrics.expirations += 1
+
+        while self._entries and (len(self._entries) > self.max_entries or self._metrics.bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self._metrics.evictions += 1
+
+
+class SQLiteResultStore(ResultStore):
+    """results kept in a sqlite database, so they survive restarts of the server. meant for a single server process in development:
+    every call pickles and waits on the database, and the put of each arriving result still runs on the event loop"""
+    blocking = True
+    
+    def __init__(self, path: str = RESULT_STORE_SQLITE_PATH, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL') # with WAL, commits are not synced to disk one by one
+        self._connection.execute('''CREATE TABLE IF NOT EXISTS results (
+                                        key         TEXT PRIMARY KEY,
+                                        value       BLOB NOT NULL,
+                                        size        INTEGER NOT NULL,
+                                        expires_at  REAL,
+                                        last_access REAL NOT NULL)''')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)')
+        # running totals, counted once here for the results kept from before a restart and then updated by every change
+        self._metrics.entries, self._metrics.bytes = self._connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+
+    def get(self, key: str, default=None) -> Any:
+        with self._lock:
+            row = self._connection.execute('SELECT value, expires_at FROM results WHERE key = ?', (key,)).fetchone()
+            if row is not None and self._is_expired(row[1]):
+                self._delete(key)
+                self._metrics.expirations += 1
+                row = None
+
+            if row is None:
+                self._metrics.misses += 1
+                return default
+
+            self._connection.execute('UPDATE results SET last_access = ? WHERE key = ?', (time.time(), key))
+            self._metrics.hits += 1
+            return pickle.loads(row[0])
+
+    def put(self, key: str, value: Any, ttl: Union[float, None] = None) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        expires_at = self._expires_at(ttl)
+        with self._lock:
+            self._delete(key)
+            self._connection.execute('INSERT INTO results VALUES (?, ?, ?, ?, ?)',
+                                     (key, blob, len(blob), self._to_wall_clock(expires_at), time.time()))
+            self._metrics.entries += 1
+            self._metrics.bytes   += len(blob)
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._delete(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute('DELETE FROM results')
+            self._metrics = ResultStoreMetrics()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            row = self._connection.execute('SELECT expires_at FROM results WHERE key = ?', (key,)).fetchone()
+        return row is not None and not self._is_expired(row[0])
+
+    # expiry times are stored as wall clock time, as monotonic time does not carry over between processes
+    def _to_wall_clock(self, expires_at: Union[float, None]) -> Union[float, None]:
+        return None if expires_at is None else time.time() + (expires_at - time.monotonic())
+
+    def _is_expired(self, expires_at: Union[float, None]) -> bool:
+        return expires_at is not None and expires_at <= time.time()
+
+    def _delete(self, key: str) -> None:
+        row = self._connection.execute('SELECT size FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None: return
+        self._connection.execute('DELETE FROM results WHERE key = ?', (key,))
+        self._metrics.entries -= 1
+        self._metrics.bytes   -= row[0]
+
+    def _evict(self) -> None:
+        now = time.time()
+        expired, expired_bytes = self._connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results WHERE expires_at <= ?', (now,)).fetchone()
+        if expired:
+            self._connection.execute('DELETE FROM results WHERE expires_at <= ?', (now,))
+            self._metrics.expirations += expired
+            self._metrics.entries     -= expired
+            self._metrics.bytes       -= expired_bytes
+
+        entries, total_bytes = self._metrics.entries, self._metrics.bytes
+        if entries <= self.max_entries and total_bytes <= self.max_bytes: return
+
+        # walk from the least recently used entry, deleting until both limits are met
+        to_delete = []
+        for key, size in self._connection.execute('SELECT key, size FROM results ORDER BY last_access'):
+            if entries <= self.max_entries and total_bytes <= self.max_bytes: break
+            to_delete.append((key,))
+            entries     -= 1
+            total_bytes -= size
+        self._connection.executemany('DELETE FROM results WHERE key = ?', to_delete)
+        self._metrics.evictions += len(to_delete)
+        self._metrics.entries, self._metrics.bytes = entries, total_bytes
+
+
+def create_result_store(store_type: str = RESULT_STORE) -> ResultStore:
+    if store_type == 'memory':
+        return InMemoryResultStore()
+    if store_type == 'sqlite':
+        return SQLiteResultStore()
+    raise ValueError(f"unknown result store {store_type}, expected 'memory' or 'sqlite'")
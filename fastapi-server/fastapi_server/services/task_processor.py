@@ -1,13 +1,23 @@
 
+import asyncio
+import json
 import logging
-import pickle
 import tempfile
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import BinaryIO, List, Union
+from typing import AsyncIterator, BinaryIO, Callable, Dict, Iterable, List, Set, Union
 
 from aio_pika.abc import AbstractIncomingMessage
-from fastapi_server.constants import RABBITMQ_JOB_QUEUE_NAME
+from fastapi_server.constants import (
+    BATCH_DOCUMENTS_PER_JOB,
+    BATCH_MAX_DOCUMENTS,
+    JOB_ROUTING,
+    RABBITMQ_JOB_QUEUE_NAME,
+    RABBITMQ_RESULT_EXCHANGE_NAME,
+    RABBITMQ_RESULT_QUEUE_NAME,
+    RESULT_CACHE_ENABLED,
+    RESULT_ROUTING,
+)
 from fastapi_server.entities.POST_bodies import (
     Image_Rank_with_Sentences,
     Sentence_Extraction_Request,
@@ -17,7 +27,10 @@ from fastapi_server.entities.responses import (
     endpoint_not_implemented_response,
     text_response,
 )
+from fastapi_server.services.codecs import JSON_CONTENT_TYPE, get_codec
 from fastapi_server.services.connection_handlers import RabbitMQHandler
+from fastapi_server.services.result_cache import ResultCache, request_cache_key
+from fastapi_server.services.result_store import ResultStore, create_result_store
 from ulid import ulid
 
 log = logging.getLogger(__name__)
@@ -28,6 +41,19 @@ class TaskType(Enum):
     IMAGE_TRANSCRIPTION = 'IMAGE_TRANSCRIPTION'
     SENTENCE_EXTRACTION = 'SENTENCE_EXTRACTION'
     SENTENCE_EXTRACTION_LIST = 'SENTENCE_EXTRACTION_LIST'
+    KEYWORD_EXTRACTION_BATCH = 'KEYWORD_EXTRACTION_BATCH' # many KEYWORD_EXTRACTION tasks in one message, each gets its own result
+    
+
+def job_queue_name(task_type: str, routing: str = JOB_ROUTING) -> str:
+    """queue the workers serving task_type consume"""
+    if routing == 'per_task_type': return f'{RABBITMQ_JOB_QUEUE_NAME}.{task_type}'
+    if routing == 'single':        return RABBITMQ_JOB_QUEUE_NAME
+    raise ValueError(f"unknown job routing {routing}, expected 'per_task_type' or 'single'")
+    
+    
+def ranking_parameters(**parameters) -> dict:
+    """the parameters of a text job that were set, sent to the worker as other_info. unset ones are left out so they do not change the cache key"""
+    return {name: value for name, value in parameters.items() if value}
     
     
 @dataclass
@@ -38,10 +64,42 @@ class JobSpecification:
     other_information: dict = field(default_factory=lambda: {})
     
     task_id: str = field(default_factory=lambda: ulid())
+    cache_key: Union[str, None] = None
+    content_type: Union[str, None] = None # encoding of data for completed jobs, data is then the bytes the worker sent
+    
+    def decoded_data(self):
+        return get_codec(self.content_type).decode(self.data) if self.content_type else self.data # type: ignore
+    
+    
+@dataclass
+class BatchSpecification:
+    """the batch id is a ulid and the number of texts, and the task id of each text is derived from both, so any api replica can resolve
+    a batch without having seen it created"""
+    size: int
+    prefix: str = field(default_factory=lambda: ulid())
+    
+    @property
+    def batch_id(self) -> str:
+        return f'{self.prefix}-{self.size}'
+    
+    @property
+    def task_ids(self) -> List[str]:
+        return [f'{self.prefix}.{i}' for i in range(self.size)]
+    
+    @classmethod
+    def from_batch_id(cls, batch_id: str) -> Union['BatchSpecification', None]:
+        prefix, _, size = batch_id.rpartition('-')
+        if len(prefix) != len(ulid()) or not size.isdigit() or not 0 < int(size) <= BATCH_MAX_DOCUMENTS: return None
+        return cls(int(size), prefix)
     
     
 class JobProcessor:
-    completed_jobs = {}
+    job_queue_provider    = RabbitMQHandler
+    result_queue_provider = RabbitMQHandler
+    declared_job_queues: Set[str] = set()
+    completed_jobs: ResultStore = create_result_store()
+    result_cache:   ResultCache = ResultCache()
+    result_waiters: Dict[str, Set[asyncio.Future]] = {} # futures of requests waiting on each task id, resolved by handle_new_result
     
     @classmethod
     async def create_image_rank_job(cls, file: Union[BinaryIO, tempfile.SpooledTemporaryFile, tempfile._TemporaryFileWrapper], codec: str):
@@ -51,18 +109,19 @@ class JobProcessor:
             other_information={'codec': codec}
             )
         
-        job_start_result = await cls.publish_new_job(job)
-        return job if job_start_result else False
+        return await cls.submit_job(job)
             
     @classmethod
     async def create_keyword_extraction_job(cls, request_body: Text_Transcribe_Request):
         request_text = request_body.text
         job = JobSpecification(
             task_type=TaskType.KEYWORD_EXTRACTION,
-            data=request_text,)
+            data=request_text,
+            other_information=ranking_parameters(seed_keywords=request_body.seed_keywords, document_id=request_body.document_id,
+                                                 direction=request_body.direction),
+            )
         
-        job_start_result = await cls.publish_new_job(job)
-        return job if job_start_result else False
+        return await cls.submit_job(job)
     
     @classmethod
     async def create_sentence_extraction_job(cls, request_body: Sentence_Extraction_Request):
@@ -70,10 +129,11 @@ class JobProcessor:
         job = JobSpecification(
             task_type=TaskType.SENTENCE_EXTRACTION,
             data=request_text,
+            other_information=ranking_parameters(queries=request_body.queries, document_id=request_body.document_id,
+                                                 direction=request_body.direction),
             )
         
-        job_start_result = await cls.publish_new_job(job)
-        return job if job_start_result else False
+        return await cls.submit_job(job)
     
     @classmethod
     async def create_image_rank_w_sentences_job(cls, request_body: Image_Rank_with_Sentences):
@@ -83,49 +143,166 @@ class JobProcessor:
             data=request_text,
             )
         
-        job_start_result = await cls.publish_new_job(job)
-        return job if job_start_result else False
+        return await cls.submit_job(job)
+        
+                
+    @classmethod
+    async def submit_job(cls, job: JobSpecification, use_cache: bool = RESULT_CACHE_ENABLED):
+        """publish the job, unless an identical request has completed or is still running. the job then takes over the task id of that request"""
+        if not use_cache:
+            return job if await cls.publish_new_job(job) else False
+        
+        job.cache_key = request_cache_key(job.task_type.value, job.data or job.pickled_data, job.other_information)
+        cached_task_id = await cls.off_loop(cls.result_cache.lookup, job.cache_key, lambda task_id: task_id in cls.completed_jobs)
+        if cached_task_id:
+            log.info(f'answering {job.task_type.value} request with the result of task {cached_task_id}')
+            job.task_id = cached_task_id
+            return job
+        
+        # claimed before publishing, so identical requests that arrive while this one is being published wait on it too
+        cls.result_cache.start(job.cache_key, job.task_id)
+        if await cls.publish_new_job(job): return job
         
+        cls.result_cache.abandon(job.cache_key, job.task_id)
+        return False
+                
+    @classmethod
+    async def create_keyword_extraction_batch(cls, texts: List[str], documents_per_job: int = BATCH_DOCUMENTS_PER_JOB):
+        """start keyword extraction for every text, returning a batch with one task id per text in the same order
+        the texts are sent documents_per_job at a time, so the worker can parse them together"""
+        batch = BatchSpecification(len(texts))
+        task_ids = batch.task_ids
+        jobs = [JobSpecification(
+                    task_type=TaskType.KEYWORD_EXTRACTION_BATCH,
+                    data=json.dumps(texts[start:start + documents_per_job]),
+                    other_information={'task_ids': task_ids[start:start + documents_per_job]},
+                    )
+                for start in range(0, len(texts), documents_per_job)]
+        
+        if not await cls.publish_new_jobs(jobs): return False
+        return batch
+    
+    @classmethod
+    def get_batch(cls, batch_id: str) -> Union[List[str], None]:
+        """task ids of the texts of a batch, or None if batch_id is not a batch id"""
+        batch = BatchSpecification.from_batch_id(batch_id)
+        return batch.task_ids if batch else None
                 
     @classmethod 
     async def publish_new_job(cls, job: JobSpecification):
+        return await cls.publish_new_jobs([job])
+    
+    @classmethod
+    async def publish_new_jobs(cls, jobs: List[JobSpecification]):
+        """publish jobs of the same task type, more than one job is sent over a single channel"""
+        if not jobs: return True
+        try:
+            messages = [cls._job_message(job) for job in jobs]
+            queue_name = job_queue_name(jobs[0].task_type.value)
+            if queue_name not in cls.declared_job_queues:
+                # the default exchange drops messages for queues that do not exist yet, e.g. before any worker of this task type has started
+                await cls.job_queue_provider.declare_queue(queue_name)
+                cls.declared_job_queues.add(queue_name)
+            
+            if len(messages) == 1:
+                await cls.job_queue_provider.publish(queue_name, *messages[0])
+            else:
+                await cls.job_queue_provider.publish_many(queue_name, [(i.encode() if isinstance(i, str) else i, headers) for i, headers in messages])
+            return True
+        except Exception:
+            log.exception(f'Error publishing new jobs: {jobs}')
+            return False
+        
+    @classmethod
+    def _job_message(cls, job: JobSpecification):
         if job.data and job.pickled_data: raise ValueError("currently supports only job.data or job.pickled_data")
         headers = {'task_type': job.task_type.value, 'task_id':job.task_id, 'other_info': job.other_information}
+        if job.cache_key: headers['cache_key'] = job.cache_key
         
         if job.pickled_data: headers['pickled'] = True
         data = job.data or job.pickled_data
         if not data: raise ValueError
         
         log.info(headers)
-        try:
-            await RabbitMQHandler.publish(RABBITMQ_JOB_QUEUE_NAME, data, headers)
-            return True
-        except Exception:
-            log.exception(f'Error publishing new job: {job}')
-            return False
+        return data, headers
         
+    @classmethod
+    async def listen_for_results(cls, routing: str = RESULT_ROUTING):
+        if routing == 'fanout':
+            await cls.result_queue_provider.listen_to_exchange(RABBITMQ_RESULT_EXCHANGE_NAME, on_message_handler=cls.handle_new_result)
+        elif routing == 'queue':
+            await cls.result_queue_provider.listen(RABBITMQ_RESULT_QUEUE_NAME, on_message_handler=cls.handle_new_result)
+        else:
+            raise ValueError(f"unknown result routing {routing}, expected 'fanout' or 'queue'")
+    
     @classmethod
     def handle_new_result(cls, message: AbstractIncomingMessage):
         headers = message.headers
     
         task_type = headers['task_type']
         task_id   = headers['task_id']
-        pickled   = headers.get('pickled', None)
-        
-        data = message.body.decode() if not pickled else pickle.loads(message.body) 
         
+        # results are kept encoded, and checked against the codec registry so that unknown encodings are rejected here.
+        # messages without a content type are json, which is what the workers sent before results were tagged with one
+        content_type = get_codec(message.content_type or JSON_CONTENT_TYPE).content_type
         
         if task_type in [i.value for i in TaskType]:
             job = JobSpecification(
                 task_type=str(task_type), # type: ignore
-                data=data,
-                task_id=str(task_id)
+                data=message.body,
+                task_id=str(task_id),
+                content_type=content_type,
                 )
-            cls.completed_jobs[task_id] = job
+            cls.completed_jobs.put(str(task_id), job)
+            if headers.get('cache_key') and headers.get('failed'):
+                # the error is returned to the requests waiting on the task, but a new request for the same input starts a new job
+                cls.result_cache.abandon(str(headers['cache_key']), str(task_id))
+            elif headers.get('cache_key'):
+                cls.result_cache.complete(str(headers['cache_key']), str(task_id))
+            cls._notify_waiters(str(task_id), job)
         else:
             raise NotImplementedError
+    
+    @classmethod
+    def _notify_waiters(cls, task_id: str, job: JobSpecification):
+        for future in cls.result_waiters.pop(task_id, set()):
+            if not future.done(): future.set_result(job)
+    
+    @classmethod
+    async def wait_for_result(cls, task_id: str, timeout: Union[float, None]=None) -> Union[JobSpecification, None]:
+        """wait until the result of the task arrives, or return None if it has not arrived after timeout seconds"""
+        # the waiter is added before the store is read, so a result that arrives while a blocking store is read in a thread still wakes it
+        future = asyncio.get_running_loop().create_future()
+        cls.result_waiters.setdefault(task_id, set()).add(future)
+        try:
+            job = await cls.off_loop(cls.check_job_status, task_id)
+            if job: return job
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = cls.result_waiters.get(task_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters: del cls.result_waiters[task_id]
+    
+    @classmethod
+    async def iterate_results(cls, task_ids: Iterable[str], timeout: Union[float, None]=None) -> AsyncIterator[JobSpecification]:
+        """yield the results of the tasks in the order they complete, stopping once every result has arrived or timeout seconds have passed"""
+        waiting = [asyncio.ensure_future(cls.wait_for_result(task_id, timeout)) for task_id in dict.fromkeys(task_ids)]
+        try:
+            for next_result in asyncio.as_completed(waiting):
+                job = await next_result
+                if job: yield job
+        finally:
+            for i in waiting: i.cancel()
 
     
+    @classmethod
+    async def off_loop(cls, f: Callable, *args):
+        """call f, in a thread when the result store blocks so that the event loop keeps serving other requests"""
+        return await asyncio.to_thread(f, *args) if cls.completed_jobs.blocking else f(*args)
+    
     @classmethod
     def check_job_status(cls, task_id):
         # log.info(cls.completed_jobs)
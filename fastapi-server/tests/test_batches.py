@@ -0,0 +1,122 @@
+import asyncio
+import json
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from fastapi_server.routers import router
+from fastapi_server.services.task_processor import JobProcessor
+
+log = logging.getLogger(__name__)
+
+
+class Recording_Job_Queue:
+    def __init__(self):
+        self.published = [] # (queue name, list of (body, headers)) per publish call
+        
+    async def declare_queue(self, queue_name):
+        pass
+        
+    async def publish(self, queue_name, message, headers=None):
+        self.published.append((queue_name, [(message, headers)]))
+        
+    async def publish_many(self, queue_name, messages):
+        self.published.append((queue_name, list(messages)))
+
+
+class Result_Message:
+    def __init__(self, task_id: str, keyword: str):
+        self.headers = {'task_type': 'KEYWORD_EXTRACTION', 'task_id': task_id}
+        self.body = json.dumps({'keyword_nodes': [{'name': keyword}]}).encode()
+        self.content_type = 'application/json'
+
+
+@pytest.fixture
+def job_queue(monkeypatch):
+    job_queue = Recording_Job_Queue()
+    monkeypatch.setattr(JobProcessor, 'job_queue_provider', job_queue)
+    monkeypatch.setattr(JobProcessor, 'declared_job_queues', set())
+    JobProcessor.completed_jobs.clear()
+    yield job_queue
+    JobProcessor.completed_jobs.clear()
+
+
+@pytest.fixture
+def client(job_queue):
+    app = FastAPI()
+    app.include_router(router.router)
+    return TestClient(app)
+
+
+class TestBatchSubmission:
+    def test_texts_are_published_in_chunks(self, job_queue):
+        texts = [f'text {i}' for i in range(70)]
+        
+        batch = asyncio.run(JobProcessor.create_keyword_extraction_batch(texts, documents_per_job=32))
+        
+        assert len(job_queue.published) == 1
+        _, messages = job_queue.published[0]
+        assert len(messages) == 3
+        
+        published_texts, published_task_ids = [], []
+        for body, headers in messages:
+            assert headers['task_type'] == 'KEYWORD_EXTRACTION_BATCH'
+            published_texts.extend(json.loads(body))
+            published_task_ids.extend(headers['other_info']['task_ids'])
+        assert published_texts == texts
+        assert published_task_ids == batch.task_ids
+        assert JobProcessor.get_batch(batch.batch_id) == batch.task_ids
+        
+    def test_small_batch_is_one_message(self, job_queue):
+        asyncio.run(JobProcessor.create_keyword_extraction_batch(['a', 'b'], documents_per_job=32))
+        
+        assert [(queue_name, len(messages)) for queue_name, messages in job_queue.published] == [('job_queue.KEYWORD_EXTRACTION_BATCH', 1)]
+
+
+class TestBatchRoutes:
+    def test_json_list(self, client, job_queue):
+        response = client.post('/api/text_rank_batch', json=['first text', 'second text'])
+        
+        assert response.status_code == 200
+        assert len(response.json()['task_id_list']) == 2
+        
+    def test_ndjson_with_text_field(self, client, job_queue):
+        lines = [json.dumps({'request_id': i, 'body': f'text {i}'}) for i in range(3)]
+        
+        response = client.post('/api/text_rank_batch', params={'text_field': 'body'}, content='\n'.join(lines) + '\n',
+                               headers={'content-type': 'application/x-ndjson'})
+        
+        assert response.status_code == 200
+        _, messages = job_queue.published[0]
+        assert json.loads(messages[0][0]) == ['text 0', 'text 1', 'text 2']
+        
+    @pytest.mark.parametrize('body', [[], {'texts': [1, 2]}, {'text': 'not a list'}])
+    def test_invalid_batches_are_rejected(self, client, job_queue, body):
+        response = client.post('/api/text_rank_batch', json=body)
+        
+        assert response.status_code == 400
+        assert job_queue.published == []
+        
+    def test_results_are_streamed_as_ndjson(self, client):
+        batch = client.post('/api/text_rank_batch', json={'texts': ['first text', 'second text']}).json()
+        for task_id, keyword in zip(reversed(batch['task_id_list']), ['second', 'first']):
+            JobProcessor.handle_new_result(Result_Message(task_id, keyword))
+        
+        response = client.get('/api/batch_results', params={'batch_id': batch['batch_id']})
+        
+        assert response.headers['content-type'] == 'application/x-ndjson'
+        results = [json.loads(i) for i in response.text.splitlines()]
+        assert {i['task_id']: i['result']['keyword_nodes'][0]['name'] for i in results} == dict(zip(batch['task_id_list'], ['first', 'second']))
+        
+    def test_unknown_batch(self, client):
+        assert client.get('/api/batch_results', params={'batch_id': 'missing'}).status_code == 404
+        
+    def test_batch_is_resolved_without_having_been_created(self, job_queue):
+        batch = asyncio.run(JobProcessor.create_keyword_extraction_batch(['a', 'b', 'c']))
+        
+        # another replica has no record of the batch, only its id
+        assert JobProcessor.get_batch(batch.batch_id) == batch.task_ids
+        assert len(set(batch.task_ids)) == 3
+        assert JobProcessor.get_batch(batch.batch_id.rsplit('-', 1)[0] + '-0') is None
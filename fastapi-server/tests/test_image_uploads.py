@@ -0,0 +1,84 @@
+import asyncio
+import io
+import logging
+
+import pytest
+from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from fastapi_server.routers import router
+from fastapi_server.services.image_uploads import downscale_image, read_image_upload
+from fastapi_server.services.task_processor import JobProcessor
+
+log = logging.getLogger(__name__)
+
+
+def image_bytes(size=(1024, 768), format='PNG') -> bytes:
+    output = io.BytesIO()
+    Image.new('RGB', size, color=(200, 30, 30)).save(output, format=format)
+    return output.getvalue()
+
+
+@pytest.fixture
+def published(monkeypatch):
+    jobs = []
+    class Job:
+        def __init__(self, task_id): self.task_id = task_id
+    async def create_image_rank_job(data, codec):
+        jobs.append((data, codec))
+        return Job(f'task-{len(jobs)}')
+    monkeypatch.setattr(JobProcessor, 'create_image_rank_job', create_image_rank_job)
+    return jobs
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(router.router)
+    return TestClient(app)
+
+
+class TestImageTranscribeRoute:
+    def test_large_image_is_downscaled(self, client, published):
+        response = client.post('/api/image_transcribe', files=[('images', ('photo.png', image_bytes(), 'image/png'))])
+        
+        assert response.json() == {'task_id_list': ['task-1']}
+        data, codec = published[0]
+        assert codec == 'jpg'
+        assert max(Image.open(io.BytesIO(data)).size) == 384
+        
+    def test_file_that_is_not_an_image_is_rejected(self, client, published):
+        response = client.post('/api/image_transcribe', files=[('images', ('photo.png', b'not an image at all', 'image/png')),
+                                                               ('images', ('photo.jpg', image_bytes(format='JPEG'), 'image/jpeg'))])
+        
+        assert response.status_code == 400
+        assert published == []
+        
+
+class TestReadImageUpload:
+    def test_reads_in_chunks(self):
+        data = image_bytes()
+        
+        result = asyncio.run(read_image_upload(UploadFile(io.BytesIO(data)), chunk_size=1000))
+        
+        assert result == (data, 'png')
+        
+    def test_upload_over_limit_is_rejected(self):
+        upload = UploadFile(io.BytesIO(image_bytes(format='JPEG')))
+        
+        with pytest.raises(HTTPException) as e:
+            asyncio.run(read_image_upload(upload, max_bytes=100, chunk_size=64))
+        assert e.value.status_code == 413
+        
+        
+class TestDownscaleImage:
+    def test_small_image_is_unchanged(self):
+        data = image_bytes((200, 100))
+        
+        assert downscale_image(data, 'png', max_side=384) == (data, 'png')
+        
+    def test_downscaling_can_be_turned_off(self):
+        data = image_bytes()
+        
+        assert downscale_image(data, 'png', max_side=0) == (data, 'png')
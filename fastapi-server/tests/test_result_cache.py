@@ -0,0 +1,101 @@
+import asyncio
+import json
+import logging
+
+import pytest
+
+from fastapi_server.entities.POST_bodies import Text_Transcribe_Request
+from fastapi_server.services.result_cache import ResultCache
+from fastapi_server.services.task_processor import JobProcessor, TaskType
+
+log = logging.getLogger(__name__)
+
+
+class Result_Message:
+    def __init__(self, task_id: str, cache_key: str, data, failed: bool = False):
+        self.headers = {'task_type': TaskType.KEYWORD_EXTRACTION.value, 'task_id': task_id, 'pickled': True, 'cache_key': cache_key}
+        if failed: self.headers['failed'] = True
+        self.body = json.dumps(data).encode()
+        self.content_type = 'application/json'
+
+
+@pytest.fixture(autouse=True)
+def published(monkeypatch):
+    """jobs published to the broker, publishing yields to the event loop like a real broker round trip would"""
+    jobs = []
+    async def publish_new_job(job):
+        await asyncio.sleep(0)
+        jobs.append(job)
+        return True
+    
+    monkeypatch.setattr(JobProcessor, 'publish_new_job', publish_new_job)
+    JobProcessor.completed_jobs.clear()
+    JobProcessor.result_cache.clear()
+    yield jobs
+    JobProcessor.completed_jobs.clear()
+    JobProcessor.result_cache.clear()
+
+
+def submit(text: str):
+    return JobProcessor.create_keyword_extraction_job(Text_Transcribe_Request(text=text))
+
+
+class TestJobCoalescing:
+    def test_concurrent_identical_requests_share_one_job(self, published):
+        async def submit_all():
+            return await asyncio.gather(submit('some text'), submit('some text '), submit('other text'))
+        
+        first, second, other = asyncio.run(submit_all())
+        
+        assert len(published) == 2
+        assert first.task_id == second.task_id
+        assert other.task_id != first.task_id
+        assert JobProcessor.result_cache.metrics().coalesced == 1
+        
+    def test_completed_request_is_answered_from_the_result_store(self, published):
+        job = asyncio.run(submit('some text'))
+        JobProcessor.handle_new_result(Result_Message(job.task_id, job.cache_key, ['result']))
+        
+        repeat = asyncio.run(submit('some text'))
+        
+        assert len(published) == 1
+        assert repeat.task_id == job.task_id
+        assert JobProcessor.check_job_status(repeat.task_id).decoded_data() == ['result']
+        assert JobProcessor.result_cache.metrics().hits == 1
+        
+    def test_evicted_result_starts_a_new_job(self, published):
+        job = asyncio.run(submit('some text'))
+        JobProcessor.handle_new_result(Result_Message(job.task_id, job.cache_key, ['result']))
+        JobProcessor.completed_jobs.delete(job.task_id)
+        
+        repeat = asyncio.run(submit('some text'))
+        
+        assert len(published) == 2
+        assert repeat.task_id != job.task_id
+        
+    def test_failed_job_is_not_coalesced_onto(self, published):
+        job = asyncio.run(submit('some text'))
+        JobProcessor.handle_new_result(Result_Message(job.task_id, job.cache_key, {'error': 'no result'}, failed=True))
+        
+        retry = asyncio.run(submit('some text'))
+        
+        assert len(published) == 2
+        assert retry.task_id != job.task_id
+        assert JobProcessor.check_job_status(job.task_id).decoded_data() == {'error': 'no result'}
+        
+    def test_failed_publish_is_not_coalesced_onto(self, published, monkeypatch):
+        async def publish_fails(job): return False
+        monkeypatch.setattr(JobProcessor, 'publish_new_job', publish_fails)
+        
+        assert asyncio.run(submit('some text')) is False
+        assert JobProcessor.result_cache.metrics().in_flight == 0
+
+
+class TestResultCache:
+    def test_in_flight_expires(self):
+        cache = ResultCache(in_flight_ttl=0.01)
+        cache.start('key', 'task-1')
+        
+        assert cache.lookup('key', is_completed=lambda task_id: False) == 'task-1'
+        asyncio.run(asyncio.sleep(0.02))
+        assert cache.lookup('key', is_completed=lambda task_id: False) is None
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+import pytest
+
+from fastapi_server.constants import RABBITMQ_RESULT_EXCHANGE_NAME, RABBITMQ_RESULT_QUEUE_NAME
+from fastapi_server.services.result_store import InMemoryResultStore
+from fastapi_server.services.task_processor import JobProcessor, TaskType
+
+log = logging.getLogger(__name__)
+
+
+class Broker_Message:
+    def __init__(self, body: bytes, headers: dict):
+        self.body = body
+        self.headers = headers
+        self.content_type = 'application/json'
+
+
+class In_Memory_Broker:
+    """stand-in for rabbitmq with the two delivery modes result routing relies on:
+    consumers of a named queue compete for its messages, while every consumer of a fanout exchange gets its own copy"""
+    def __init__(self) -> None:
+        self.queue_consumers:    Dict[str, List[Callable]] = defaultdict(list)
+        self.exchange_consumers: Dict[str, List[Callable]] = defaultdict(list)
+        self.deliveries = 0
+        
+    def provider(self):
+        broker = self
+        class Provider:
+            @classmethod
+            async def listen(cls, queue_name, on_message_handler, prefetch_count=1):
+                broker.queue_consumers[queue_name].append(on_message_handler)
+                await asyncio.Future()
+                
+            @classmethod
+            async def listen_to_exchange(cls, exchange_name, on_message_handler, prefetch_count=1):
+                broker.exchange_consumers[exchange_name].append(on_message_handler)
+                await asyncio.Future()
+        return Provider
+    
+    def publish(self, queue_name: str, body: bytes, headers: dict, exchange_name=None):
+        message = Broker_Message(body, headers)
+        if exchange_name:
+            for handler in self.exchange_consumers[exchange_name]: handler(message)
+        else:
+            consumers = self.queue_consumers[queue_name]
+            consumers[self.deliveries % len(consumers)](message) # round robin, like a queue with several consumers
+        self.deliveries += 1
+
+
+def make_replicas(broker: In_Memory_Broker, count: int):
+    """api server replicas - JobProcessor subclasses that each have their own result store, like separate processes would"""
+    return [type(f'Replica_{i}', (JobProcessor,), {
+                'completed_jobs': InMemoryResultStore(),
+                'result_waiters': {},
+                'result_queue_provider': broker.provider(),
+            }) for i in range(count)]
+
+
+def publish_results_like_a_worker(broker: In_Memory_Broker, routing: str, task_ids: List[str]):
+    for task_id in task_ids:
+        headers = {'task_type': TaskType.KEYWORD_EXTRACTION.value, 'task_id': task_id}
+        body = json.dumps({'task': task_id}).encode()
+        if routing == 'fanout':
+            broker.publish('', body, headers, exchange_name=RABBITMQ_RESULT_EXCHANGE_NAME)
+        else:
+            broker.publish(RABBITMQ_RESULT_QUEUE_NAME, body, headers)
+
+
+async def run_replicas(routing: str, num_of_replicas: int, num_of_tasks: int):
+    """submit results while clients wait on every replica, returns how many (replica, task) lookups found their result"""
+    broker = In_Memory_Broker()
+    replicas = make_replicas(broker, num_of_replicas)
+    listeners = [asyncio.ensure_future(replica.listen_for_results(routing)) for replica in replicas]
+    await asyncio.sleep(0)
+    
+    task_ids = [f'task-{i}' for i in range(num_of_tasks)]
+    waiting = [asyncio.ensure_future(replica.wait_for_result(task_id, timeout=0.2)) for replica in replicas for task_id in task_ids]
+    await asyncio.sleep(0)
+    publish_results_like_a_worker(broker, routing, task_ids)
+    
+    results = await asyncio.gather(*waiting)
+    for listener in listeners: listener.cancel()
+    return sum(1 for i in results if i is not None)
+
+
+class TestResultRouting:
+    def test_fanout_lets_every_replica_answer(self):
+        found = asyncio.run(run_replicas('fanout', num_of_replicas=3, num_of_tasks=10))
+        
+        assert found == 3 * 10
+        
+    def test_single_queue_only_reaches_one_replica(self):
+        found = asyncio.run(run_replicas('queue', num_of_replicas=3, num_of_tasks=10))
+        
+        assert found == 10
+        
+    def test_unknown_routing(self):
+        with pytest.raises(ValueError):
+            asyncio.run(JobProcessor.listen_for_results('carrier pigeon'))
@@ -0,0 +1,106 @@
+import logging
+import time
+
+import pytest
+
+from fastapi_server.services.result_store import InMemoryResultStore, ResultStore, SQLiteResultStore
+
+log = logging.getLogger(__name__)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == 'memory':
+            return InMemoryResultStore(**kwargs)
+        return SQLiteResultStore(str(tmp_path / 'results.sqlite3'), **kwargs)
+    return make
+
+
+class TestResultStore:
+    def test_put_and_get(self, make_store):
+        store = make_store()
+        store.put('task-1', {'result': [1, 2, 3]})
+        
+        assert store.get('task-1') == {'result': [1, 2, 3]}
+        assert store.get('task-2') is None
+        assert store.metrics().hits == 1
+        assert store.metrics().misses == 1
+        
+    def test_ttl(self, make_store):
+        store = make_store(ttl=0.05)
+        store.put('task-1', 'short lived')
+        store.put('task-2', 'long lived', ttl=60)
+        time.sleep(0.1)
+        
+        assert 'task-1' not in store
+        assert store.get('task-1') is None
+        assert store.get('task-2') == 'long lived'
+        
+    def test_lru_eviction_by_entries(self, make_store):
+        store = make_store(max_entries=2)
+        store.put('task-1', 'a')
+        store.put('task-2', 'b')
+        time.sleep(0.01)
+        store.get('task-1')
+        store.put('task-3', 'c')
+        
+        assert 'task-1' in store
+        assert 'task-2' not in store
+        assert 'task-3' in store
+        assert store.metrics().evictions == 1
+        
+    def test_eviction_by_bytes(self, make_store):
+        store = make_store(max_bytes=2_500)
+        for i in range(5):
+            store.put(f'task-{i}', b'x' * 1_000)
+        
+        metrics = store.metrics()
+        assert metrics.entries == 2
+        assert metrics.bytes <= 2_500
+        assert metrics.evictions == 3
+        
+    def test_running_totals(self, make_store):
+        store = make_store()
+        store.put('task-1', b'x' * 50)
+        expected = store.metrics().bytes
+        store.put('task-2', b'x' * 10)
+        store.put('task-1', b'x' * 100)
+        store.put('task-1', b'x' * 50) # replacing an entry replaces its size
+        store.delete('task-2')
+        store.delete('task-3')
+        
+        assert (store.metrics().entries, store.metrics().bytes) == (1, expected)
+        
+    def test_expired_entries_leave_the_totals(self, make_store):
+        store = make_store(ttl=0.05)
+        store.put('task-2', b'x' * 10, ttl=60)
+        expected = store.metrics().bytes
+        store.put('task-1', b'x' * 100)
+        time.sleep(0.1)
+        store.put('task-2', b'x' * 10, ttl=60)
+        
+        assert (store.metrics().entries, store.metrics().bytes) == (1, expected)
+        assert store.metrics().expirations == 1
+        
+    def test_incomplete_store_cannot_be_created(self):
+        class Get_Only_Store(ResultStore):
+            def get(self, key, default=None): return default
+        
+        with pytest.raises(TypeError):
+            Get_Only_Store()
+
+
+class TestSQLiteResultStore:
+    def test_results_survive_restart(self, tmp_path):
+        path = str(tmp_path / 'results.sqlite3')
+        SQLiteResultStore(path).put('task-1', {'result': 'kept'})
+        
+        assert SQLiteResultStore(path).get('task-1') == {'result': 'kept'}
+        
+    def test_totals_survive_restart(self, tmp_path):
+        path = str(tmp_path / 'results.sqlite3')
+        store = SQLiteResultStore(path)
+        store.put('task-1', b'x' * 100)
+        
+        assert SQLiteResultStore(path).metrics() == store.metrics()
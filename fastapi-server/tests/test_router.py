@@ -0,0 +1,59 @@
+import json
+import logging
+
+import msgpack
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from fastapi_server.routers import router
+from fastapi_server.services.task_processor import JobProcessor
+
+log = logging.getLogger(__name__)
+
+
+class Result_Message:
+    def __init__(self, task_id: str, body: bytes, content_type: str):
+        self.headers = {'task_type': 'KEYWORD_EXTRACTION', 'task_id': task_id}
+        self.body = body
+        self.content_type = content_type
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(router.router)
+    JobProcessor.completed_jobs.clear()
+    yield TestClient(app)
+    JobProcessor.completed_jobs.clear()
+
+
+class TestResultEncoding:
+    def test_json_result_is_passed_through(self, client):
+        JobProcessor.handle_new_result(Result_Message('task-1', b'{"keyword_nodes":[{"name":"word","score":0.5}]}', 'application/json'))
+        
+        response = client.get('/api/check_task_result', params={'task_id': 'task-1', 'timeout': 0})
+        
+        assert response.json() == {'task_id': 'task-1', 'result': {'keyword_nodes': [{'name': 'word', 'score': 0.5}]}}
+        
+    def test_msgpack_result_is_decoded_for_json_clients(self, client):
+        JobProcessor.handle_new_result(Result_Message('task-1', msgpack.packb({'clusters': [[0, 1]]}), 'application/msgpack'))
+        
+        response = client.get('/api/check_task_result', params={'task_id': 'task-1', 'timeout': 0})
+        
+        assert response.headers['content-type'] == 'application/json'
+        assert response.json() == {'task_id': 'task-1', 'result': {'clusters': [[0, 1]]}}
+        
+    def test_msgpack_result_is_passed_through_to_clients_that_accept_it(self, client):
+        body = msgpack.packb({'clusters': [[0, 1]]})
+        JobProcessor.handle_new_result(Result_Message('task-1', body, 'application/msgpack'))
+        
+        response = client.get('/api/check_task_result', params={'task_id': 'task-1', 'timeout': 0},
+                              headers={'accept': 'application/msgpack, application/json;q=0.5'})
+        
+        assert response.content == body
+        assert response.headers['x-task-id'] == 'task-1'
+        
+    def test_unknown_content_type_is_rejected(self):
+        with pytest.raises(ValueError):
+            JobProcessor.handle_new_result(Result_Message('task-1', b'\x80\x04', 'application/x-python-pickle'))
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+import threading
+
+import pytest
+
+from fastapi_server.entities.POST_bodies import Sentence_Extraction_Request, Text_Transcribe_Request
+from fastapi_server.services.result_store import SQLiteResultStore
+from fastapi_server.services.task_processor import (
+    JobProcessor,
+    JobSpecification,
+    TaskType,
+    job_queue_name,
+)
+
+log = logging.getLogger(__name__)
+
+
+class Result_Message:
+    """the parts of an aio_pika incoming message that JobProcessor.handle_new_result reads"""
+    def __init__(self, task_id: str, data, task_type: TaskType = TaskType.SENTENCE_EXTRACTION):
+        self.headers = {'task_type': task_type.value, 'task_id': task_id}
+        self.body = json.dumps(data).encode()
+        self.content_type = 'application/json'
+
+
+@pytest.fixture(autouse=True)
+def clear_job_processor():
+    JobProcessor.completed_jobs.clear()
+    JobProcessor.result_waiters.clear()
+    yield
+    JobProcessor.completed_jobs.clear()
+    JobProcessor.result_waiters.clear()
+
+
+class TestResultWaiters:
+    def test_waiter_is_woken_by_new_result(self):
+        async def wait_then_deliver():
+            waiting = asyncio.ensure_future(JobProcessor.wait_for_result('task-1', timeout=5))
+            await asyncio.sleep(0)
+            JobProcessor.handle_new_result(Result_Message('task-1', ['result']))
+            return await waiting
+        
+        job = asyncio.run(wait_then_deliver())
+        
+        assert job.decoded_data() == ['result']
+        assert JobProcessor.result_waiters == {}
+        
+    def test_completed_result_is_returned_immediately(self):
+        JobProcessor.handle_new_result(Result_Message('task-1', ['result']))
+        
+        job = asyncio.run(JobProcessor.wait_for_result('task-1', timeout=0))
+        
+        assert job.decoded_data() == ['result']
+        
+    def test_result_without_content_type_is_json(self):
+        message = Result_Message('task-1', ['result'])
+        message.content_type = None
+        JobProcessor.handle_new_result(message)
+        
+        job = asyncio.run(JobProcessor.wait_for_result('task-1', timeout=0))
+        
+        assert job.content_type == 'application/json'
+        assert job.decoded_data() == ['result']
+        
+    def test_blocking_store_is_read_off_the_event_loop(self, tmp_path, monkeypatch):
+        reads = []
+        class Recording_Store(SQLiteResultStore):
+            def get(self, key, default=None):
+                reads.append(threading.get_ident())
+                return super().get(key, default)
+        monkeypatch.setattr(JobProcessor, 'completed_jobs', Recording_Store(str(tmp_path / 'results.sqlite3')))
+        JobProcessor.handle_new_result(Result_Message('task-1', ['result']))
+        
+        job = asyncio.run(JobProcessor.wait_for_result('task-1', timeout=0))
+        
+        assert job.decoded_data() == ['result']
+        assert reads and threading.get_ident() not in reads
+        
+    def test_timeout(self):
+        job = asyncio.run(JobProcessor.wait_for_result('task-1', timeout=0.01))
+        
+        assert job is None
+        assert JobProcessor.result_waiters == {}
+        
+    def test_iterate_results_in_completion_order(self):
+        async def collect():
+            async def deliver():
+                await asyncio.sleep(0.01)
+                JobProcessor.handle_new_result(Result_Message('task-2', 2))
+                await asyncio.sleep(0.01)
+                JobProcessor.handle_new_result(Result_Message('task-1', 1))
+            
+            delivering = asyncio.ensure_future(deliver())
+            results = [job.task_id async for job in JobProcessor.iterate_results(['task-1', 'task-2', 'task-3'], timeout=0.5)]
+            await delivering
+            return results
+        
+        assert asyncio.run(collect()) == ['task-2', 'task-1']
+
+
+class Recording_Job_Queue:
+    def __init__(self):
+        self.declared  = []
+        self.published = []
+        self.headers   = []
+        
+    async def declare_queue(self, queue_name):
+        self.declared.append(queue_name)
+        
+    async def publish(self, queue_name, message, headers=None):
+        self.published.append((queue_name, headers['task_type']))
+        self.headers.append(headers)
+
+
+class TestJobRouting:
+    @pytest.fixture
+    def job_queue(self, monkeypatch):
+        job_queue = Recording_Job_Queue()
+        monkeypatch.setattr(JobProcessor, 'job_queue_provider', job_queue)
+        monkeypatch.setattr(JobProcessor, 'declared_job_queues', set())
+        return job_queue
+    
+    def test_jobs_go_to_the_queue_of_their_task_type(self, job_queue):
+        jobs = [JobSpecification(TaskType.KEYWORD_EXTRACTION, 'some text'),
+                JobSpecification(TaskType.IMAGE_TRANSCRIPTION, b'image'),
+                JobSpecification(TaskType.KEYWORD_EXTRACTION, 'more text')]
+        
+        for job in jobs: assert asyncio.run(JobProcessor.publish_new_job(job))
+        
+        assert job_queue.published == [('job_queue.KEYWORD_EXTRACTION', 'KEYWORD_EXTRACTION'),
+                                       ('job_queue.IMAGE_TRANSCRIPTION', 'IMAGE_TRANSCRIPTION'),
+                                       ('job_queue.KEYWORD_EXTRACTION', 'KEYWORD_EXTRACTION')]
+        assert job_queue.declared == ['job_queue.KEYWORD_EXTRACTION', 'job_queue.IMAGE_TRANSCRIPTION']
+        
+    def test_single_queue_routing(self):
+        assert job_queue_name(TaskType.IMAGE_TRANSCRIPTION.value, 'single') == 'job_queue'
+        with pytest.raises(ValueError):
+            job_queue_name(TaskType.IMAGE_TRANSCRIPTION.value, 'topic')
+            
+    def test_ranking_parameters_are_sent_to_the_worker(self, job_queue):
+        keyword_job = asyncio.run(JobProcessor.create_keyword_extraction_job(Text_Transcribe_Request(text='some text', seed_keywords=['text'])))
+        sentence_job = asyncio.run(JobProcessor.create_sentence_extraction_job(Sentence_Extraction_Request(text='some text', queries=['a', 'b'])))
+        plain_job = asyncio.run(JobProcessor.create_keyword_extraction_job(Text_Transcribe_Request(text='some text')))
+        asyncio.run(JobProcessor.create_keyword_extraction_job(Text_Transcribe_Request(text='some text', document_id='doc-1')))
+        asyncio.run(JobProcessor.create_sentence_extraction_job(Sentence_Extraction_Request(text='some text', direction='backward')))
+        
+        assert [i['other_info'] for i in job_queue.headers] == [{'seed_keywords': ['text']}, {'queries': ['a', 'b']}, {}, {'document_id': 'doc-1'},
+                                                                {'direction': 'backward'}]
+        assert plain_job.cache_key != keyword_job.cache_key # the same text with other parameters is a different request
+        
+    @pytest.mark.parametrize('request_type, options', [
+        (Sentence_Extraction_Request, {'queries': ['a']}),
+        (Sentence_Extraction_Request, {'direction': 'forward'}),
+        (Text_Transcribe_Request,     {'direction': 'backward'}),
+    ])
+    def test_options_incremental_ranking_can_not_honour_are_rejected(self, request_type, options):
+        with pytest.raises(ValueError):
+            request_type(text='some text', document_id='doc-1', **options)
+        request_type(text='some text', **options)
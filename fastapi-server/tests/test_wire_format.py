@@ -0,0 +1,68 @@
+import importlib
+import logging
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from fastapi_server.services import codecs, result_cache
+
+log = logging.getLogger(__name__)
+
+# the worker and the api server are built from their own directories, so each keeps its own copy of the codecs and of the cache key.
+# these tests load the worker copy from the repository and check that both sides agree on every byte
+CLOUD_WORKER_PATH = Path(__file__).resolve().parents[2] / 'cloud-worker'
+if not (CLOUD_WORKER_PATH / 'cloud_worker').is_dir():
+    pytest.skip('the cloud-worker tree is not next to fastapi-server', allow_module_level=True)
+
+
+@pytest.fixture(scope='module')
+def worker():
+    sys.path.insert(0, str(CLOUD_WORKER_PATH))
+    try:
+        yield (importlib.import_module('cloud_worker.services.codecs'), importlib.import_module('cloud_worker.services.result_cache'))
+    finally:
+        sys.path.remove(str(CLOUD_WORKER_PATH))
+
+
+RESULTS = [
+    {'keyword_nodes': [{'id': 0, 'name': 'compatibility', 'connected': [1, 2], 'score': 0.25},
+                       {'id': 1, 'name': 'systems',       'connected': [0],    'score': np.float64(0.125)}],
+     'keyphrase_and_scores': [['linear constraints', 0.5], ['systems', 0.125]]},
+    {'keyword_extraction_result': [{'id': 0, 'name': 'first sentence', 'connected': [], 'score': 1.0}], 'clusters': [{2, 0}, {1}]},
+    {'sentences': [], 'incremental': {'warm_started': True, 'iterations': 3}},
+    'a caption, a label',
+    {'error': 'task produced no result'},
+]
+
+REQUESTS = [
+    ('KEYWORD_EXTRACTION',  'Café menus\r\n', None),
+    ('KEYWORD_EXTRACTION',  'some text',            {'seed_keywords': ['menu', 'cafe'], 'document_id': 'doc-1'}),
+    ('SENTENCE_EXTRACTION', 'some text',            {'queries': ['price'], 'direction': 'forward'}),
+    ('IMAGE_TRANSCRIPTION', b'\x89PNG\r\n\x1a\n',    {'codec': 'png'}),
+]
+
+
+class TestWireFormat:
+    def test_same_codecs(self, worker):
+        worker_codecs, _ = worker
+
+        assert worker_codecs.RESULT_SCHEMA_VERSION == codecs.RESULT_SCHEMA_VERSION
+        assert list(worker_codecs.RESULT_CODECS) == list(codecs.RESULT_CODECS)
+
+    @pytest.mark.parametrize('content_type', list(codecs.RESULT_CODECS))
+    @pytest.mark.parametrize('result', RESULTS)
+    def test_results_encode_identically(self, worker, content_type, result):
+        worker_codecs, _ = worker
+        encoded = worker_codecs.get_codec(content_type).encode(result)
+
+        assert encoded == codecs.get_codec(content_type).encode(result)
+        assert codecs.get_codec(content_type).decode(encoded) == worker_codecs.get_codec(content_type).decode(encoded)
+
+    @pytest.mark.parametrize('task_type, payload, parameters', REQUESTS)
+    def test_requests_key_identically(self, worker, task_type, payload, parameters):
+        _, worker_result_cache = worker
+
+        assert worker_result_cache.normalize_payload(payload) == result_cache.normalize_payload(payload)
+        assert worker_result_cache.request_cache_key(task_type, payload, parameters) == result_cache.request_cache_key(task_type, payload, parameters)
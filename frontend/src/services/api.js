@@ -107,8 +107,8 @@ export class HttpService {
                 headers: { 'Content-Type': 'application/json', },
             });
 
-        if (response.status === 502) {
-            //connection timeout error - we are doing long-polling, so just make the request again
+        if (response.status === 502 || response.status === 202) {
+            //connection timeout error or the task is still pending - we are doing long-polling, so just make the request again
             return await this.get_job_result__long_poll(task_id);
 
         }